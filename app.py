@@ -1,14 +1,24 @@
 import streamlit as st
-import json
-import re
-import base64
-import io
 import os
+import time
+import codecs
+import textwrap
+import uuid
 from datetime import datetime
-import boto3
 from typing import Dict, Any, Optional
 import logging
 from dotenv import load_dotenv
+from cet_schema import SCHEMA, error_message
+from cet_flow_store import create_flow_store, merge_flow
+from cet_stream import RenderScheduler
+from cet_history import (RENDER_CACHE, ensure_ids, fragment_decorator, load_older, new_message,
+                         reset_window, visible)
+from cet_session_memory import SessionMemoryManager
+from cet_trace import TRACE_ENABLED, TraceStore, TurnTrace, summary_line
+from cet_return_control import RETURN_CONTROL_ENABLED, LocalActionRunner, invoke_with_return_control
+
+# reruns parciais do chat (st.fragment); nas versões antigas do Streamlit vira rerun completo
+fragment = fragment_decorator(st)
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -18,9 +28,17 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # Configuração do Bedrock
-BEDROCK_AGENT_ID = os.getenv('BEDROCK_AGENT_ID')
-BEDROCK_AGENT_ALIAS_ID = os.getenv('BEDROCK_AGENT_ALIAS_ID')
+# BEDROCK_FAKE=1 usa o fake local (fake_bedrock.py) em vez do serviço: sem rede/AWS
+USE_FAKE_AGENT = os.getenv('BEDROCK_FAKE', '').lower() in ('1', 'true', 'yes')
+BEDROCK_AGENT_ID = os.getenv('BEDROCK_AGENT_ID') or ('FAKE' if USE_FAKE_AGENT else None)
+BEDROCK_AGENT_ALIAS_ID = os.getenv('BEDROCK_AGENT_ALIAS_ID') or ('FAKE' if USE_FAKE_AGENT else None)
 AWS_REGION = os.getenv('AWS_REGION', 'sa-east-1')
+# pool do cliente compartilhado: uma conexão por sessão chamando o agente ao mesmo tempo
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', '50'))
+BEDROCK_READ_TIMEOUT = int(os.getenv('AWS_READ_TIMEOUT', '300'))
+BEDROCK_CONNECT_TIMEOUT = int(os.getenv('AWS_CONNECT_TIMEOUT', '20'))
+# quantos turnos de métricas de streaming guardar na sessão
+TURN_METRICS_KEEP = int(os.getenv('TURN_METRICS_KEEP', '20'))
 
 # Configuração da página
 st.set_page_config(
@@ -248,88 +266,68 @@ if 'quick_actions' not in st.session_state:
 # Classe para gerenciar o backend (adaptada do lambda)
 class CETBackend:
     def __init__(self):
-        self.cpf_re = re.compile(r"^\d{11}$")
-        self.date_re = re.compile(r"^\d{2}/\d{2}/\d{4}$")
-    
-    def _require(self, payload, field, pattern: re.Pattern = None, fmt_desc: str = ""):
-        v = payload.get(field)
-        if v is None or (isinstance(v, str) and not v.strip()):
-            raise ValueError(f'O campo "{field}" é obrigatório')
-        if pattern and isinstance(v, str) and not pattern.match(v):
-            raise ValueError(f'Campo "{field}" inválido. {fmt_desc}'.strip())
-        return v
-    
-    def _validate_confirmar(self, payload):
-        self._require(payload, "cpf", self.cpf_re, "Use 11 dígitos numéricos")
-        self._require(payload, "nome_condutor")
-        self._require(payload, "data_nascimento", self.date_re, "Formato DD/MM/AAAA")
-        self._require(payload, "nome_mae")
-    
-    def _validate_emitir_guia(self, payload):
-        if not payload.get("flow_id"):
-            self._require(payload, "cpf", self.cpf_re, "Use 11 dígitos numéricos")
-            self._require(payload, "nome_condutor")
-            self._require(payload, "data_nascimento", self.date_re, "Formato DD/MM/AAAA")
-            self._require(payload, "nome_mae")
-            self._require(payload, "codigo_taxa")
-            self._require(payload, "codigo_servico")
-            self._require(payload, "numero_cnh")
-        self._require(payload, "codigo_municipio_condutor")
-        self._require(payload, "ddd_celular")
-        self._require(payload, "numero_celular")
-        self._require(payload, "email")
-        self._require(payload, "numero_ip_micro")
-    
-    def _validate_exibir_dados(self, payload):
-        self._require(payload, "cpf", self.cpf_re, "Use 11 dígitos numéricos")
-        self._require(payload, "data_nascimento", self.date_re, "Formato DD/MM/AAAA")
+        # regras compiladas do action_group_api_schema.yml (mesmas da Lambda)
+        self.schema = SCHEMA
+        # fluxo de 2ª via (flow_id -> registro confirmado), como FLOWS na Lambda
+        self.flows = create_flow_store()
+    
+    def _validate(self, operation: str, payload: dict, has_flow: bool = False):
+        """Normaliza e valida; retorna (payload, erro) com todas as pendências na mensagem."""
+        data, errors = self.schema.parse(operation, payload, has_flow)
+        if errors:
+            return data, {"error": error_message(errors), "errors": errors, "status": 422}
+        return data, None
     
     def confirmar_dados(self, payload: dict):
-        try:
-            self._validate_confirmar(payload)
-        except ValueError as e:
-            return {"error": str(e), "status": 422}
+        payload, error = self._validate("confirmar-dados", payload)
+        if error:
+            return error
         
         cpf = payload.get("cpf")
-        return {
-            "status": 200,
-            "data": {
-                "flow_id": "0a84e30c-3c9c-4f1c-9a5c-5d9a3b2d7f1a",
-                "retornoNSDGXS02": {
-                    "codigo_retorno": 0,
-                    "mensagem_retorno": "OK",
-                    "cpf": cpf,
-                    "numero_cnh": "12345678900",
-                    "numero_pgu": "99887766",
-                    "numero_identidade": "MG1234567",
-                    "orgao_expedidor_identidade": "SSP",
-                    "uf_identidade": "MG",
-                    "endereco_condutor": "Av. Afonso Pena",
-                    "numero_endereco_condutor": "1000",
-                    "complemento_endereco_condutor": "Sala 101",
-                    "bairro_endereco_condutor": "Centro",
-                    "codigo_municipio_condutor": 4123,
-                    "nome_municipio_condutor": "BELO HORIZONTE",
-                    "sigla_uf_municipio_condutor": "MG",
-                    "numero_cep_endereco_condutor": "30130008",
-                    "data_primeira_habilitacao": "2010-06-15",
-                    "data_validade_exame": "2027-05-23",
-                    "codigo_servico": 123,
-                    "codigo_taxa": 25,
-                    "flag_escolhe_entrega": 1,
-                    "flag_tipo_autorizacao": "CNH",
-                    "ddd_celular": 31,
-                    "numero_celular": 999999999,
-                    "email": "condutor@example.com"
-                }
-            }
+        s02 = {
+            "codigo_retorno": 0,
+            "mensagem_retorno": "OK",
+            "cpf": cpf,
+            "numero_cnh": "12345678900",
+            "numero_pgu": "99887766",
+            "numero_identidade": "MG1234567",
+            "orgao_expedidor_identidade": "SSP",
+            "uf_identidade": "MG",
+            "endereco_condutor": "Av. Afonso Pena",
+            "numero_endereco_condutor": "1000",
+            "complemento_endereco_condutor": "Sala 101",
+            "bairro_endereco_condutor": "Centro",
+            "codigo_municipio_condutor": 4123,
+            "nome_municipio_condutor": "BELO HORIZONTE",
+            "sigla_uf_municipio_condutor": "MG",
+            "numero_cep_endereco_condutor": "30130008",
+            "data_primeira_habilitacao": "2010-06-15",
+            "data_validade_exame": "2027-05-23",
+            "codigo_servico": 123,
+            "codigo_taxa": 25,
+            "flag_escolhe_entrega": 1,
+            "flag_tipo_autorizacao": "CNH",
+            "ddd_celular": 31,
+            "numero_celular": 999999999,
+            "email": "condutor@example.com"
         }
+        flow_id = self.flows.create({
+            "retornoNSDGXS02": s02,
+            "nome_condutor": payload.get("nome_condutor"),
+            "data_nascimento": payload.get("data_nascimento"),
+            "nome_mae": payload.get("nome_mae"),
+        })
+        return {"status": 200, "data": {"flow_id": flow_id, "retornoNSDGXS02": s02}}
     
     def exibir_opcoes_pagamento(self, payload: dict):
-        try:
-            self._validate_emitir_guia(payload)
-        except ValueError as e:
-            return {"error": str(e), "status": 422}
+        # como na Lambda: flow_id conhecido completa o payload com o fluxo confirmado;
+        # desconhecido (expirado) valida os campos enviados com x-required-without-flow
+        flow = self.flows.get(payload.get("flow_id"))
+        if flow is not None:
+            payload = merge_flow(flow, payload)
+        payload, error = self._validate("exibir-opcoes-pagamento", payload, has_flow=flow is not None)
+        if error:
+            return error
         
         cpf = payload.get("cpf", "00000000000")
         return {
@@ -380,10 +378,9 @@ class CETBackend:
         }
     
     def exibir_dados(self, payload: dict):
-        try:
-            self._validate_exibir_dados(payload)
-        except ValueError as e:
-            return {"error": str(e), "status": 422}
+        payload, error = self._validate("exibir-dados", payload)
+        if error:
+            return error
         
         cpf = payload.get("cpf")
         return {
@@ -421,84 +418,151 @@ class CETBackend:
             }
         }
 
+# =========================
+# Recursos compartilhados pelo processo (uma instância para todas as sessões)
+# =========================
+@st.cache_resource(show_spinner=False)
+def get_bedrock_client():
+    """
+    Cliente bedrock-agent-runtime único do processo (clientes boto3 são
+    thread-safe). O pool HTTP do botocore é dimensionado para as sessões
+    simultâneas em vez de um cliente com pool próprio por sessão.
+    """
+    if USE_FAKE_AGENT:
+        from fake_bedrock import FakeAgentRuntimeClient
+        return FakeAgentRuntimeClient.from_env()
+    import boto3  # import pesado (~150ms): só quando o agente real é usado
+    from botocore.config import Config
+    cfg = Config(
+        max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+        read_timeout=BEDROCK_READ_TIMEOUT,
+        connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+        tcp_keepalive=True,
+        retries={"max_attempts": 4, "mode": "standard"},
+    )
+    # exceção não fica em cache: a próxima chamada tenta de novo
+    return boto3.client('bedrock-agent-runtime', region_name=AWS_REGION, config=cfg)
+
+@st.cache_resource(show_spinner=False)
+def get_system_prompt() -> str:
+    try:
+        with open('system_prompt_agent.txt', 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return """
+        Você é um assistente de emissão e consulta de segunda via de CNH do CET - Minas Gerais.
+        Responda sempre em português do Brasil com tom claro e profissional.
+        """
+
+@st.cache_resource(show_spinner=False)
+def get_backend() -> "CETBackend":
+    # compartilhado pelo processo: além das regras do schema, só o flow store (TTL e
+    # limite de entradas, como FLOWS na Lambda); o resto do fluxo fica em st.session_state
+    return CETBackend()
+
 # Classe para chamadas reais do Bedrock Agent
 class BedrockAgent:
-    def __init__(self):
-        self.backend = CETBackend()
-        self.system_prompt = self._load_system_prompt()
-        self.bedrock_client = self._init_bedrock_client()
-    
-    def _init_bedrock_client(self):
-        """Inicializa o cliente Bedrock"""
+    """
+    Sem estado por sessão: só referencia os recursos compartilhados e lê o
+    que é da sessão (session_id, user_data) de st.session_state. Uma
+    instância serve o processo todo (get_agent).
+    """
+    __slots__ = ("backend", "system_prompt")
+
+    def __init__(self, backend=None, system_prompt=None):
+        self.backend = backend or get_backend()
+        self.system_prompt = system_prompt or get_system_prompt()
+
+    @property
+    def bedrock_client(self):
         try:
-            return boto3.client(
-                'bedrock-agent-runtime',
-                region_name=AWS_REGION
-            )
+            return get_bedrock_client()
         except Exception as e:
             logger.error(f"Erro ao inicializar cliente Bedrock: {e}")
             return None
     
-    def _load_system_prompt(self):
-        try:
-            with open('system_prompt_agent.txt', 'r', encoding='utf-8') as f:
-                return f.read()
-        except FileNotFoundError:
-            return """
-            Você é um assistente de emissão e consulta de segunda via de CNH do CET - Minas Gerais.
-            Responda sempre em português do Brasil com tom claro e profissional.
-            """
-    
     def process_message(self, user_message: str) -> str:
-        """Processa a mensagem do usuário usando Bedrock Agent real"""
-        if not self.bedrock_client:
-            return "❌ Erro: Cliente Bedrock não inicializado. Verifique as configurações."
+        """Processa a mensagem do usuário usando Bedrock Agent real (resposta inteira)"""
+        return "".join(self.stream_message(user_message))
+    
+    def stream_message(self, user_message: str, metrics: dict = None):
+        """
+        Gera os trechos de texto da resposta à medida que o Agent os envia.
+        Se `metrics` for passado, preenche ttfc_ms (1º trecho), ttlc_ms
+        (último trecho), bytes e chunks, medidos a partir do invoke_agent.
+        Com AGENT_TRACE ligado, os traces do turno viram spans no TraceStore
+        e o resumo (model_ms, action_ms, ui_ms, steps) também vai em `metrics`.
+        """
+        client = self.bedrock_client
+        if not client:
+            yield "❌ Erro: Cliente Bedrock não inicializado. Verifique as configurações."
+            return
         
         if not BEDROCK_AGENT_ID or not BEDROCK_AGENT_ALIAS_ID:
-            return "❌ Erro: IDs do Bedrock Agent não configurados. Verifique o arquivo .env."
+            yield "❌ Erro: IDs do Bedrock Agent não configurados. Verifique o arquivo .env."
+            return
         
+        metrics = metrics if metrics is not None else {}
+        metrics.update({"ttfc_ms": None, "ttlc_ms": None, "bytes": 0, "chunks": 0})
+        started = time.perf_counter()
+        session_id = st.session_state.get('session_id', 'default-session')
+        turn = TurnTrace(session_id, user_message) if TRACE_ENABLED else None
+        error = None
+        # um caractere UTF-8 pode vir partido entre dois chunks
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
         try:
             # Chamada real para o Bedrock Agent
-            response = self.bedrock_client.invoke_agent(
+            # com AGENT_RETURN_CONTROL as ações voltam para o app e rodam no backend local
+            events = invoke_with_return_control(
+                client,
+                get_action_runner() if RETURN_CONTROL_ENABLED else None,
+                st.session_state.setdefault('agent_session_attrs', {}),
+                turn,
                 agentId=BEDROCK_AGENT_ID,
                 agentAliasId=BEDROCK_AGENT_ALIAS_ID,
-                sessionId=st.session_state.get('session_id', 'default-session'),
-                inputText=user_message
+                sessionId=session_id,
+                inputText=user_message,
+                enableTrace=TRACE_ENABLED,
             )
-            
-            # Processar resposta do Bedrock
-            return self._process_bedrock_response(response)
+            for event in events:
+                if turn and 'trace' in event:
+                    turn.add(event['trace'])
+                    continue
+                chunk = event.get('chunk')
+                if not chunk or 'bytes' not in chunk:
+                    continue  # outros eventos não viram texto
+                if turn:
+                    turn.chunk()
+                data = chunk['bytes']
+                elapsed = (time.perf_counter() - started) * 1000.0
+                if metrics["ttfc_ms"] is None:
+                    metrics["ttfc_ms"] = round(elapsed, 1)
+                metrics["ttlc_ms"] = round(elapsed, 1)
+                metrics["bytes"] += len(data)
+                metrics["chunks"] += 1
+                text = decoder.decode(data)
+                if text:
+                    paused = time.perf_counter()
+                    yield text
+                    if turn:
+                        # tempo parado no yield = desenho da UI
+                        turn.ui((time.perf_counter() - paused) * 1000.0)
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            if not metrics["chunks"]:
+                yield "❌ Não foi possível processar a resposta do Bedrock Agent."
             
         except Exception as e:
+            error = str(e)
             logger.error(f"Erro ao chamar Bedrock Agent: {e}")
-            return f"❌ Erro ao processar mensagem: {str(e)}"
-    
-    def _process_bedrock_response(self, response) -> str:
-        """Processa a resposta do Bedrock Agent"""
-        try:
-            # Ler a resposta do Bedrock
-            for event in response['completion']:
-                if 'chunk' in event:
-                    chunk = event['chunk']
-                    if 'bytes' in chunk:
-                        # Decodificar bytes para texto
-                        text = chunk['bytes'].decode('utf-8')
-                        return text
-                elif 'trace' in event:
-                    # Processar traces se necessário
-                    trace = event['trace']
-                    if 'trace' in trace and 'trace' in trace['trace']:
-                        # Processar trace específico
-                        pass
-            
-            return "❌ Não foi possível processar a resposta do Bedrock Agent."
-            
-        except Exception as e:
-            logger.error(f"Erro ao processar resposta do Bedrock: {e}")
-            return f"❌ Erro ao processar resposta: {str(e)}"
-    
-    
-    
+            yield f"❌ Erro ao processar mensagem: {str(e)}"
+        finally:
+            if turn:
+                record = turn.finish(error)
+                get_trace_store().add(record)
+                for key in ("model_ms", "action_ms", "ui_ms", "other_ms", "steps"):
+                    metrics[key] = record[key]
     
     def _handle_general_request(self, message: str) -> str:
         # O agente já sabe tudo pelo system prompt - processar a mensagem
@@ -595,87 +659,175 @@ Obrigado por usar nossos serviços! 🚗"""
         else:
             return f"❌ Erro ao gerar guia: {result.get('error', 'Erro desconhecido')}"
 
+@st.cache_resource(show_spinner=False)
+def get_agent() -> BedrockAgent:
+    return BedrockAgent()
+
+@st.cache_resource(show_spinner=False)
+def get_action_runner() -> LocalActionRunner:
+    """Backend do Action Group no processo, para as ações do return of control."""
+    return LocalActionRunner()
+
+@st.cache_resource(show_spinner=False)
+def get_trace_store() -> TraceStore:
+    # spans por turno de todas as sessões (AGENT_TRACE / AGENT_TRACE_EXPORT)
+    return TraceStore()
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory() -> SessionMemoryManager:
+    # limite de histórico, compactação e orçamento de memória de todas as sessões do processo
+    return SessionMemoryManager()
+
+def _track_session():
+    get_session_memory().track(st.session_state.session_id, st.session_state.messages,
+                               st.session_state.user_data)
+
+def _message_html(role: str, content: str) -> str:
+    if role == "user":
+        message_class = "user-message"
+    elif "✅" in content:
+        message_class = "success-message"
+    elif "❌" in content:
+        message_class = "error-message"
+    else:
+        message_class = "assistant-message"
+    return f"""
+    <div class="{message_class}">
+        {content}
+    </div>
+    """
+
+def _respond(agent: BedrockAgent, user_message: str, area):
+    """
+    Mostra a mensagem do usuário e desenha a resposta do agente enquanto ela
+    chega, via RenderScheduler (redesenho por intervalo/volume, não por chunk).
+    As métricas do turno ficam em st.session_state.turn_metrics.
+    """
+    st.session_state.messages.append(new_message("user", user_message))
+    area.markdown(_message_html("user", user_message), unsafe_allow_html=True)
+    placeholder = area.empty()
+    placeholder.markdown(_message_html("assistant", "Assistente está digitando..."), unsafe_allow_html=True)
+
+    metrics = {}
+    scheduler = RenderScheduler(
+        lambda text: placeholder.markdown(_message_html("assistant", text), unsafe_allow_html=True),
+        cursor=" ▌",
+    )
+    with scheduler:
+        for part in agent.stream_message(user_message, metrics):
+            scheduler.push(part)
+    response = scheduler.text
+    metrics["renders"] = scheduler.stats["renders"]
+
+    st.session_state.messages.append(new_message("assistant", response))
+    history = st.session_state.setdefault("turn_metrics", [])
+    history.append(metrics)
+    del history[:-TURN_METRICS_KEEP]
+    logger.info("turno: %s", metrics)
+
+def _bubble(message: dict) -> str:
+    # já limpo como o st.markdown faria com a bolha sozinha, para poder juntar várias num bloco só
+    return textwrap.dedent(_message_html(message["role"], message["content"])).strip()
+
+def _queue_prompt(text: str):
+    st.session_state.pending_prompt = text
+
+def _submit_input():
+    text = (st.session_state.get("user_input") or "").strip()
+    # limpa o campo; senão o texto continua lá e é reenviado no próximo rerun
+    st.session_state.user_input = ""
+    if text:
+        _queue_prompt(text)
+
+def _clear_chat():
+    st.session_state.messages = []
+    st.session_state.user_data = {}
+    st.session_state.turn_metrics = []
+    reset_window(st.session_state)
+    _track_session()
+
+@fragment
+def _chat_area(agent: BedrockAgent):
+    """
+    Área do chat como fragmento: enviar mensagem, limpar ou carregar
+    anteriores reexecuta só esta função, sem o CSS e a coluna lateral.
+    Só as últimas HISTORY_WINDOW mensagens são desenhadas, num único bloco
+    de markdown montado com o HTML de cada bolha em cache (RENDER_CACHE).
+    """
+    messages = ensure_ids(st.session_state.messages)
+    # Adicionar mensagem de boas-vindas se não houver mensagens
+    if not messages:
+        messages.append(new_message("assistant", agent.get_welcome_message()))
+    
+    hidden, window = visible(messages, st.session_state)
+    if hidden:
+        st.button(f"⬆️ Carregar mensagens anteriores ({hidden})", key="load_older",
+                  on_click=load_older, args=(st.session_state,))
+    st.markdown("\n\n".join(RENDER_CACHE.get(m, _bubble) for m in window), unsafe_allow_html=True)
+    
+    # Área onde a resposta em andamento é desenhada (logo abaixo do histórico)
+    live = st.container()
+    
+    # Input area - sem container branco
+    col_input, col_clear = st.columns([5, 1])
+    with col_input:
+        st.text_input(
+            "Digite sua mensagem:", 
+            key="user_input", 
+            placeholder="Ex: Preciso emitir a segunda via da minha CNH",
+            label_visibility="collapsed",
+            on_change=_submit_input,
+        )
+    with col_clear:
+        st.button("🗑️", help="Limpar chat", key="clear_btn", on_click=_clear_chat)
+    
+    # Mensagem enviada pelo campo (Enter) ou por um atalho rápido
+    prompt = st.session_state.pop("pending_prompt", None)
+    if prompt:
+        _respond(agent, prompt, live)
+        _track_session()
+    
+    # Latência percebida do último turno
+    turn_metrics = st.session_state.get('turn_metrics')
+    if turn_metrics and turn_metrics[-1].get("ttfc_ms") is not None:
+        last = turn_metrics[-1]
+        st.caption(
+            f"⏱️ 1º trecho em {last['ttfc_ms']:.0f} ms · último em {last['ttlc_ms']:.0f} ms · "
+            f"{last['bytes']} bytes em {last['chunks']} trechos"
+        )
+    traced = get_trace_store().last(st.session_state.session_id) if TRACE_ENABLED else None
+    if traced:
+        st.caption(summary_line(traced))
+        st.download_button("⬇️ Traces desta sessão (JSONL)",
+                           get_trace_store().to_jsonl(st.session_state.session_id),
+                           file_name=f"traces-{st.session_state.session_id}.jsonl",
+                           mime="application/x-ndjson", key="download_traces")
+
 # Interface principal
 def main():
     # Título principal
     st.title("🚗 CET-MG - Assistente Virtual")
     st.markdown("---")
     
-    # Inicializar o agente
-    if 'agent' not in st.session_state:
-        st.session_state.agent = BedrockAgent()
+    # Agente compartilhado pelo processo; a sessão guarda só o próprio estado
+    agent = get_agent()
     
     # Inicializar session_id se não existir
     if 'session_id' not in st.session_state:
-        st.session_state.session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # sufixo aleatório: duas abas abertas no mesmo segundo não dividem sessão do agente nem memória
+        st.session_state.session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
     
-    # Adicionar mensagem de boas-vindas se não houver mensagens
-    if not st.session_state.messages:
-        st.session_state.messages.append({
-            "role": "assistant", 
-            "content": st.session_state.agent.get_welcome_message()
-        })
+    # Sessão ociosa descartada pelo orçamento de memória: esvazia o próprio histórico e recomeça
+    memory = get_session_memory()
+    if memory.pop_evicted(st.session_state.session_id, st.session_state.messages, st.session_state.user_data):
+        st.info("Sua sessão ficou inativa e o histórico anterior foi descartado.")
+    _track_session()
     
     # Layout principal
     col1, col2 = st.columns([3, 1])
     
     with col1:
-        # Exibir histórico de mensagens
-        for message in st.session_state.messages:
-            if message["role"] == "user":
-                st.markdown(f"""
-                <div class="user-message">
-                    {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                # Detectar tipo de mensagem para aplicar estilo
-                message_class = "assistant-message"
-                if "✅" in message["content"]:
-                    message_class = "success-message"
-                elif "❌" in message["content"]:
-                    message_class = "error-message"
-                
-                st.markdown(f"""
-                <div class="{message_class}">
-                    {message["content"]}
-                </div>
-                """, unsafe_allow_html=True)
-        
-        # Input area - sem container branco
-        col_input, col_clear = st.columns([5, 1])
-        
-        with col_input:
-            user_input = st.text_input(
-                "Digite sua mensagem:", 
-                key="user_input", 
-                placeholder="Ex: Preciso emitir a segunda via da minha CNH",
-                label_visibility="collapsed"
-            )
-        
-        with col_clear:
-            clear_clicked = st.button("🗑️", help="Limpar chat", key="clear_btn")
-        
-        if clear_clicked:
-            st.session_state.messages = []
-            st.session_state.user_data = {}
-            st.rerun()
-        
-        # Processar mensagem quando usuário digita e pressiona Enter
-        if user_input:
-            # Adicionar mensagem do usuário
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            
-            # Mostrar indicador de digitação
-            with st.spinner("Assistente está digitando..."):
-                # Processar com o agente
-                response = st.session_state.agent.process_message(user_input)
-            
-            # Adicionar resposta do assistente
-            st.session_state.messages.append({"role": "assistant", "content": response})
-            
-            # Limpar input e recarregar
-            st.rerun()
+        _chat_area(agent)
     
     with col2:
         # Status da sessão
@@ -715,17 +867,9 @@ def main():
         """, unsafe_allow_html=True)
         
         for i, action in enumerate(st.session_state.quick_actions):
-            if st.button(f"💬 {action}", key=f"quick_{i}", help="Clique para enviar esta mensagem"):
-                # Adicionar mensagem do usuário diretamente
-                st.session_state.messages.append({"role": "user", "content": action})
-                
-                # Processar com o agente
-                with st.spinner("Assistente está digitando..."):
-                    response = st.session_state.agent.process_message(action)
-                
-                # Adicionar resposta do assistente
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                st.rerun()
+            # o clique só enfileira; o chat (que roda antes nesta execução) responde
+            st.button(f"💬 {action}", key=f"quick_{i}", help="Clique para enviar esta mensagem",
+                      on_click=_queue_prompt, args=(action,))
         
         # Histórico de conversas
         if len(st.session_state.messages) > 1:
@@ -736,6 +880,22 @@ def main():
             </div>
             """.format(len(st.session_state.messages)), unsafe_allow_html=True)
         
+        # Memória desta sessão e do processo (SessionMemoryManager)
+        own = memory.session_stats(st.session_state.session_id)
+        totals = memory.stats(top=0)
+        st.caption(
+            f"🧠 Sessão: {own['bytes'] / 1024:.0f} KiB ({own['messages']} mensagens, {own['compact']} compactadas) · "
+            f"processo: {totals['bytes'] / 1048576:.1f}/{totals['budget_bytes'] / 1048576:.0f} MiB "
+            f"em {totals['sessions']} sessões"
+        )
+        
+        # Return of control: latência das ações executadas neste processo
+        if RETURN_CONTROL_ENABLED:
+            routes = get_action_runner().stats()
+            if routes:
+                st.caption("⚡ Ações locais (p50): " + " · ".join(
+                    f"{path.strip('/')} {r['p50_ms']:.1f} ms ({r['calls']})" for path, r in routes.items()))
+        
         # Informações técnicas
         st.markdown("""
         <div class="sidebar-info">
@@ -1,14 +1,22 @@
 import os
+import time
 import uuid
-import re
-import boto3
-from botocore.config import Config
+import codecs
 import streamlit as st
+from cet_stream import RenderScheduler
+from cet_dae import DaeFieldExtractor
+from cet_history import ensure_ids, fragment_decorator, load_older, new_message, reset_window, visible
+from cet_conversation_store import CONVERSATION_LOAD_LAST, create_conversation_store
+from cet_session_memory import SessionMemoryManager
+from cet_trace import TRACE_ENABLED, TraceStore, TurnTrace, summary_line
+from cet_return_control import RETURN_CONTROL_ENABLED, LocalActionRunner, invoke_with_return_control
 
 # =========================
 # Configuração básica
 # =========================
 st.set_page_config(page_title="Chat – Bedrock Agent", page_icon="💬", layout="wide")
+# reruns parciais do chat (st.fragment); nas versões antigas do Streamlit vira rerun completo
+fragment = fragment_decorator(st)
 
 # -------- Persistência de sessão no URL --------
 # Usa query params para manter o session_id mesmo após refresh.
@@ -26,8 +34,10 @@ def _set_query_params(**params):
 
 # Lê configurações de ambiente/Secrets (recomendado no Streamlit Cloud)
 AWS_REGION = st.secrets.get("AWS_REGION") or os.getenv("AWS_REGION") or os.getenv("AWS_DEFAULT_REGION", "us-east-1")
-AGENT_ID = st.secrets.get("BEDROCK_AGENT_ID") or os.getenv("BEDROCK_AGENT_ID", "")
-AGENT_ALIAS_ID = st.secrets.get("BEDROCK_AGENT_ALIAS_ID") or os.getenv("BEDROCK_AGENT_ALIAS_ID", "")
+# BEDROCK_FAKE=1 usa o fake local (fake_bedrock.py) em vez do serviço: sem rede/AWS
+USE_FAKE_AGENT = str(st.secrets.get("BEDROCK_FAKE") or os.getenv("BEDROCK_FAKE", "")).lower() in ("1", "true", "yes")
+AGENT_ID = st.secrets.get("BEDROCK_AGENT_ID") or os.getenv("BEDROCK_AGENT_ID", "") or ("FAKE" if USE_FAKE_AGENT else "")
+AGENT_ALIAS_ID = st.secrets.get("BEDROCK_AGENT_ALIAS_ID") or os.getenv("BEDROCK_AGENT_ALIAS_ID", "") or ("FAKE" if USE_FAKE_AGENT else "")
 READ_TIMEOUT = int(st.secrets.get("AWS_READ_TIMEOUT", os.getenv("AWS_READ_TIMEOUT", 300)))
 CONNECT_TIMEOUT = int(st.secrets.get("AWS_CONNECT_TIMEOUT", os.getenv("AWS_CONNECT_TIMEOUT", 20)))
 
@@ -36,7 +46,13 @@ CONNECT_TIMEOUT = int(st.secrets.get("AWS_CONNECT_TIMEOUT", os.getenv("AWS_CONNE
 # =========================
 @st.cache_resource(show_spinner=False)
 def get_bedrock_agent_runtime():
+    if USE_FAKE_AGENT:
+        from fake_bedrock import FakeAgentRuntimeClient
+        return FakeAgentRuntimeClient.from_env()
     try:
+        # boto3/botocore só são importados aqui (~150ms); no modo fake nem chegam a carregar
+        import boto3
+        from botocore.config import Config
         cfg = Config(
             read_timeout=READ_TIMEOUT,
             connect_timeout=CONNECT_TIMEOUT,
@@ -50,13 +66,40 @@ def get_bedrock_agent_runtime():
 
 client = get_bedrock_agent_runtime()
 
+
+@st.cache_resource(show_spinner=False)
+def get_conversation_store():
+    """Histórico persistente compartilhado pelas sessões do processo (CONVERSATION_STORE)."""
+    return create_conversation_store()
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory():
+    """Limite de histórico, compactação e orçamento de memória das sessões do processo."""
+    return SessionMemoryManager()
+
+
+@st.cache_resource(show_spinner=False)
+def get_trace_store():
+    """Spans por turno de todas as sessões do processo (AGENT_TRACE / AGENT_TRACE_EXPORT)."""
+    return TraceStore()
+
+
+@st.cache_resource(show_spinner=False)
+def get_action_runner():
+    """Backend do Action Group no processo, para as ações do return of control (AGENT_RETURN_CONTROL)."""
+    return LocalActionRunner()
+
+
+store = get_conversation_store()
+memory = get_session_memory()
+traces = get_trace_store()
+
 # =========================
 # Funções utilitárias
 # =========================
 def ensure_session():
     """Garante um session_id estável por sessão e persiste no URL até o usuário limpar."""
-    if "messages" not in st.session_state:
-        st.session_state.messages = []  # histórico local
     sid = st.session_state.get("session_id")
     if not sid:
         qp = _get_query_params()
@@ -67,78 +110,119 @@ def ensure_session():
             sid = str(uuid.uuid4())
             _set_query_params(sid=sid)
         st.session_state.session_id = sid
+    # sessão nova neste worker (refresh, outro worker, redeploy) ou esvaziada pelo orçamento de
+    # memória: retoma o fim do histórico; o resto fica no store até "carregar anteriores"
+    if "messages" not in st.session_state or memory.pop_evicted(sid):
+        st.session_state.messages = store.load(sid, CONVERSATION_LOAD_LAST)
+        st.session_state.history_unloaded = store.count(sid) - len(st.session_state.messages)
+    track_memory()
+
+def track_memory():
+    """Aplica limite/compactação no histórico da sessão; o que sai da memória continua no store."""
+    dropped = memory.track(st.session_state.session_id, st.session_state.messages)
+    if dropped:
+        st.session_state.history_unloaded = st.session_state.get("history_unloaded", 0) + dropped
+
+def append_message(role: str, content: str):
+    """Mensagem no histórico da sessão + log persistente (gravação em lote, fora do render)."""
+    message = new_message(role, content)
+    st.session_state.messages.append(message)
+    store.append(st.session_state.session_id, message)
+
+def load_older_messages():
+    """Callback de "carregar anteriores": amplia a janela e busca no store o que faltar."""
+    load_older(st.session_state)
+    missing = min(st.session_state.history_window - len(st.session_state.messages),
+                  st.session_state.get("history_unloaded", 0))
+    if missing > 0:
+        older = store.load(st.session_state.session_id, missing, skip=len(st.session_state.messages))
+        st.session_state.messages[:0] = older
+        st.session_state.history_unloaded -= len(older)
 
 def reset_session():
     """Apaga a sessão atual e inicia uma nova (até o usuário recarregar a página)."""
     new_sid = str(uuid.uuid4())
+    memory.forget(st.session_state.session_id)
     st.session_state.session_id = new_sid
     st.session_state.messages = []
+    st.session_state.history_unloaded = 0
+    st.session_state.agent_session_attrs = {}
+    reset_window(st.session_state)
     _set_query_params(sid=new_sid)
 
 def stream_agent_response(user_text: str):
     """Invoca o Agent e faz streaming do texto de resposta.
-    A interface APENAS conversa com o Agent (sem chamar outras APIs diretamente).
+    A interface só conversa com o Agent; com AGENT_RETURN_CONTROL as ações que
+    o Agent devolve rodam no backend local e o resultado volta para o Agent.
     """
     if not AGENT_ID or not AGENT_ALIAS_ID:
         st.error("Defina BEDROCK_AGENT_ID e BEDROCK_AGENT_ALIAS_ID em st.secrets ou variáveis de ambiente.")
         return ""
 
+    # spans de modelo/ação/UI do turno; com AGENT_TRACE=false o stream nem traz os eventos de trace
+    turn = TurnTrace(st.session_state.session_id, user_text) if TRACE_ENABLED else None
+    error = None
     try:
-        response = client.invoke_agent(
+        events = invoke_with_return_control(
+            client,
+            get_action_runner() if RETURN_CONTROL_ENABLED else None,
+            st.session_state.setdefault("agent_session_attrs", {}),
+            turn,
             agentId=AGENT_ID,
             agentAliasId=AGENT_ALIAS_ID,
             sessionId=st.session_state.session_id,
             inputText=user_text,
-            enableTrace=True,
+            enableTrace=TRACE_ENABLED,
         )
 
-        full_text = ""
-        for event in response.get("completion", []):
+        # um caractere UTF-8 pode vir partido entre dois chunks
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        for event in events:
             if "chunk" in event:
-                part = event["chunk"].get("bytes", b"").decode("utf-8", errors="ignore")
-                full_text += part
-                yield part
-        return full_text
+                if turn:
+                    turn.chunk()
+                part = decoder.decode(event["chunk"].get("bytes", b""))
+                if part:
+                    if turn:
+                        # tempo parado no yield = desenho da UI
+                        paused = time.perf_counter()
+                        yield part
+                        turn.ui((time.perf_counter() - paused) * 1000.0)
+                    else:
+                        yield part
+            elif turn and "trace" in event:
+                turn.add(event["trace"])
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
 
     except Exception as e:
+        error = str(e)
         msg = f"Erro ao invocar o Agent: {e}"
         st.error(msg)
         yield "\n" + msg
+    finally:
+        if turn:
+            traces.add(turn.finish(error))
+
+DAE_INTRO = (
+    "Sua guia DAE foi gerada com sucesso. "
+    "A segunda via da CNH será emitida após a confirmação de pagamento do DAE "
+    "e enviada para o endereço do condutor através do correio. "
+    "Acompanhe a sua solicitação perguntando o status aqui. Dados da emissão:"
+)
 
-def format_dae_response(text: str) -> str:
+def render_response(placeholder, dae: DaeFieldExtractor, text: str):
     """
-    Formata o retorno da emissão da DAE para 'um campo por linha',
-    exibindo apenas campos com valor.
-    - Remove campos vazios
-    - Normaliza espaços
-    - Trunca campos muito longos de código de barras
+    Desenho da resposta em andamento: texto corrido ou, na emissão de DAE,
+    a frase + o bloco "campo: valor" que o extrator já montou durante o stream.
     """
-    if not text:
-        return text
-
-    anchor = "Dados da emissão:"
-    if anchor in text:
-        text = text.split(anchor, 1)[1]
-
-    # Normaliza: remove quebras e múltiplos espaços (sem usar escapes problemáticos)
-    t = " ".join(text.split())
-
-    pattern = re.compile(r"([A-Za-z_]+):")
-    matches = list(pattern.finditer(t))
-
-    lines = []
-    for i, m in enumerate(matches):
-        key = m.group(1)
-        start = m.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(t)
-        value = t[start:end].strip()
-        if not value:
-            continue
-        if key in {"codigo_barras", "codigoBarras"} and len(value) > 60:
-            value = value[:60] + "…"
-        lines.append(f"{key}: {value}")
-
-    return "\n".join(lines)
+    if dae.detected:
+        box = placeholder.container()
+        box.markdown(f"**{DAE_INTRO}**")
+        box.code(dae.formatted)
+    else:
+        placeholder.markdown(text)
 
 # =========================
 # UI – Sidebar (informativo)
@@ -190,54 +274,69 @@ with col_right:
         except Exception:
             st.experimental_rerun()
 
-# Renderiza histórico
-for m in st.session_state.messages:
-    with st.chat_message(m["role"]):
-        st.markdown(m["content"])
-
-# Entrada do usuário
-prompt = st.chat_input("Escreva sua mensagem…")
-
-if prompt:
-    # Guarda a mensagem do usuário e mostra
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    # Espaço para a resposta do agente
-    with st.chat_message("assistant"):
-        placeholder = st.empty()
-        streamed_text = ""
-        for chunk in stream_agent_response(prompt):
-            streamed_text += chunk
-            placeholder.markdown(streamed_text)
-        if not streamed_text:
-            placeholder.markdown("(sem conteúdo)")
-        else:
-            # Se for a resposta de emissão de DAE, formata para um campo por linha
-            if ("Sua guia DAE foi gerada" in streamed_text) or ("mes_ano_dae:" in streamed_text):
-                formatted = format_dae_response(streamed_text)
-                extra_msg = (
-                    "**Sua guia DAE foi gerada com sucesso. "
-                    "A segunda via da CNH será emitida após a confirmação de pagamento do DAE "
-                    "e enviada para o endereço do condutor através do correio. "
-                    "Acompanhe a sua solicitação perguntando o status aqui. Dados da emissão:**"
-                )
-                box = placeholder.container()
-                box.markdown(extra_msg)
-                box.code(formatted)
+@fragment
+def chat_area():
+    """
+    Histórico + entrada + resposta como fragmento: cada mensagem reexecuta só
+    esta parte, sem a barra lateral. Só as últimas HISTORY_WINDOW mensagens
+    são desenhadas; "carregar anteriores" amplia a janela.
+    """
+    messages = ensure_ids(st.session_state.messages)
+    hidden, window = visible(messages, st.session_state)
+    hidden += st.session_state.get("history_unloaded", 0)
+    if hidden:
+        st.button(f"⬆️ Carregar mensagens anteriores ({hidden})", key="load_older",
+                  on_click=load_older_messages)
+
+    # Renderiza histórico
+    for m in window:
+        with st.chat_message(m["role"]):
+            st.markdown(m["content"])
+
+    # Entrada do usuário
+    prompt = st.chat_input("Escreva sua mensagem…")
+
+    if prompt:
+        # Guarda a mensagem do usuário e mostra
+        append_message("user", prompt)
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        # Espaço para a resposta do agente
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            # chunks acumulados em lista; o placeholder é redesenhado a cada
+            # STREAM_RENDER_INTERVAL_MS ou STREAM_RENDER_MAX_BYTES, não a cada chunk.
+            # Os campos da DAE são extraídos enquanto o texto chega: o último desenho
+            # (close do scheduler) já sai com o bloco formatado completo
+            dae = DaeFieldExtractor()
+            with RenderScheduler(lambda text: render_response(placeholder, dae, text)) as scheduler:
+                for chunk in stream_agent_response(prompt):
+                    dae.push(chunk)
+                    scheduler.push(chunk)
+                dae.close()
+            streamed_text = scheduler.text
+            st.session_state.render_stats = scheduler.stats
+            if not streamed_text:
+                placeholder.markdown("(sem conteúdo)")
+            elif dae.detected:
                 # Salva no histórico com a frase + campos
-                streamed_text = (
-                    "Sua guia DAE foi gerada com sucesso. "
-                    "A segunda via da CNH será emitida após a confirmação de pagamento do DAE "
-                    "e enviada para o endereço do condutor através do correio. "
-                    "Acompanhe a sua solicitação perguntando o status aqui. Dados da emissão:\n"
-                    + formatted
-                )
-
-    # Salva a resposta completa no histórico (se houver)
-    if streamed_text:
-        st.session_state.messages.append({"role": "assistant", "content": streamed_text})
+                streamed_text = DAE_INTRO + "\n" + dae.formatted
+
+        # Salva a resposta completa no histórico (se houver)
+        if streamed_text:
+            append_message("assistant", streamed_text)
+        track_memory()
+
+    # De onde veio a latência do último turno (modelo, action group, UI)
+    last = traces.last(st.session_state.session_id) if TRACE_ENABLED else None
+    if last:
+        st.caption(summary_line(last))
+        st.download_button("⬇️ Traces desta sessão (JSONL)", traces.to_jsonl(st.session_state.session_id),
+                           file_name=f"traces-{st.session_state.session_id}.jsonl",
+                           mime="application/x-ndjson", key="download_traces")
+
+chat_area()
 
 # Rodapé simples
 st.caption("Esta interface APENAS conversa com o Bedrock Agent configurado.")
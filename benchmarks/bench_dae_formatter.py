@@ -0,0 +1,193 @@
+"""
+Formatação da resposta de emissão da DAE: varredura depois do stream
+(antes: format_dae_response do app_simple.py, reproduzido aqui) vs.
+DaeFieldExtractor (cet_dae.py) alimentado trecho a trecho.
+
+- pausa no fim: do último chunk até o bloco formatado ficar pronto (o que o
+  usuário esperava antes do último desenho);
+- vazão: MB/s do extrator sobre uma resposta grande (codigoBarras em base64
+  de --barcode-kb KiB, como uma imagem real), em vários tamanhos de chunk.
+
+Uso:
+    python benchmarks/bench_dae_formatter.py [--repeat 200] [--barcode-kb 64]
+
+Os campos também são conferidos com a resposta reescrita nas listas
+markdown que o modelo produz ("- **chave:** valor", "* **chave**: valor",
+"1. chave: valor"): o marcador da próxima linha não pode sobrar no valor.
+
+Sai com código 1 se o bloco mudar com o tamanho do chunk, se faltar algum
+campo da resposta do fake (em qualquer das formas) ou se a pausa no fim não
+diminuir.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_dae import ANCHOR, TRUNCATE_FIELDS, DaeFieldExtractor, format_dae  # noqa: E402
+from bench_render_scheduler import record  # noqa: E402
+
+CHUNK_SIZES = (1, 8, 64, 1024)
+
+
+def format_dae_response(text: str) -> str:
+    """Formatador antigo do app_simple.py (regex compilada a cada chamada, texto inteiro)."""
+    if not text:
+        return text
+    anchor = "Dados da emissão:"
+    if anchor in text:
+        text = text.split(anchor, 1)[1]
+    t = " ".join(text.split())
+    pattern = re.compile(r"([A-Za-z_]+):")
+    matches = list(pattern.finditer(t))
+    lines = []
+    for i, m in enumerate(matches):
+        key = m.group(1)
+        start = m.end()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(t)
+        value = t[start:end].strip()
+        if not value:
+            continue
+        if key in {"codigo_barras", "codigoBarras"} and len(value) > 60:
+            value = value[:60] + "…"
+        lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+
+def dae_text():
+    """Resposta de emissão gravada do fake (3º turno da conversa)."""
+    _, events = record(64, 0.0)[2]
+    return "".join(part for _, part in events)
+
+
+def expected_fields(text):
+    """Campos "chave: valor" que o fake escreveu, uma linha cada, depois da âncora."""
+    out = {}
+    for line in text.split(ANCHOR, 1)[1].strip().splitlines():
+        key, _, value = line.partition(": ")
+        value = " ".join(value.split())
+        limit = TRUNCATE_FIELDS.get(key)
+        if limit and len(value) > limit:
+            value = value[:limit] + "…"
+        out[key] = value
+    return out
+
+
+def markdown_variants(text):
+    """A mesma resposta com as linhas "chave: valor" em listas markdown, como o modelo costuma escrever."""
+    head, _, body = text.partition(ANCHOR)
+    lines = body.strip().splitlines()
+    forms = {
+        "- **chave:** valor": lambda i, k, v: f"- **{k}:** {v}",
+        "* **chave**: valor": lambda i, k, v: f"* **{k}**: {v}",
+        "1. chave: valor": lambda i, k, v: f"{i}. {k}: {v}",
+    }
+    out = {}
+    for name, form in forms.items():
+        rows = [form(i, *line.split(": ", 1)) for i, line in enumerate(lines, 1)]
+        out[name] = head + ANCHOR + "\n" + "\n".join(rows)
+    return out
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def old_way(parts):
+    # os trechos já estavam juntos numa lista (RenderScheduler); o custo começa no fim do stream
+    t0 = time.perf_counter()
+    text = "".join(parts)
+    formatted = format_dae_response(text) if ("Sua guia DAE foi gerada" in text or "mes_ano_dae:" in text) else text
+    return formatted, (time.perf_counter() - t0) * 1000.0
+
+
+def new_way(parts):
+    extractor = DaeFieldExtractor()
+    for part in parts:
+        extractor.push(part)
+    t0 = time.perf_counter()
+    formatted = extractor.close()
+    return formatted, (time.perf_counter() - t0) * 1000.0, extractor
+
+
+def throughput(text, size, repeat):
+    parts = chunks(text, size)
+    best = float("inf")
+    for _ in range(repeat):
+        extractor = DaeFieldExtractor()
+        t0 = time.perf_counter()
+        for part in parts:
+            extractor.push(part)
+        extractor.close()
+        best = min(best, time.perf_counter() - t0)
+    return len(text.encode("utf-8")) / best / 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    ap.add_argument("--barcode-kb", type=int, default=64)
+    args = ap.parse_args()
+
+    text = dae_text()
+    reference = format_dae(text)
+    ok = True
+
+    fields = DaeFieldExtractor()
+    fields.push(text)
+    fields.close()
+    for key, value in expected_fields(text).items():
+        if fields.fields.get(key) != value:
+            ok = False
+            print(f"campo {key!r}: esperado {value!r}, extraído {fields.fields.get(key)!r}")
+
+    expected = expected_fields(text)
+    for name, variant in markdown_variants(text).items():
+        for size in CHUNK_SIZES:
+            got = new_way(chunks(variant, size))[2].fields
+            if got != expected:
+                ok = False
+                diff = {k: got.get(k) for k in expected if got.get(k) != expected[k]}
+                print(f"lista markdown {name!r}, chunk {size}: {len(diff)} campos diferentes, ex. "
+                      f"{next(iter(diff.items()), None)!r}")
+                break
+
+    print(f"resposta de emissão: {len(text)} caracteres, {len(fields.fields)} campos")
+    print(f"{'chunk':>6s}{'pausa antes ms':>16s}{'pausa depois ms':>17s}")
+    for size in CHUNK_SIZES:
+        parts = chunks(text, size)
+        old_ms, new_ms = [], []
+        for _ in range(args.repeat):
+            old_ms.append(old_way(parts)[1])
+            formatted, ms, _ = new_way(parts)
+            new_ms.append(ms)
+            if formatted != reference:
+                ok = False
+        before, after = statistics.median(old_ms), statistics.median(new_ms)
+        print(f"{size:>6d}{before:>16.3f}{after:>17.3f}")
+        if after >= before:
+            ok = False
+            print(f"  pausa no fim não diminuiu com chunk de {size}")
+
+    big = text.replace("iVBORw0KGgoAAAANSUhEUgAAAAEAAAAB...",
+                       ("iVBORw0KGgoAAAANSUhEUgAA" * (args.barcode_kb * 1024 // 24 + 1))[: args.barcode_kb * 1024])
+    big_reference = format_dae(big)
+    print(f"\nvazão do extrator, resposta de {len(big) / 1024:.0f} KiB")
+    print(f"{'chunk':>6s}{'MB/s':>10s}")
+    for size in CHUNK_SIZES[1:]:
+        if new_way(chunks(big, size))[0] != big_reference:
+            ok = False
+            print(f"  bloco diferente com chunk de {size}")
+        print(f"{size:>6d}{throughput(big, size, max(3, args.repeat // 20)):>10.1f}")
+
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
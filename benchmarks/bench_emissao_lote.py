@@ -0,0 +1,135 @@
+"""
+Emissão de DAE em lote (cet_emissao_lote.py): vazão por número de workers
+e retomada depois de uma interrupção.
+
+Gera uma planilha de --rows condutores (separador ";", CPFs com e sem
+máscara, ~2% inválidos) e:
+
+- roda a emissão completa com 1 worker e com --workers; os dois resultados
+  têm que ser iguais (flow_id, gerado a cada confirmação, fica de fora);
+- roda a CLI num processo à parte, mata com SIGKILL quando o checkpoint
+  passa de 1/3 das linhas (pode ser no meio de um bloco) e roda de novo:
+  a retomada tem que começar depois da última linha do checkpoint e o
+  arquivo final tem que ser igual ao da execução sem interrupção, sem
+  linha repetida nem faltando. Vale para CSV e JSONL.
+
+Uso:
+    python benchmarks/bench_emissao_lote.py [--rows 5000] [--workers 4] [--chunk 50]
+
+Sai com código 1 se algum resultado diferir ou se a retomada reprocessar
+ou pular linhas. A vazão só é reportada (depende dos núcleos da máquina).
+"""
+import os
+import re
+import sys
+import csv
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_emissao_lote import run  # noqa: E402
+
+CLI = os.path.join(ROOT, "cet_emissao_lote.py")
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def build_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["CPF", "Nome", "Nascimento", "Mae"])
+        for i in range(1, rows + 1):
+            cpf = f"{i:011d}"
+            if i % 50 == 0:
+                cpf = cpf[:7]  # inválido
+            elif i % 7 == 0:
+                cpf = f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+            w.writerow([cpf, f"CONDUTOR {i}", "01/02/1990", f"MAE {i}"])
+
+
+def normalized(path):
+    with open(path, encoding="utf-8") as f:
+        return _UUID.sub("<uuid>", f.read())
+
+
+def interrupted_run(source, out, rows, workers, chunk):
+    """Mata a CLI no meio e retoma; devolve (linha do checkpoint ao matar, stderr da retomada)."""
+    checkpoint = out + ".checkpoint.json"
+    cmd = [sys.executable, CLI, source, "--out", out, "--workers", str(workers), "--chunk", str(chunk),
+           "--progress-s", "0"]
+    proc = subprocess.Popen(cmd + ["--restart"], stderr=subprocess.DEVNULL)
+    done = 0
+    while proc.poll() is None and done < rows // 3:
+        time.sleep(0.002)
+        try:
+            with open(checkpoint, encoding="utf-8") as f:
+                done = json.load(f)["done"]
+        except (OSError, ValueError, KeyError):
+            pass
+    proc.send_signal(signal.SIGKILL)
+    proc.wait()
+    with open(checkpoint, encoding="utf-8") as f:
+        done = json.load(f)["done"]
+    resumed = subprocess.run(cmd, capture_output=True, text=True)
+    return done, resumed.stderr
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--chunk", type=int, default=50)
+    args = ap.parse_args()
+
+    ok = True
+    tmp = tempfile.mkdtemp(prefix="emissao_lote_")
+    source = os.path.join(tmp, "condutores.csv")
+    build_csv(source, args.rows)
+    quiet = open(os.devnull, "w")
+
+    print(f"{args.rows} linhas, blocos de {args.chunk}, {os.cpu_count()} núcleos")
+    print(f"{'execução':28s}{'linhas/s':>10s}{'s':>8s}{'ok':>7s}{'erros':>7s}")
+    reference = {}
+    for fmt in ("csv", "jsonl"):
+        for workers in sorted({1, args.workers}):
+            out = os.path.join(tmp, f"w{workers}.{fmt}")
+            state = run(source, out, workers=workers, chunk=args.chunk, restart=True, progress_s=0, log=quiet)
+            print(f"{f'{fmt}, {workers} worker(s)':28s}{state['rows_per_s']:>10.0f}{state['elapsed_s']:>8.2f}"
+                  f"{state['ok']:>7d}{state['erros']:>7d}")
+            text = normalized(out)
+            reference.setdefault(fmt, text)
+            if text != reference[fmt]:
+                ok = False
+                print(f"  resultado com {workers} workers difere do de 1 worker")
+            if state["done"] != args.rows or state["ok"] + state["erros"] != args.rows:
+                ok = False
+                print(f"  checkpoint final {state}")
+
+        out = os.path.join(tmp, f"interrompido.{fmt}")
+        done, stderr = interrupted_run(source, out, args.rows, args.workers, args.chunk)
+        match = re.search(r"retomando depois da linha (\d+)", stderr)
+        processed = re.search(r"^(\d+) linhas em", stderr, re.M)
+        print(f"{f'{fmt}, morto na linha {done}':28s} retomada processou "
+              f"{processed.group(1) if processed else '?'} linhas")
+        if not match or int(match.group(1)) != done or not processed or int(processed.group(1)) != args.rows - done:
+            ok = False
+            print(f"  retomada não partiu do checkpoint: {stderr.strip()[:300]}")
+        if normalized(out) != reference[fmt]:
+            ok = False
+            lines = normalized(out).splitlines()
+            print(f"  arquivo retomado difere da execução sem interrupção ({len(lines)} linhas)")
+    quiet.close()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
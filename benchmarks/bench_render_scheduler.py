@@ -0,0 +1,127 @@
+"""
+Desenho por chunk (`texto += parte; placeholder.markdown(texto)`) vs.
+RenderScheduler (cet_stream.py), sobre o streaming do fake do Bedrock.
+
+A conversa de emissão da DAE roda uma vez contra o FakeAgentRuntimeClient
+(Lambdas locais) e a sequência de chunks é gravada com o instante de
+chegada; as duas estratégias são reproduzidas sobre a mesma gravação com um
+relógio virtual, então o resultado é determinístico.
+
+Uso:
+    python benchmarks/bench_render_scheduler.py [--chunk-size 8] [--chunk-delay-ms 2]
+        [--interval-ms 50] [--max-bytes 2048]
+
+Sai com código 1 se o texto final divergir ou se o agendador desenhar mais
+vezes que o desenho por chunk.
+"""
+import os
+import sys
+import time
+import uuid
+import codecs
+import argparse
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_stream import RenderScheduler  # noqa: E402
+from fake_bedrock import FakeAgentRuntimeClient  # noqa: E402
+
+TURNS = [
+    "Quero emitir a segunda via da minha CNH",
+    "CPF 12345678901, nascimento 01/02/1990, nome Maria da Silva, mãe Joana da Silva",
+    "sim, pode gerar a guia",
+]
+
+
+def record(chunk_size, chunk_delay_ms):
+    """[(turno, [(t_s, texto), ...])] gravados do fake."""
+    client = FakeAgentRuntimeClient(chunk_size=chunk_size, chunk_delay=chunk_delay_ms / 1000.0,
+                                    model_delay=0.0, enable_traces=True)
+    sid = str(uuid.uuid4())
+    recordings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for text in TURNS:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            t0 = time.perf_counter()
+            events = []
+            response = client.invoke_agent(agentId="FAKE", agentAliasId="FAKE", sessionId=sid,
+                                           inputText=text, enableTrace=True)
+            for ev in response["completion"]:
+                if "chunk" in ev:
+                    part = decoder.decode(ev["chunk"]["bytes"])
+                    if part:
+                        events.append((time.perf_counter() - t0, part))
+            recordings.append((text, events))
+    return recordings
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _render_cost(stats):
+    # o Streamlit serializa o texto inteiro a cada markdown(); encode() faz esse papel
+    def render(text):
+        stats["renders"] += 1
+        stats["chars_rendered"] += len(text)
+        text.encode("utf-8")
+    return render
+
+
+def naive(events):
+    stats = {"renders": 0, "chars_rendered": 0, "chars_copied": 0}
+    render = _render_cost(stats)
+    text = ""
+    for _, part in events:
+        text += part
+        stats["chars_copied"] += len(text)
+        render(text)
+    return text, stats
+
+
+def scheduled(events, interval_ms, max_bytes):
+    stats = {"renders": 0, "chars_rendered": 0}
+    render = _render_cost(stats)
+    clock = VirtualClock()
+    with RenderScheduler(render, interval_ms=interval_ms, max_bytes=max_bytes, clock=clock) as scheduler:
+        for at, part in events:
+            clock.now = at
+            scheduler.push(part)
+    stats["chars_copied"] = scheduler.stats["chars_copied"]
+    assert stats["renders"] == scheduler.stats["renders"]
+    return scheduler.text, stats
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunk-size", type=int, default=8, help="caracteres por chunk do fake")
+    ap.add_argument("--chunk-delay-ms", type=float, default=2.0)
+    ap.add_argument("--interval-ms", type=float, default=50.0)
+    ap.add_argument("--max-bytes", type=int, default=2048)
+    args = ap.parse_args()
+
+    ok = True
+    print(f"{'turno':34s}{'chunks':>7s}{'renders':>16s}{'chars copiados':>22s}{'chars renderizados':>24s}")
+    for text, events in record(args.chunk_size, args.chunk_delay_ms):
+        expected, old = naive(events)
+        got, new = scheduled(events, args.interval_ms, args.max_bytes)
+        if got != expected:
+            ok = False
+            print(f"DIVERGÊNCIA no texto final do turno {text!r}")
+        if new["renders"] > old["renders"]:
+            ok = False
+            print(f"agendador desenhou mais que o desenho por chunk no turno {text!r}")
+        print(f"{text[:32]:34s}{len(events):>7d}"
+              f"{old['renders']:>8d} -> {new['renders']:<5d}"
+              f"{old['chars_copied']:>11d} -> {new['chars_copied']:<8d}"
+              f"{old['chars_rendered']:>12d} -> {new['chars_rendered']:<8d}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
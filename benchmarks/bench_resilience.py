@@ -0,0 +1,181 @@
+"""
+Camada de resiliência do proxy (cet_resilience.py) contra um API Gateway
+lento ou instável, simulado na frente do backend real:
+
+- cauda: --slow-pct das consultas de status demoram --slow-ms; p50/p99 do
+  proxy sem hedge vs. com hedge (segunda requisição depois do p95);
+- falhas transitórias: --flaky-pct das consultas voltam 503; taxa de
+  sucesso sem e com novas tentativas;
+- prazo: backend travado e Lambda com --remaining-ms restantes; o proxy
+  tem que responder 504 antes do fim da invocação;
+- queda: backend sempre 503; depois de BREAKER_FAILURES falhas o circuito
+  abre e as chamadas seguintes voltam 503 sem chegar ao backend.
+
+Uso:
+    python benchmarks/bench_resilience.py [--requests 300] [--slow-pct 2] [--slow-ms 300]
+
+Sai com código 1 se o hedge não reduzir o p99, se as novas tentativas não
+aumentarem a taxa de sucesso, se o prazo for ultrapassado ou se o circuito
+não abrir.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_local import BACKEND_FILE, PROXY_FILE, agent_event, load_lambda, start_gateway  # noqa: E402
+from cet_resilience import ResilientCaller  # noqa: E402
+from cet_schema import SCHEMA  # noqa: E402
+
+
+class UnstableBackend:
+    """Backend real com atraso/erro injetados por requisição (modo trocado entre cenários)."""
+
+    def __init__(self, backend, seed=7):
+        self.backend = backend
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.slow_pct = self.flaky_pct = 0.0
+        self.slow_ms = 0.0
+        self.down = False
+        self.hang_s = 0.0
+        self.requests = 0
+
+    def lambda_handler(self, event, context):
+        with self.lock:
+            self.requests += 1
+            roll = self.rng.uniform(0, 100)
+        if self.hang_s:
+            time.sleep(self.hang_s)
+        if self.down or roll < self.flaky_pct:
+            return {"statusCode": 503, "headers": {"Content-Type": "application/json"},
+                    "body": '{"message": "Service Unavailable"}'}
+        if roll >= 100 - self.slow_pct:
+            time.sleep(self.slow_ms / 1000.0)
+        return self.backend.lambda_handler(event, context)
+
+
+class LambdaContext:
+    def __init__(self, remaining_ms):
+        self.deadline = time.monotonic() + remaining_ms / 1000.0
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def status_event(i):
+    return agent_event(SCHEMA.paths["exibir-dados"], "exibir-dados",
+                       {"cpf": f"{i:011d}", "data_nascimento": "01/02/1990"}, f"s{i}")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(proxy, n, offset=0, context=None):
+    latencies, statuses = [], []
+    for i in range(n):
+        t0 = time.perf_counter()
+        envelope = proxy.lambda_handler(status_event(offset + i), context)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        statuses.append(envelope["response"]["httpStatusCode"])
+    return latencies, statuses
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--slow-pct", type=float, default=2.0)
+    ap.add_argument("--slow-ms", type=float, default=300.0)
+    ap.add_argument("--flaky-pct", type=float, default=20.0)
+    ap.add_argument("--remaining-ms", type=float, default=1500.0)
+    args = ap.parse_args()
+
+    os.environ["STATUS_CACHE_ENABLED"] = "false"  # toda consulta vai ao backend
+    ok = True
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        unstable = UnstableBackend(load_lambda(BACKEND_FILE))
+        server, base_url = start_gateway(unstable)
+        os.environ["API_BASE"] = base_url
+        proxy = load_lambda(PROXY_FILE)
+        fast = dict(base_ms=5, max_backoff_ms=20)
+
+        # cauda: sem hedge vs. com hedge
+        unstable.slow_pct, unstable.slow_ms = args.slow_pct, args.slow_ms
+        proxy.RESILIENCE = ResilientCaller(hedge=False, max_attempts=1)
+        plain, _ = run(proxy, args.requests)
+        proxy.RESILIENCE = ResilientCaller(hedge=True, max_attempts=1)
+        run(proxy, 30, offset=10 ** 6)  # amostras para o p95 da rota
+        hedged, _ = run(proxy, args.requests)
+        hedge_stats = proxy.RESILIENCE.get_stats()
+        unstable.slow_pct = 0.0
+
+        # falhas transitórias: sem vs. com novas tentativas
+        unstable.flaky_pct = args.flaky_pct
+        proxy.RESILIENCE = ResilientCaller(max_attempts=1, hedge=False, breaker_failures=10 ** 6)
+        _, once = run(proxy, args.requests)
+        proxy.RESILIENCE = ResilientCaller(max_attempts=3, hedge=False, breaker_failures=10 ** 6, **fast)
+        _, retried = run(proxy, args.requests)
+        retry_stats = proxy.RESILIENCE.get_stats()
+        unstable.flaky_pct = 0.0
+
+        # prazo: backend travado além do que resta da Lambda
+        unstable.hang_s = 2 * args.remaining_ms / 1000.0
+        proxy.RESILIENCE = ResilientCaller(hedge=False, **fast)
+        deadline_ms, deadline_status = run(proxy, 1, context=LambdaContext(args.remaining_ms))
+        unstable.hang_s = 0.0
+
+        # queda: circuito abre e as chamadas seguintes não chegam ao backend
+        unstable.down = True
+        proxy.RESILIENCE = ResilientCaller(breaker_failures=5, breaker_cooldown_s=60, hedge=False, **fast)
+        before = unstable.requests
+        outage_ms, outage_status = run(proxy, 20)
+        reached = unstable.requests - before
+        breaker_stats = proxy.RESILIENCE.get_stats()
+    server.shutdown()
+
+    print(f"cauda ({args.slow_pct:.0f}% das consultas com +{args.slow_ms:.0f} ms), {args.requests} chamadas")
+    print(f"{'':12s}{'p50 ms':>9s}{'p95 ms':>9s}{'p99 ms':>9s}")
+    for name, values in (("sem hedge", plain), ("com hedge", hedged)):
+        print(f"{name:12s}{percentile(values, 0.5):>9.1f}{percentile(values, 0.95):>9.1f}"
+              f"{percentile(values, 0.99):>9.1f}")
+    print(f"hedges={hedge_stats['hedges']} vencidos pelo hedge={hedge_stats['hedge_wins']}")
+    if percentile(hedged, 0.99) >= percentile(plain, 0.99):
+        ok = False
+        print("  hedge não reduziu o p99")
+
+    ok_once = sum(s == 200 for s in once) / len(once)
+    ok_retry = sum(s == 200 for s in retried) / len(retried)
+    print(f"\n{args.flaky_pct:.0f}% de 503 no backend: sucesso {ok_once:.1%} sem novas tentativas, "
+          f"{ok_retry:.1%} com até 3 ({retry_stats['retries']} novas tentativas)")
+    if ok_retry <= ok_once:
+        ok = False
+        print("  novas tentativas não aumentaram a taxa de sucesso")
+
+    print(f"\nbackend travado, {args.remaining_ms:.0f} ms restantes na Lambda: status {deadline_status[0]} "
+          f"em {deadline_ms[0]:.0f} ms")
+    if deadline_status[0] != 504 or deadline_ms[0] >= args.remaining_ms:
+        ok = False
+        print("  proxy não respondeu dentro do prazo da Lambda")
+
+    fast_fails = outage_ms[-10:]
+    print(f"\nbackend fora do ar: {reached} de {len(outage_status)} chamadas chegaram ao backend; "
+          f"circuito aberto responde em {percentile(fast_fails, 0.5):.2f} ms (status {outage_status[-1]}); "
+          f"rotas abertas: {breaker_stats['open_routes']}")
+    if breaker_stats["short_circuits"] == 0 or outage_status[-1] != 503:
+        ok = False
+        print("  circuito não abriu")
+
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
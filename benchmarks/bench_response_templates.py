@@ -0,0 +1,93 @@
+"""
+Equivalência + benchmark dos templates pré-serializados do mock
+(cet-mg-backend.py) contra json.dumps do corpo completo.
+
+Uso:
+    python benchmarks/bench_response_templates.py [--n 100000]
+
+Sai com código 1 se algum corpo renderizado divergir do json.dumps.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def load_backend():
+    spec = importlib.util.spec_from_file_location("cet_mg_backend", os.path.join(ROOT, "cet-mg-backend.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# valores que exercitam o escape JSON
+VALUES = [
+    "12345678901",
+    "",
+    'aspas " e barra \\ invertida',
+    "acentuação çãõ é ü",
+    "quebra\nde\tlinha\r",
+    "controle \x00 \x1f \x7f",
+    "emoji 🚗 e </script>",
+    "  ",
+    None,
+    12345678901,
+    3.5,
+    True,
+]
+
+
+def check(be):
+    cases = [
+        (be.TPL_CONFIRMAR, be._confirmar_body, {"flow_id": "0a84e30c-3c9c-4f1c-9a5c-5d9a3b2d7f1a"}),
+        (be.TPL_OPCOES_PAGAMENTO, be._opcoes_pagamento_body, {}),
+        (be.TPL_EXIBIR_DADOS, be._exibir_dados_body, {}),
+    ]
+    failures = 0
+    for tpl, builder, extra in cases:
+        for v in VALUES:
+            values = dict(extra, cpf=v)
+            expected = json.dumps(builder(**values), ensure_ascii=False)
+            got = tpl.render(**values)
+            if got != expected or json.loads(got) != builder(**values):
+                failures += 1
+                print(f"DIVERGÊNCIA {builder.__name__} cpf={v!r}")
+    print(f"equivalência: {len(cases) * len(VALUES) - failures}/{len(cases) * len(VALUES)} ok")
+    return failures == 0
+
+
+def bench(be, n):
+    cases = [
+        ("confirmar-dados", be.TPL_CONFIRMAR, be._confirmar_body, {"flow_id": "f", "cpf": "12345678901"}),
+        ("exibir-opcoes-pagamento", be.TPL_OPCOES_PAGAMENTO, be._opcoes_pagamento_body, {"cpf": "12345678901"}),
+        ("exibir-dados", be.TPL_EXIBIR_DADOS, be._exibir_dados_body, {"cpf": "12345678901"}),
+    ]
+    for name, tpl, builder, values in cases:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            json.dumps(builder(**values), ensure_ascii=False)
+        old_us = (time.perf_counter() - t0) / n * 1e6
+        t0 = time.perf_counter()
+        for _ in range(n):
+            tpl.render(**values)
+        new_us = (time.perf_counter() - t0) / n * 1e6
+        print(f"{name:24s} dict+dumps={old_us:6.2f}us  template={new_us:6.2f}us  ganho={old_us / new_us:5.1f}x")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100000)
+    args = ap.parse_args()
+    be = load_backend()
+    ok = check(be)
+    bench(be, args.n)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
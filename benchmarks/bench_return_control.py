@@ -0,0 +1,134 @@
+"""
+Latência por ação: caminho Lambda (Agent -> cet-mg-api-invocation -> API
+Gateway -> cet-mg-backend) vs. return of control (cet_return_control.py, a
+ação roda no processo do app).
+
+A conversa de emissão da DAE roda --rounds vezes no FakeAgentRuntimeClient
+nos dois modos, cada rodada numa sessão nova. No modo Lambda a ação passa
+pelo proxy real e por um gateway HTTP local (cet_local.start_gateway); no
+return of control o fake devolve a ação no stream e o app chama o
+lambda_handler do backend direto. A duração de cada ação vem dos spans do
+TurnTrace (cet_trace.py), como na UI.
+
+O gateway local não tem a rede da AWS: --hop-ms soma uma latência fixa a
+cada salto de rede do caminho Lambda (Bedrock -> Lambda e Lambda -> API
+Gateway) para uma estimativa mais próxima da produção; o padrão (0) mede
+só o que roda aqui.
+
+Uso:
+    python benchmarks/bench_return_control.py [--rounds 30] [--hop-ms 0]
+
+Sai com código 1 se as respostas dos dois modos forem diferentes ou se o
+return of control não reduzir a latência mediana das ações.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from fake_bedrock import FakeAgentRuntimeClient  # noqa: E402
+from cet_local import local_action_group  # noqa: E402
+from cet_return_control import LocalActionRunner, invoke_with_return_control  # noqa: E402
+from cet_trace import TurnTrace  # noqa: E402
+
+TURNS = [
+    "Quero emitir a segunda via da minha CNH",
+    "CPF 12345678901, nascimento 01/02/1990, nome Maria da Silva, mãe Joana da Silva",
+    "sim, pode gerar a guia",
+    "qual o status? cpf 12345678901 nascimento 01/02/1990",
+]
+# valores gerados a cada emissão (flow_id, datas do dia) não entram na comparação
+_VOLATILE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|\d{4}-\d{2}-\d{2}[T ][\d:.]+")
+
+
+def lambda_handler_with_hops(hop_ms):
+    proxy = local_action_group()
+    if not hop_ms:
+        return proxy.lambda_handler
+
+    def handler(event, context):
+        time.sleep(2 * hop_ms / 1000.0)  # Bedrock -> Lambda e Lambda -> API Gateway (ida e volta)
+        return proxy.lambda_handler(event, context)
+    return handler
+
+
+def run(client, runner, rounds):
+    """Roda a conversa `rounds` vezes; devolve (respostas da 1ª rodada, ms por ação, ms por turno)."""
+    answers, actions, totals = [], {}, []
+    for r in range(rounds):
+        sid = f"bench-{'roc' if runner else 'lambda'}-{r}"
+        attrs = {}
+        for text in TURNS:
+            turn = TurnTrace(sid, text)
+            out = []
+            for event in invoke_with_return_control(client, runner, attrs, turn, agentId="FAKE",
+                                                    agentAliasId="FAKE", sessionId=sid, inputText=text,
+                                                    enableTrace=True):
+                if "chunk" in event:
+                    turn.chunk()
+                    out.append(event["chunk"]["bytes"])
+                elif "trace" in event:
+                    turn.add(event["trace"])
+            record = turn.finish()
+            totals.append(record["total_ms"])
+            for span in record["spans"]:
+                if span["kind"] == "action":
+                    actions.setdefault(span["name"], []).append(span["duration_ms"])
+            if r == 0:
+                answers.append(_VOLATILE.sub("*", b"".join(out).decode("utf-8")))
+    return answers, actions, totals
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rounds", type=int, default=30)
+    ap.add_argument("--hop-ms", type=float, default=0.0, help="latência simulada por salto de rede no caminho Lambda")
+    ap.add_argument("--model-ms", type=float, default=5.0, help="atraso do modelo no fake, por passo")
+    args = ap.parse_args()
+
+    fake = dict(chunk_size=64, chunk_delay=0.0, model_delay=args.model_ms / 1000.0)
+    # os handlers imprimem EMF/log por invocação; fora da medição de saída
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        lam = FakeAgentRuntimeClient(action_handler=lambda_handler_with_hops(args.hop_ms), **fake)
+        roc = FakeAgentRuntimeClient(return_control=True, **fake)
+        runner = LocalActionRunner()
+        # aquecimento: imports, pool HTTP do proxy, cold start dos handlers
+        run(lam, None, 1)
+        run(roc, runner, 1)
+        lam_answers, lam_actions, lam_totals = run(lam, None, args.rounds)
+        roc_answers, roc_actions, roc_totals = run(roc, runner, args.rounds)
+
+    ok = lam_answers == roc_answers
+    if not ok:
+        for text, a, b in zip(TURNS, lam_answers, roc_answers):
+            if a != b:
+                print(f"resposta diferente para {text!r}:\n  lambda: {a[:120]!r}\n  roc:    {b[:120]!r}")
+
+    print(f"{args.rounds} conversas x {len(TURNS)} turnos, hop simulado {args.hop_ms:.0f} ms")
+    print(f"{'ação':28s}{'lambda p50 ms':>15s}{'roc p50 ms':>12s}{'lambda p95':>12s}{'roc p95':>10s}")
+    for name in sorted(lam_actions):
+        lam_ms, roc_ms = sorted(lam_actions[name]), sorted(roc_actions.get(name) or [float("nan")])
+        p95 = lambda v: v[min(len(v) - 1, int(0.95 * len(v)))]  # noqa: E731
+        print(f"{name:28s}{statistics.median(lam_ms):>15.2f}{statistics.median(roc_ms):>12.2f}"
+              f"{p95(lam_ms):>12.2f}{p95(roc_ms):>10.2f}")
+    lam_p50 = statistics.median([ms for v in lam_actions.values() for ms in v])
+    roc_p50 = statistics.median([ms for v in roc_actions.values() for ms in v])
+    print(f"{'todas':28s}{lam_p50:>15.2f}{roc_p50:>12.2f}")
+    print(f"turno p50: lambda {statistics.median(lam_totals):.1f} ms, roc {statistics.median(roc_totals):.1f} ms")
+    print(f"invoke_agent: lambda {len(lam.calls)}, roc {len(roc.calls)} (uma continuação por ação)")
+
+    if roc_p50 >= lam_p50:
+        ok = False
+        print("return of control não reduziu a latência das ações")
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: cadeia antiga (_from_agent_properties -> _normalize_keys -> _require)
+vs. motor do schema (cet_schema.SCHEMA.parse, regras em tabela).
+
+O ganho do motor é ter uma fonte só (o yml) e devolver todos os erros de uma
+vez; em velocidade ele tem que ficar no mesmo patamar da cadeia escrita à
+mão (o json.loads domina o custo). Também mede o load_schema do cold start.
+
+Uso:
+    python benchmarks/bench_schema_validation.py [--n 200000] [--max-ratio 1.3]
+
+Sai com código 1 se o primeiro erro do motor diferir do da cadeia antiga ou
+se o motor ficar mais de --max-ratio vezes mais lento que ela.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cet_schema import SCHEMA, load_schema  # noqa: E402
+
+# --------- cadeia antiga (cópia de referência do cet-mg-backend.py) ---------
+CPF_RE = re.compile(r"^\d{11}$")
+DATE_RE = re.compile(r"^\d{2}/\d{2}/\d{4}$")
+
+
+def _require(payload, field, pattern=None, fmt_desc=""):
+    v = payload.get(field)
+    if v is None or (isinstance(v, str) and not v.strip()):
+        raise ValueError(f'O campo "{field}" é obrigatório')
+    if pattern and isinstance(v, str) and not pattern.match(v):
+        raise ValueError(f'Campo "{field}" inválido. {fmt_desc}'.strip())
+    return v
+
+
+def _validate_confirmar(payload):
+    _require(payload, "cpf", CPF_RE, "Use 11 dígitos numéricos")
+    _require(payload, "nome_condutor")
+    _require(payload, "data_nascimento", DATE_RE, "Formato DD/MM/AAAA")
+    _require(payload, "nome_mae")
+
+
+def _from_agent_properties(payload):
+    try:
+        props = payload["content"]["application/json"]["properties"]
+        if isinstance(props, list):
+            flat = {}
+            for item in props:
+                k = item.get("name")
+                v = item.get("value")
+                if k is not None:
+                    flat[k] = v
+            return flat
+    except Exception:
+        pass
+    return payload
+
+
+def _normalize_keys(payload):
+    if "nome" in payload and "nome_condutor" not in payload:
+        payload["nome_condutor"] = payload["nome"]
+    if "mae" in payload and "nome_mae" not in payload:
+        payload["nome_mae"] = payload["mae"]
+    if "nascimento" in payload and "data_nascimento" not in payload:
+        payload["data_nascimento"] = payload["nascimento"]
+    for k, v in list(payload.items()):
+        if isinstance(v, str):
+            payload[k] = v.strip()
+    return payload
+
+
+def legacy(body):
+    payload = _normalize_keys(_from_agent_properties(json.loads(body)))
+    try:
+        _validate_confirmar(payload)
+        return payload, {}
+    except ValueError as e:
+        return payload, {"erro": str(e)}
+
+
+def compiled(body):
+    return SCHEMA.parse("confirmar-dados", json.loads(body))
+
+
+CASES = {
+    "valido": {"content": {"application/json": {"properties": [
+        {"name": "cpf", "value": "12345678901"},
+        {"name": "nome", "value": " MARIA DA SILVA "},
+        {"name": "nascimento", "value": "01/02/1990"},
+        {"name": "mae", "value": "JOANA DA SILVA"},
+    ]}}},
+    "faltando": {"content": {"application/json": {"properties": [
+        {"name": "cpf", "value": "123"},
+    ]}}},
+}
+
+
+def bench(fn, body, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn(body)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200000)
+    ap.add_argument("--max-ratio", type=float, default=1.3, help="motor / cadeia antiga, no máximo")
+    args = ap.parse_args()
+    ok = True
+    for name, case in CASES.items():
+        body = json.dumps(case)
+        old_us = bench(legacy, body, args.n)
+        new_us = bench(compiled, body, args.n)
+        print(f"{name:10s} antigo={old_us:6.2f}us  schema={new_us:6.2f}us  razão={new_us / old_us:4.2f}x")
+        errors = compiled(body)[1]
+        print(f"{'':10s} erros schema: {errors}")
+        first = next((msg for e in errors.values() for msg in e.values()), None)
+        if first != legacy(body)[1].get("erro"):
+            ok = False
+            print(f"  primeiro erro difere da cadeia antiga: {legacy(body)[1]}")
+        if new_us > old_us * args.max_ratio:
+            ok = False
+            print(f"  motor {new_us / old_us:.2f}x mais lento (máximo {args.max_ratio}x)")
+
+    t0 = time.perf_counter()
+    for _ in range(20):
+        load_schema()
+    print(f"load_schema (cold start): {(time.perf_counter() - t0) / 20 * 1000:.2f} ms")
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Consulta de status em lote (/exibir-dados/lote) vs. uma requisição
+/exibir-dados por condutor, pelo gateway HTTP local (cet_local.start_gateway)
+na frente do backend real.
+
+A consulta ao DETRAN não existe aqui: --lookup-ms soma uma latência fixa a
+cada consulta (_consultar_status do backend), tanto na rota simples quanto
+no lote. A lista tem --items itens, com --invalid-pct inválidos e
+--dup-pct pares repetidos.
+
+- sequencial: um POST /exibir-dados por item válido (keep-alive);
+- lote: um POST /exibir-dados/lote, lido linha a linha (NDJSON em chunks);
+  mede o tempo até a primeira linha com dados e até o resumo.
+
+Uso:
+    python benchmarks/bench_status_lote.py [--items 200] [--lookup-ms 20] [--workers 8]
+
+Sai com código 1 se algum item do lote diferir da resposta da rota simples,
+se os erros por item ou o resumo não baterem com a entrada, ou se o lote não
+for mais rápido que as requisições em sequência.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_local import BACKEND_FILE, load_lambda, start_gateway  # noqa: E402
+
+
+def build_items(n, invalid_pct, dup_pct, seed=7):
+    """Lista de entrada; devolve (itens, índices inválidos)."""
+    rng = random.Random(seed)
+    items, invalid = [], set()
+    for i in range(n):
+        roll = rng.uniform(0, 100)
+        if roll < invalid_pct:
+            items.append({"cpf": f"{i:09d}", "data_nascimento": "1990-02-01"})
+            invalid.add(i)
+        elif roll < invalid_pct + dup_pct and items:
+            items.append(dict(rng.choice([it for j, it in enumerate(items) if j not in invalid] or items)))
+        else:
+            items.append({"cpf": f"{i:011d}", "data_nascimento": "01/02/1990"})
+    return items, invalid
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=200)
+    ap.add_argument("--lookup-ms", type=float, default=20.0, help="latência simulada por consulta ao DETRAN")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--invalid-pct", type=float, default=5.0)
+    ap.add_argument("--dup-pct", type=float, default=10.0)
+    args = ap.parse_args()
+
+    import httpx
+
+    os.environ["LOTE_WORKERS"] = str(args.workers)
+    items, invalid = build_items(args.items, args.invalid_pct, args.dup_pct)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        backend = load_lambda(BACKEND_FILE)
+        lookup = backend._consultar_status
+
+        def slow_lookup(cpf, data_nascimento):
+            time.sleep(args.lookup_ms / 1000.0)
+            return lookup(cpf, data_nascimento)
+        backend._consultar_status = slow_lookup
+        server, base_url = start_gateway(backend)
+
+        with httpx.Client(base_url=base_url, timeout=60.0) as client:
+            client.post("/exibir-dados", json=items[0])  # aquecimento (conexão)
+
+            t0 = time.perf_counter()
+            single = {}
+            for i, item in enumerate(items):
+                if i not in invalid:
+                    single[i] = client.post("/exibir-dados", json=item).json()
+            seq_ms = (time.perf_counter() - t0) * 1000.0
+
+            lines, first_ms = [], None
+            t0 = time.perf_counter()
+            with client.stream("POST", "/exibir-dados/lote", json={"itens": items}) as resp:
+                status, ctype = resp.status_code, resp.headers.get("content-type")
+                for raw in resp.iter_lines():
+                    if not raw:
+                        continue
+                    line = json.loads(raw)
+                    if first_ms is None and line.get("status") == 200:
+                        first_ms = (time.perf_counter() - t0) * 1000.0
+                    lines.append(line)
+            batch_ms = (time.perf_counter() - t0) * 1000.0
+
+            too_big = client.post("/exibir-dados/lote", json={"itens": items * (backend.LOTE_MAX_ITENS // len(items) + 1)})
+    server.shutdown()
+
+    ok = True
+    resumo = lines[-1].get("resumo") if lines else None
+    by_index = {line["indice"]: line for line in lines[:-1]}
+    expected = {"total": len(items), "ok": len(items) - len(invalid), "erros": len(invalid),
+                "consultas": len({(it["cpf"], it["data_nascimento"]) for i, it in enumerate(items) if i not in invalid})}
+    if status != 200 or ctype != backend.NDJSON:
+        ok = False
+        print(f"lote: status {status}, content-type {ctype}")
+    if resumo != expected:
+        ok = False
+        print(f"resumo {resumo}, esperado {expected}")
+    if sorted(by_index) != list(range(len(items))):
+        ok = False
+        print(f"{len(by_index)} linhas de item para {len(items)} itens")
+    for i in range(len(items)):
+        line = by_index.get(i) or {}
+        if i in invalid:
+            if line.get("status") != 422 or line.get("codigo_erro") != "validacao" or not line.get("errors"):
+                ok = False
+                print(f"item {i} inválido sem erro 422: {line}")
+        elif line.get("status") != 200 or line.get("dados") != single[i]:
+            ok = False
+            print(f"item {i} diferente da rota simples: {json.dumps(line, ensure_ascii=False)[:200]}")
+    if too_big.status_code != 422:
+        ok = False
+        print(f"lote acima de LOTE_MAX_ITENS voltou {too_big.status_code}")
+
+    print(f"{len(items)} itens ({len(invalid)} inválidos, {expected['consultas']} pares distintos), "
+          f"consulta simulada de {args.lookup_ms:.0f} ms, {args.workers} workers no lote")
+    print(f"{'':28s}{'total ms':>10s}{'1ª linha ms':>13s}")
+    print(f"{'sequencial (/exibir-dados)':28s}{seq_ms:>10.0f}{'-':>13s}")
+    print(f"{'lote (/exibir-dados/lote)':28s}{batch_ms:>10.0f}{(first_ms or 0):>13.0f}")
+    print(f"speedup: {seq_ms / batch_ms:.1f}x")
+    if batch_ms >= seq_ms:
+        ok = False
+        print("lote não foi mais rápido que as requisições em sequência")
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
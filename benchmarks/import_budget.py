@@ -0,0 +1,155 @@
+"""
+Perfil de cold start (tempo de import por módulo) + orçamento de init.
+
+Cada alvo roda em um processo Python novo:
+- proxy / backend: executa o arquivo da Lambda inteiro (imports + init);
+- app / app_simple: só os imports de topo do arquivo (o corpo é UI do
+  Streamlit e não roda fora do `streamlit run`).
+
+O perfil vem do `-X importtime` (top N por tempo acumulado); o orçamento é
+conferido com a mediana de --repeat execuções sem importtime (que infla os
+números). Sai com código 1 se algum alvo passar do orçamento.
+
+Uso:
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --targets proxy --budget proxy=80 --top 15
+    COLD_START_MODE=lazy python benchmarks/import_budget.py --targets proxy
+"""
+import os
+import ast
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# orçamento padrão (ms) por alvo; sobrescreva com --budget alvo=ms
+# (proxy em modo eager inclui o contexto TLS do httpx; em COLD_START_MODE=lazy fica em ~25ms)
+DEFAULT_BUDGET_MS = {"proxy": 350, "backend": 120, "app": 600, "app_simple": 600}
+
+# separa, no stderr do -X importtime, a partida do interpretador (site, encodings...) do alvo
+MARK = "--- inicio do alvo ---"
+
+TARGETS = {
+    "proxy": ("lambda", "cet-mg-api-invocation.py"),
+    "backend": ("lambda", "cet-mg-backend.py"),
+    "app": ("imports", "app.py"),
+    "app_simple": ("imports", "app_simple.py"),
+}
+
+
+def _top_level_imports(filename):
+    """Comandos import do topo do arquivo (sem os imports tardios dentro de funções)."""
+    with open(os.path.join(ROOT, filename), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    lines = [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(lines)
+
+
+def _script(kind, filename):
+    if kind == "lambda":
+        body = (
+            "import importlib.util\n"
+            f"spec = importlib.util.spec_from_file_location('target', {os.path.join(ROOT, filename)!r})\n"
+            "mod = importlib.util.module_from_spec(spec)\n"
+            "spec.loader.exec_module(mod)\n"
+        )
+    else:
+        body = _top_level_imports(filename) + "\n"
+    return (
+        "import time, sys\n"
+        f"sys.path.insert(0, {ROOT!r})\n"
+        f"sys.stderr.write({MARK!r} + '\\n')\n"
+        "_t0 = time.perf_counter()\n"
+        + body +
+        "print('INIT_MS', (time.perf_counter() - _t0) * 1000.0)\n"
+    )
+
+
+def _env():
+    env = dict(os.environ)
+    # o proxy monta o cliente HTTP no init eager; não há conexão, só o contexto TLS
+    env.setdefault("API_BASE", "https://example.invalid/v1")
+    env.setdefault("FLOW_STORE", "memory")
+    env.setdefault("LOG_ENABLED", "true")
+    return env
+
+
+def _run(script, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", script]
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=ROOT, env=_env())
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "falhou")
+    init_ms = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("INIT_MS "):
+            init_ms = float(line.split()[1])
+    return init_ms, proc.stderr
+
+
+def parse_importtime(stderr):
+    """[(módulo, self_ms, acumulado_ms)] dos módulos de primeiro nível (importados diretamente)."""
+    rows = []
+    _, _, stderr = stderr.partition(MARK)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        self_us, cum_us, name = int(parts[0]), int(parts[1]), parts[2]
+        if name.startswith("  "):
+            continue  # dependência indireta: já está no acumulado do pai
+        rows.append((name.strip(), self_us / 1000.0, cum_us / 1000.0))
+    return rows
+
+
+def profile(target, top):
+    kind, filename = TARGETS[target]
+    _, stderr = _run(_script(kind, filename), importtime=True)
+    rows = sorted(parse_importtime(stderr), key=lambda r: r[2], reverse=True)
+    print(f"\n[{target}] {filename} — imports de primeiro nível por tempo acumulado")
+    print(f"  {'módulo':40s}{'self ms':>10s}{'acum. ms':>10s}")
+    for name, self_ms, cum_ms in rows[:top]:
+        print(f"  {name:40s}{self_ms:>10.1f}{cum_ms:>10.1f}")
+
+
+def measure(target, repeat):
+    kind, filename = TARGETS[target]
+    script = _script(kind, filename)
+    return statistics.median(_run(script)[0] for _ in range(repeat))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Perfil de imports e orçamento de cold start")
+    ap.add_argument("--targets", default=",".join(TARGETS), help="alvos separados por vírgula")
+    ap.add_argument("--budget", default="", help="ex.: proxy=80,backend=100 (ms)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--no-profile", action="store_true", help="só confere o orçamento")
+    args = ap.parse_args()
+
+    budget = dict(DEFAULT_BUDGET_MS)
+    for item in filter(None, args.budget.split(",")):
+        name, _, ms = item.partition("=")
+        budget[name.strip()] = float(ms)
+
+    failures = 0
+    results = []
+    for target in filter(None, (t.strip() for t in args.targets.split(","))):
+        if target not in TARGETS:
+            ap.error(f"alvo desconhecido: {target}")
+        if not args.no_profile:
+            profile(target, args.top)
+        ms = measure(target, args.repeat)
+        ok = ms <= budget[target]
+        failures += not ok
+        results.append((target, ms, budget[target], ok))
+
+    print(f"\n{'alvo':12s}{'init ms':>10s}{'orçamento':>11s}  resultado")
+    for target, ms, limit, ok in results:
+        print(f"{target:12s}{ms:>10.1f}{limit:>11.0f}  {'ok' if ok else 'ESTOUROU'}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
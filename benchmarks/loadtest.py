@@ -0,0 +1,241 @@
+"""
+Teste de carga ponta a ponta do Action Group, sem AWS.
+
+- sobe um servidor HTTP local que faz o papel do API Gateway e chama
+  cet-mg-backend.py:lambda_handler;
+- aponta API_BASE para ele e carrega cet-mg-api-invocation.py;
+- gera eventos de Action Group do Bedrock para as operações do
+  action_group_api_schema.yml e os dispara com taxa/concorrência
+  configuráveis contra o lambda_handler do proxy;
+- reporta vazão e latência p50/p95/p99 por operação e grava JSON para
+  comparar execuções (--compare).
+
+Com --local o proxy roda com API_BASE=local:// (backend chamado no
+processo, sem o gateway HTTP).
+
+Uso:
+    python benchmarks/loadtest.py --concurrency 8 --duration 20 --rate 200 --out run.json
+    python benchmarks/loadtest.py --requests 2000 --compare run.json
+    python benchmarks/loadtest.py --requests 2000 --local --compare run.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_local import BACKEND_FILE, PROXY_FILE, agent_event, load_lambda, start_gateway  # noqa: E402
+
+
+# --------- geração de eventos do Bedrock ---------
+NOMES = ["MARIA DA SILVA", "JOAO PEREIRA", "ANA SOUZA", "CARLOS OLIVEIRA", "JOSÉ SANTOS"]
+
+
+def _cpf(rng):
+    return "".join(str(rng.randint(0, 9)) for _ in range(11))
+
+
+def _data(rng):
+    return f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2004)}"
+
+
+class EventFactory:
+    def __init__(self, paths, seed=None):
+        self.paths = paths  # operationId -> apiPath
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def person(self):
+        with self.lock:
+            return {
+                "cpf": _cpf(self.rng),
+                "nome_condutor": self.rng.choice(NOMES),
+                "data_nascimento": _data(self.rng),
+                "nome_mae": self.rng.choice(NOMES),
+            }
+
+    def build(self, op, person, flow_id=None):
+        sid = str(uuid.uuid4())
+        if op == "confirmar-dados":
+            props = person
+        elif op == "exibir-dados":
+            props = {"cpf": person["cpf"], "data_nascimento": person["data_nascimento"]}
+        else:
+            props = {"flow_id": flow_id or "", "numero_ip_micro": "10.0.0.1"}
+        return agent_event(self.paths[op], op, props, sid)
+
+
+# --------- execução ---------
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def run(proxy, factory, mix, concurrency, rate, duration, total_requests):
+    samples = {op: [] for op in mix}
+    statuses = {op: {} for op in mix}
+    lock = threading.Lock()
+    ops, weights = zip(*mix.items())
+    counter = {"issued": 0}
+    t_start = time.perf_counter()
+    deadline = t_start + duration if duration else None
+    interval = 1.0 / rate if rate else 0.0
+    flows = []
+
+    def next_slot():
+        """Reserva o próximo disparo; None quando o teste acabou."""
+        with lock:
+            if total_requests and counter["issued"] >= total_requests:
+                return None
+            n = counter["issued"]
+            counter["issued"] += 1
+        at = t_start + n * interval
+        # sem --rate o disparo é imediato; o prazo vale pelo relógio, não pelo horário agendado
+        if deadline and max(at, time.perf_counter()) >= deadline:
+            return None
+        return at
+
+    def call(op, event):
+        t0 = time.perf_counter()
+        env = proxy.lambda_handler(event, None)
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        status = env["response"]["httpStatusCode"]
+        with lock:
+            samples[op].append(elapsed)
+            statuses[op][status] = statuses[op].get(status, 0) + 1
+        return env
+
+    def worker(seed):
+        rng = random.Random(seed)
+        while True:
+            at = next_slot()
+            if at is None:
+                return
+            wait = at - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            op = rng.choices(ops, weights)[0]
+            person = factory.person()
+            flow_id = None
+            if op == "exibir-opcoes-pagamento":
+                # a emissão da guia depende de um flow_id vindo de confirmar-dados
+                with lock:
+                    flow_id = rng.choice(flows) if flows else None
+                if flow_id is None:
+                    op = "confirmar-dados"
+            env = call(op, factory.build(op, person, flow_id))
+            if op == "confirmar-dados":
+                fid = env.get("sessionAttributes", {}).get("flow_id")
+                if fid:
+                    with lock:
+                        flows.append(fid)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    wall = time.perf_counter() - t_start
+
+    report = {"wall_s": round(wall, 3), "operations": {}}
+    total = 0
+    for op, values in samples.items():
+        values.sort()
+        total += len(values)
+        report["operations"][op] = {
+            "count": len(values),
+            "throughput_rps": round(len(values) / wall, 2) if wall else None,
+            "p50_ms": _r(percentile(values, 50)),
+            "p95_ms": _r(percentile(values, 95)),
+            "p99_ms": _r(percentile(values, 99)),
+            "max_ms": _r(values[-1] if values else None),
+            "status": {str(k): v for k, v in sorted(statuses[op].items())},
+        }
+    report["total"] = {"count": total, "throughput_rps": round(total / wall, 2) if wall else None}
+    return report
+
+
+def _r(v):
+    return None if v is None else round(v, 3)
+
+
+def print_report(report, baseline=None):
+    print(f"duração: {report['wall_s']}s  total: {report['total']['count']} req  "
+          f"vazão: {report['total']['throughput_rps']} req/s")
+    print(f"{'operação':26s}{'n':>7s}{'req/s':>9s}{'p50':>9s}{'p95':>9s}{'p99':>9s}  status")
+    for op, r in report["operations"].items():
+        print(f"{op:26s}{r['count']:>7d}{r['throughput_rps'] or 0:>9.1f}"
+              f"{r['p50_ms'] or 0:>9.2f}{r['p95_ms'] or 0:>9.2f}{r['p99_ms'] or 0:>9.2f}  {r['status']}")
+        base = (baseline or {}).get("operations", {}).get(op)
+        if base:
+            deltas = []
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+                if base.get(key) and r.get(key) is not None:
+                    deltas.append(f"{key}={(r[key] - base[key]) / base[key] * 100:+.1f}%")
+            print(f"{'':26s}vs. baseline: {' '.join(deltas)}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga local do Action Group CET-MG")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--rate", type=float, default=0, help="req/s totais (0 = sem limite)")
+    ap.add_argument("--duration", type=float, default=10, help="segundos (0 = usar --requests)")
+    ap.add_argument("--requests", type=int, default=0, help="total de requisições (0 = usar --duration)")
+    ap.add_argument("--mix", default="confirmar-dados=1,exibir-opcoes-pagamento=1,exibir-dados=2",
+                    help="pesos por operação")
+    ap.add_argument("--no-cache", action="store_true", help="desliga o cache de status do proxy")
+    ap.add_argument("--local", action="store_true", help="API_BASE=local://: backend no processo, sem HTTP")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--out", help="grava o resultado em JSON")
+    ap.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = ap.parse_args()
+    if not args.duration and not args.requests:
+        ap.error("informe --duration ou --requests")
+
+    server = None
+    if args.local:
+        os.environ["API_BASE"] = "local://"
+    else:
+        backend = load_lambda(BACKEND_FILE)
+        server, base_url = start_gateway(backend)
+        os.environ["API_BASE"] = base_url
+    if args.no_cache:
+        os.environ["STATUS_CACHE_ENABLED"] = "false"
+    proxy = load_lambda(PROXY_FILE)
+
+    from cet_schema import SCHEMA
+    mix = {}
+    for item in args.mix.split(","):
+        op, _, weight = item.partition("=")
+        if op not in SCHEMA.paths:
+            ap.error(f"operação desconhecida no schema: {op}")
+        mix[op] = float(weight or 1)
+
+    factory = EventFactory(SCHEMA.paths, args.seed)
+    report = run(proxy, factory, mix, args.concurrency, args.rate,
+                 args.duration if not args.requests else 0, args.requests)
+    report["config"] = {k: getattr(args, k) for k in ("concurrency", "rate", "duration", "requests", "mix", "no_cache", "local")}
+    if server is not None:
+        server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Paridade do proxy com API_BASE=local:// (backend chamado no processo) e
+com API_BASE=http://... (gateway HTTP local na frente do mesmo backend).
+
+O mesmo roteiro de eventos de Action Group roda nos dois modos: as três
+operações com sucesso, a emissão com o flow_id devolvido pela confirmação,
+erros de validação (422), flow_id desconhecido só com numero_ip_micro (422)
+e com os dados de identificação (200, emitida sem o fluxo), rota fora do
+backend (404) e requestBody em JSON simples / string. Envelope e
+sessionAttributes têm que ser iguais; só o flow_id (uuid gerado a cada
+confirmação) é trocado por um marcador antes de comparar.
+
+Uso:
+    python benchmarks/local_dispatch_parity.py [--repeat 200]
+
+Sai com código 1 se algum envelope diferir entre os modos ou se o status
+de algum passo não for o esperado.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_local import BACKEND_FILE, PROXY_FILE, agent_event, load_lambda, start_gateway  # noqa: E402
+from cet_schema import SCHEMA  # noqa: E402
+
+_UUID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+PERSON = {"cpf": "12345678901", "nome_condutor": "MARIA DA SILVA", "data_nascimento": "01/02/1990",
+          "nome_mae": "JOANA DA SILVA"}
+# dados confirmados que o Agent reenvia na emissão (usados quando o flow_id não é encontrado)
+CONFIRMED = dict(PERSON, codigo_taxa=1, codigo_servico=1, numero_cnh="12345678900",
+                 codigo_municipio_condutor=3106200, ddd_celular=31, numero_celular=999999999,
+                 email="maria@example.com")
+# status esperado por passo do roteiro
+EXPECTED = {"confirmar-dados": 200, "exibir-opcoes-pagamento": 200, "exibir-dados": 200,
+            "confirmar-dados 422": 422, "flow_id desconhecido": 422, "flow_id expirado + dados": 200,
+            "rota 404": 404, "corpo JSON simples": 200, "corpo string": 200}
+
+
+def load_proxy(api_base):
+    os.environ["API_BASE"] = api_base
+    # o proxy lê API_BASE na importação: uma cópia do módulo por modo
+    return load_lambda(PROXY_FILE, fresh=True)
+
+
+def scenario(proxy):
+    """Roda o roteiro; devolve [(nome, envelope normalizado)]."""
+    paths = SCHEMA.paths
+    out = []
+
+    def call(name, event):
+        envelope = proxy.lambda_handler(event, None)
+        out.append((name, json.loads(_UUID.sub("<uuid>", json.dumps(envelope, ensure_ascii=False)))))
+        return envelope
+
+    confirmed = call("confirmar-dados", agent_event(paths["confirmar-dados"], "confirmar-dados", PERSON, "s1"))
+    flow_id = confirmed["sessionAttributes"].get("flow_id", "")
+    call("exibir-opcoes-pagamento", agent_event(paths["exibir-opcoes-pagamento"], "exibir-opcoes-pagamento",
+                                                {"flow_id": flow_id, "numero_ip_micro": "10.0.0.1"}, "s1"))
+    call("exibir-dados", agent_event(paths["exibir-dados"], "exibir-dados",
+                                     {"cpf": PERSON["cpf"], "data_nascimento": PERSON["data_nascimento"]}, "s1"))
+    call("confirmar-dados 422", agent_event(paths["confirmar-dados"], "confirmar-dados", {"cpf": "123"}, "s2"))
+    call("flow_id desconhecido", agent_event(paths["exibir-opcoes-pagamento"], "exibir-opcoes-pagamento",
+                                             {"flow_id": "nao-existe", "numero_ip_micro": "10.0.0.1"}, "s2"))
+    call("flow_id expirado + dados", agent_event(paths["exibir-opcoes-pagamento"], "exibir-opcoes-pagamento",
+                                                 dict(CONFIRMED, flow_id="nao-existe", numero_ip_micro="10.0.0.1"),
+                                                 "s2"))
+    call("rota 404", agent_event("/nao-existe", "nao-existe", {"cpf": PERSON["cpf"]}, "s2"))
+
+    plain = agent_event(paths["exibir-dados"], "exibir-dados", {}, "s3")
+    plain["requestBody"] = {"cpf": PERSON["cpf"], "data_nascimento": PERSON["data_nascimento"]}
+    call("corpo JSON simples", plain)
+    text = dict(plain, requestBody=json.dumps(plain["requestBody"]))
+    call("corpo string", text)
+    return out
+
+
+def timing(proxy, repeat):
+    event = agent_event(SCHEMA.paths["confirmar-dados"], "confirmar-dados", PERSON, "bench")
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proxy.lambda_handler(event, None)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args()
+    # cache de status desligado: a 2ª consulta não pode sair do cache em só um dos modos
+    os.environ["STATUS_CACHE_ENABLED"] = "false"
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        server, base_url = start_gateway(load_lambda(BACKEND_FILE))
+        http_proxy = load_proxy(base_url)
+        local_proxy = load_proxy("local://")
+        http_out = scenario(http_proxy)
+        local_out = scenario(local_proxy)
+        http_ms = timing(http_proxy, args.repeat)
+        local_ms = timing(local_proxy, args.repeat)
+    server.shutdown()
+
+    ok = True
+    for (name, a), (_, b) in zip(http_out, local_out):
+        same = a == b
+        status = a["response"]["httpStatusCode"]
+        ok &= same and status == EXPECTED[name]
+        print(f"{name:26s}{status:>5d}  {'igual' if same else 'DIFERENTE'}"
+              f"{'' if status == EXPECTED[name] else f'  (esperado {EXPECTED[name]})'}")
+        if not same:
+            print(f"  http:  {json.dumps(a, ensure_ascii=False)[:300]}")
+            print(f"  local: {json.dumps(b, ensure_ascii=False)[:300]}")
+    print(f"confirmar-dados p50: http {http_ms:.2f} ms, local:// {local_ms:.2f} ms ({args.repeat} chamadas)")
+
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Memória das sessões ao longo de um "dia" de uso: histórico sem limite
+(antes) vs. SessionMemoryManager (cet_session_memory.py).
+
+Como no app_simple.py, cada mensagem também vai para o histórico do
+processo (CONVERSATION_STORE=memory): sem limite antes, e com o
+InMemoryConversationStore limitado (cap por sessão, expiração por
+ociosidade, máximo de sessões) depois. A memória medida inclui os dois.
+
+A conversa de emissão da DAE é gravada uma vez do FakeAgentRuntimeClient e
+repetida; cada sessão chega num instante do dia, conversa --turns vezes e
+fica ociosa (a aba continua aberta). A sessão descartada pelo gerenciador
+continua com o histórico no session_state até voltar: no fim do dia cada
+aba roda mais uma vez e esvazia o próprio estado em pop_evicted(). O
+relógio é virtual, então o dia inteiro roda em segundos e o resultado é
+determinístico.
+
+Uso:
+    python benchmarks/session_budget.py [--sessions 2000] [--turns 12] [--budget-mb 8]
+
+Sai com código 1 se a memória contabilizada passar do orçamento no fim do
+dia, se a compactação não reduzir a memória medida (tracemalloc) ou se as
+sessões descartadas não liberarem memória ao voltar.
+"""
+import os
+import sys
+import random
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_history import new_message  # noqa: E402
+from cet_session_memory import SessionMemoryManager, estimate_bytes  # noqa: E402
+from cet_conversation_store import InMemoryConversationStore  # noqa: E402
+from bench_render_scheduler import record  # noqa: E402
+
+DAY_S = 12 * 3600
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def conversation():
+    """[(pergunta, resposta)] da conversa de DAE do fake."""
+    return [(text, "".join(part for _, part in events)) for text, events in record(64, 0.0)]
+
+
+def simulate(turns_text, sessions, turns, store, manager=None, clock=None, seed=7):
+    rng = random.Random(seed)
+    arrivals = sorted(rng.uniform(0, DAY_S) for _ in range(sessions))
+    states = []
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    for i, at in enumerate(arrivals):
+        sid = f"session_{i:06d}"
+        state = {"messages": [], "user_data": {}}
+        states.append(state)  # a aba continua aberta: o Streamlit mantém o session_state
+        for t in range(turns):
+            if clock is not None:
+                clock.now = at + t * 20.0
+            question, answer = turns_text[t % len(turns_text)]
+            # cópias: cada sessão recebe strings próprias, como viriam do streaming
+            for message in (new_message("user", question + " " * (i % 3)),
+                            new_message("assistant", answer + " " * (i % 3))):
+                state["messages"].append(message)
+                store.append(sid, message)
+            state["user_data"]["ultima_resposta"] = answer[: 200 + i % 5]
+            if manager is not None:
+                manager.track(sid, state["messages"], state["user_data"])
+    current, peak = tracemalloc.get_traced_memory()
+    returned = current
+    if manager is not None:
+        # as abas voltam: cada sessão descartada esvazia o próprio estado
+        for i, state in enumerate(states):
+            manager.pop_evicted(f"session_{i:06d}", state["messages"], state["user_data"])
+        returned, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return states, current - base, peak - base, returned - base
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=2000)
+    ap.add_argument("--turns", type=int, default=12, help="perguntas por sessão")
+    ap.add_argument("--budget-mb", type=float, default=8.0)
+    ap.add_argument("--history-cap", type=int, default=200)
+    ap.add_argument("--compact-after", type=int, default=6)
+    ap.add_argument("--idle-min-s", type=float, default=600.0)
+    ap.add_argument("--idle-ttl-s", type=float, default=3 * 3600.0)
+    ap.add_argument("--store-max-sessions", type=int, default=1000)
+    args = ap.parse_args()
+
+    turns_text = conversation()
+
+    unbounded = InMemoryConversationStore(cap=0, ttl_s=float("inf"), max_sessions=10 ** 9)
+    states, before_bytes, before_peak, _ = simulate(turns_text, args.sessions, args.turns, unbounded)
+    estimated = sum(estimate_bytes(s["messages"]) + estimate_bytes(s["user_data"]) for s in states)
+    del states, unbounded
+
+    clock = VirtualClock()
+    manager = SessionMemoryManager(budget_mb=args.budget_mb, history_cap=args.history_cap,
+                                   compact_after=args.compact_after, idle_min_s=args.idle_min_s,
+                                   idle_ttl_s=args.idle_ttl_s, clock=clock)
+    store = InMemoryConversationStore(cap=args.history_cap, ttl_s=args.idle_ttl_s,
+                                      max_sessions=args.store_max_sessions, clock=clock)
+    states, after_bytes, after_peak, returned_bytes = simulate(turns_text, args.sessions, args.turns, store,
+                                                               manager, clock)
+    stats = manager.stats()
+
+    mib = 1024.0 * 1024.0
+    print(f"{args.sessions} sessões x {args.turns} turnos em {DAY_S // 3600} h (relógio virtual)")
+    print(f"{'estratégia':14s}{'memória MiB':>13s}{'pico MiB':>10s}{'KiB/sessão':>12s}")
+    print(f"{'sem limite':14s}{before_bytes / mib:>13.2f}{before_peak / mib:>10.2f}"
+          f"{before_bytes / 1024.0 / args.sessions:>12.1f}")
+    print(f"{'gerenciado':14s}{after_bytes / mib:>13.2f}{after_peak / mib:>10.2f}"
+          f"{after_bytes / 1024.0 / args.sessions:>12.1f}")
+    print(f"{'abas de volta':14s}{returned_bytes / mib:>13.2f}{after_peak / mib:>10.2f}"
+          f"{returned_bytes / 1024.0 / args.sessions:>12.1f}")
+    print(f"estimativa sem limite: {estimated / mib:.2f} MiB; contabilizado gerenciado: "
+          f"{stats['bytes'] / mib:.2f}/{stats['budget_bytes'] / mib:.0f} MiB em {stats['sessions']} sessões")
+    print(f"evictions={stats['evictions']} expiradas={stats['expired']} compactadas={stats['compacted']} "
+          f"descartadas={stats['dropped']}")
+
+    print(f"histórico do processo: {store.sessions()} sessões, expiradas={store.stats['expired']} "
+          f"descartadas={store.stats['dropped']}")
+
+    ok = (stats["bytes"] <= stats["budget_bytes"] and after_bytes < before_bytes and returned_bytes < after_bytes
+          and store.sessions() <= args.store_max_sessions)
+    if not ok:
+        print("FALHOU: orçamento estourado, histórico do processo sem limite ou sem redução de memória")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
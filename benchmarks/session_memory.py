@@ -0,0 +1,112 @@
+"""
+Memória e latência de início por sessão do app.py: recursos por sessão
+(antes) vs. recursos compartilhados pelo processo (depois).
+
+- antes: cada sessão Streamlit criava um BedrockAgent com CETBackend próprio,
+  boto3.client('bedrock-agent-runtime') próprio e relia o system prompt;
+- depois: cliente, prompt e backend vêm de st.cache_resource e a sessão
+  guarda só o próprio estado (messages, user_data, session_id).
+
+O app não é importável fora do `streamlit run`, então o script reproduz as
+duas estratégias com os mesmos objetos (boto3, cet_schema, prompt). Não
+precisa de credenciais: criar o cliente não chama a AWS.
+
+Uso:
+    python benchmarks/session_memory.py [--sessions 200]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import boto3  # noqa: E402
+from botocore.config import Config  # noqa: E402
+from cet_schema import SCHEMA  # noqa: E402
+
+REGION = os.environ.get("AWS_REGION", "sa-east-1")
+PROMPT_FILE = os.path.join(ROOT, "system_prompt_agent.txt")
+
+
+class Backend:
+    """Equivalente ao CETBackend do app (só referencia o schema compilado)."""
+
+    def __init__(self):
+        self.schema = SCHEMA
+
+
+def _read_prompt():
+    with open(PROMPT_FILE, encoding="utf-8") as f:
+        return f.read()
+
+
+def _session_state(i):
+    return {"messages": [], "user_data": {}, "session_id": f"session_{i}"}
+
+
+def per_session(i):
+    """Antes: tudo construído por sessão."""
+    state = _session_state(i)
+    state["agent"] = {
+        "backend": Backend(),
+        "system_prompt": _read_prompt(),
+        "bedrock_client": boto3.client("bedrock-agent-runtime", region_name=REGION),
+    }
+    return state
+
+
+_shared = {}
+
+
+def shared(i):
+    """Depois: recursos do processo criados uma vez; a sessão só tem o próprio estado."""
+    if not _shared:
+        cfg = Config(max_pool_connections=50, tcp_keepalive=True,
+                     retries={"max_attempts": 4, "mode": "standard"})
+        _shared["agent"] = {
+            "backend": Backend(),
+            "system_prompt": _read_prompt(),
+            "bedrock_client": boto3.client("bedrock-agent-runtime", region_name=REGION, config=cfg),
+        }
+    return _session_state(i)
+
+
+def measure(factory, sessions):
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    kept = []
+    starts = []
+    for i in range(sessions):
+        t0 = time.perf_counter()
+        kept.append(factory(i))
+        starts.append((time.perf_counter() - t0) * 1000.0)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    starts.sort()
+    return {
+        "kib_per_session": (current - base) / 1024.0 / sessions,
+        "total_mib": (current - base) / 1024.0 / 1024.0,
+        "median_start_ms": starts[len(starts) // 2],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=200)
+    args = ap.parse_args()
+
+    # aquece imports/caches do botocore (loader de modelos) para as duas medições partirem do mesmo ponto
+    boto3.client("bedrock-agent-runtime", region_name=REGION)
+
+    print(f"{args.sessions} sessões simultâneas")
+    print(f"{'estratégia':14s}{'KiB/sessão':>12s}{'total MiB':>11s}{'início p50 ms':>15s}")
+    for name, factory in (("por sessão", per_session), ("compartilhado", shared)):
+        r = measure(factory, args.sessions)
+        print(f"{name:14s}{r['kib_per_session']:>12.1f}{r['total_mib']:>11.2f}{r['median_start_ms']:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Single-flight do proxy (cet_cache.SingleFlight) sob concorrência: threads
+disparam ao mesmo tempo (threading.Barrier) requisições contra um backend
+lento (stub na frente do backend real, --backend-ms por chamada).
+
+- --threads consultas exibir-dados idênticas (espaços diferentes nas
+  pontas dos valores, como vêm do Agent): uma chamada ao backend, todas as
+  respostas iguais;
+- --threads confirmações idênticas (envio duplicado): um único flow_id;
+- --distinct payloads diferentes, --threads / --distinct cópias de cada:
+  uma chamada por payload, nada misturado entre eles;
+- o mesmo lote com SINGLE_FLIGHT_ENABLED desligado, para comparar.
+
+Uso:
+    python benchmarks/singleflight_concurrency.py [--threads 32] [--distinct 8] [--backend-ms 200]
+
+Sai com código 1 se requisições idênticas não forem agrupadas, se payloads
+diferentes forem agrupados ou se alguma thread receber a resposta de outro
+payload.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cet_local import BACKEND_FILE, PROXY_FILE, agent_event, load_lambda, start_gateway  # noqa: E402
+from cet_schema import SCHEMA  # noqa: E402
+
+
+class SlowBackend:
+    """Backend real atrás de um atraso fixo; conta as chamadas por rota."""
+
+    def __init__(self, backend, delay_ms):
+        self.backend = backend
+        self.delay = delay_ms / 1000.0
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def lambda_handler(self, event, context):
+        with self.lock:
+            self.calls[event["path"]] = self.calls.get(event["path"], 0) + 1
+        time.sleep(self.delay)
+        return self.backend.lambda_handler(event, context)
+
+    def reset(self):
+        with self.lock:
+            total = sum(self.calls.values())
+            self.calls = {}
+        return total
+
+
+def burst(proxy, events):
+    """Dispara todos os eventos juntos; devolve (envelopes na ordem, duração ms)."""
+    barrier = threading.Barrier(len(events))
+    out = [None] * len(events)
+
+    def worker(i):
+        barrier.wait()
+        out[i] = proxy.lambda_handler(events[i], None)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(events))]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+def status(cpf, pad=""):
+    return agent_event(SCHEMA.paths["exibir-dados"], "exibir-dados",
+                       {"cpf": pad + cpf + pad, "data_nascimento": "01/02/1990"}, f"s-{cpf}-{len(pad)}")
+
+
+def confirm(i):
+    return agent_event(SCHEMA.paths["confirmar-dados"], "confirmar-dados",
+                       {"cpf": "12345678901", "nome_condutor": "MARIA DA SILVA", "data_nascimento": "01/02/1990",
+                        "nome_mae": "JOANA DA SILVA"}, f"dup-{i}")
+
+
+def body(envelope):
+    return json.loads(envelope["response"]["responseBody"]["application/json"]["body"])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=32)
+    ap.add_argument("--distinct", type=int, default=8)
+    ap.add_argument("--backend-ms", type=float, default=200.0)
+    args = ap.parse_args()
+
+    os.environ["STATUS_CACHE_ENABLED"] = "false"  # sem cache: o que agrupa é só o single-flight
+    os.environ["HEDGE_ENABLED"] = "false"
+    ok = True
+    rows = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        slow = SlowBackend(load_lambda(BACKEND_FILE), args.backend_ms)
+        server, base_url = start_gateway(slow)
+        os.environ["API_BASE"] = base_url
+        proxy = load_lambda(PROXY_FILE)
+
+        cpfs = [f"{i:011d}" for i in range(1, args.distinct + 1)]
+        mixed = [status(cpfs[i % args.distinct]) for i in range(args.threads)]
+        for enabled in (False, True):
+            proxy.SINGLE_FLIGHT_ENABLED = enabled
+            label = "ligado" if enabled else "desligado"
+
+            same, ms = burst(proxy, [status("12345678901", " " * (i % 3)) for i in range(args.threads)])
+            rows.append((label, "exibir-dados idênticas", slow.reset(), ms))
+            if enabled and (rows[-1][2] != 1 or len({json.dumps(body(e), sort_keys=True) for e in same}) != 1):
+                ok = False
+                print(f"idênticas: {rows[-1][2]} chamadas ao backend")
+
+            dups, ms = burst(proxy, [confirm(i) for i in range(args.threads)])
+            flows = {e["sessionAttributes"].get("flow_id") for e in dups}
+            rows.append((label, "confirmar-dados duplicado", slow.reset(), ms))
+            if enabled and len(flows) != 1:
+                ok = False
+                print(f"envio duplicado gerou {len(flows)} flow_ids")
+
+            envelopes, ms = burst(proxy, mixed)
+            rows.append((label, f"{args.distinct} payloads diferentes", slow.reset(), ms))
+            for event, envelope in zip(mixed, envelopes):
+                sent = event["requestBody"]["content"]["application/json"]["properties"][0]["value"]
+                if body(envelope).get("cpf") != sent:
+                    ok = False
+                    print(f"resposta trocada: pediu {sent}, recebeu {body(envelope).get('cpf')}")
+            if enabled and rows[-1][2] != args.distinct:
+                ok = False
+                print(f"payloads diferentes: {rows[-1][2]} chamadas ao backend (esperado {args.distinct})")
+        stats = proxy.get_singleflight_stats()
+    server.shutdown()
+
+    print(f"{args.threads} threads simultâneas, backend com {args.backend_ms:.0f} ms por chamada")
+    print(f"{'single-flight':15s}{'cenário':30s}{'backend':>9s}{'lote ms':>10s}")
+    for label, name, calls, ms in rows:
+        print(f"{label:15s}{name:30s}{calls:>9d}{ms:>10.0f}")
+    print(f"agrupadas={stats['coalesced']} líderes={stats['leaders']} máx. esperando={stats['max_waiters']} "
+          f"erros={stats['errors']}")
+    if not ok:
+        print("FALHOU")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
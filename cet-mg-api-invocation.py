@@ -1,83 +1,201 @@
+import time
+_INIT_STARTED = time.perf_counter()  # início do init (imports inclusos), vira init_ms no cold start
+
 import os
 import json
-import httpx
 import logging
+import threading
+import cet_metrics
+from cet_metrics import phase
+from cet_logging import log_invocation, get_log_stats, get_logger
+from cet_cache import SingleFlight, TTLCache, hash_key
+from cet_resilience import RETRY_STATUSES, CircuitOpenError, Deadline, DeadlineExceeded, ResilientCaller
+# leitura do requestBody do Agent e promoção de sessionAttributes (compartilhado com o return of control)
+from cet_actions import (flat_body as _flat_body, pick as _pick, guess_operation as _guess_operation,
+                         extract_session as _extract_session, invoke_backend as _invoke_backend)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# eager: importa httpx e monta o cliente no init da Lambda (fase com CPU cheia, antes da 1ª requisição)
+# lazy: init mínimo; httpx e cliente só na primeira chamada que precisar do backend
+COLD_START_MODE = os.environ.get("COLD_START_MODE", "eager").lower()
+
+httpx = None  # importado sob demanda por _load_httpx()
+
+def _load_httpx():
+    """Importa o httpx na primeira necessidade (~90ms de import com certifi/ssl)."""
+    global httpx
+    if httpx is None:
+        import httpx as _httpx
+        httpx = _httpx
+    return httpx
+
 API_BASE = os.environ.get("API_BASE")  # ex: https://<api-id>.execute-api.us-east-1.amazonaws.com/v1
+# API_BASE=local:// (ou local://<arquivo>.py): backend empacotado junto com esta Lambda; o evento do
+# API Gateway é montado aqui e o lambda_handler do backend roda no mesmo processo, sem HTTP
+LOCAL_SCHEME = "local://"
+LOCAL_DISPATCH = bool(API_BASE) and API_BASE.startswith(LOCAL_SCHEME)
+LOCAL_BACKEND_FILE = (API_BASE[len(LOCAL_SCHEME):] if LOCAL_DISPATCH else "") or "cet-mg-backend.py"
 TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "10"))
+# repassa o corpo JSON do backend sem decodificar/recodificar
+PASSTHROUGH = os.environ.get("PASSTHROUGH", "true").lower() in ("1", "true", "yes")
+
+# Pool de conexões reaproveitado entre invocações "quentes" da Lambda
+HTTP2 = os.environ.get("HTTP2", "true").lower() in ("1", "true", "yes")
+POOL_MAX_CONNECTIONS = int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS", "10"))
+POOL_MAX_KEEPALIVE = int(os.environ.get("HTTP_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_POOL_KEEPALIVE_EXPIRY", "60"))
+
+_client = None
+_client_lock = threading.Lock()
+POOL_STATS = {"requests": 0, "pool_hits": 0, "new_connections": 0, "clients_created": 0}
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
 
-def _pick(d, *keys, default=None):
-    for k in keys:
-        if isinstance(d, dict) and k in d:
-            return d[k]
-    return default
-
-def _guess_operation(event):
-    op = event.get("operationId")
-    if op:
-        return op
-    path = _pick(event, "path", "apiPath", default="") or ""
-    if "/confirmar-dados" in path: return "confirmar-dados"
-    if "/exibir-opcoes-pagamento" in path: return "exibir-opcoes-pagamento"
-    if "/exibir-dados" in path: return "exibir-dados"
-    return "desconhecido"
-
-def _extract_session(op, status_code, content_type, raw_body):
+def _get_client():
     """
-    Lê a resposta JSON do backend e promove campos úteis para sessionAttributes.
-    Importante: Bedrock exige string->string.
+    Retorna o httpx.Client do módulo, criando-o na primeira chamada.
+    O cliente sobrevive entre invocações, então o handshake TCP+TLS com o
+    API Gateway só é pago quando o pool não tem conexão ociosa válida.
     """
-    sess = {}
-    if not (isinstance(content_type, str) and content_type.startswith("application/json")):
-        return sess
-    try:
-        data = json.loads(raw_body) if isinstance(raw_body, str) else raw_body
-    except Exception:
-        return sess
-    if status_code != 200:
-        # ainda assim podemos salvar algo de erro, se quiser
-        return sess
-
-    if op == "confirmar-dados":
-        s02 = (data.get("retornoNSDGXS02") or {})
-        sess.update({
-            "flow_id": data.get("flow_id"),
-            "cpf": s02.get("cpf"),
-            "codigo_taxa": s02.get("codigo_taxa"),
-            "codigo_servico": s02.get("codigo_servico"),
-            "numero_cnh": s02.get("numero_cnh"),
-            "ddd_celular": s02.get("ddd_celular"),
-            "numero_celular": s02.get("numero_celular"),
-            "email": s02.get("email"),
-            "codigo_municipio_condutor": s02.get("codigo_municipio_condutor"),
-            "nome_municipio_condutor": s02.get("nome_municipio_condutor"),
-            "sigla_uf_municipio_condutor": s02.get("sigla_uf_municipio_condutor"),
-        })
-    elif op == "exibir-opcoes-pagamento":
-        r414 = (data.get("retornoNsdgx414") or {})
-        sess.update({
-            "dae_linha_digitavel": r414.get("linha_digitavel"),
-            "dae_codigo_barras_44": r414.get("codigo_barras"),
-            "dae_valor": r414.get("valor_taxa"),
-            "dae_vencimento": r414.get("data_vencimento"),
-            "dae_municipio_desc": r414.get("descricao_municipio"),
-            "dae_municipio_ibge": r414.get("codigo_municipio_ibge"),
-            "dae_mes_ano": r414.get("mes_ano_dae"),
-        })
-    elif op == "exibir-dados":
-        sess.update({
-            "status_descricao_etapa": data.get("descricao_etapa"),
-            "status_situacao_cnh": data.get("situacao_cnh"),
-            "status_data_hora": data.get("data_hora_status"),
-        })
-
-    # Bedrock: somente strings
-    return {k: str(v) for k, v in sess.items() if v is not None}
+    global _client
+    if _client is None or _client.is_closed:
+        with _client_lock:
+            if _client is None or _client.is_closed:
+                _load_httpx()
+                limits = httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                )
+                _client = httpx.Client(
+                    timeout=TIMEOUT,
+                    limits=limits,
+                    http2=HTTP2 and _http2_available(),
+                )
+                POOL_STATS["clients_created"] += 1
+    return _client
+
+_backend = None
+
+def _local_backend():
+    """Módulo do backend co-localizado (API_BASE=local://), carregado uma vez por processo."""
+    global _backend
+    if _backend is None:
+        with _client_lock:
+            if _backend is None:
+                from cet_local import load_lambda
+                _backend = load_lambda(LOCAL_BACKEND_FILE)
+    return _backend
+
+def _reset_client():
+    """Fecha o cliente atual; o próximo _get_client() cria um novo pool."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception:
+                logging.exception("Erro ao fechar cliente HTTP")
+        _client = None
+
+def _pool_trace():
+    """
+    Cria um callback de trace do httpcore que marca se a requisição precisou
+    abrir uma conexão TCP nova (miss) ou reaproveitou uma do pool (hit).
+    """
+    state = {"connected": False}
+    def trace(event_name, info):
+        if event_name == "connection.connect_tcp.started":
+            state["connected"] = True
+    return state, trace
+
+def _record_pool_usage(state):
+    POOL_STATS["requests"] += 1
+    if state["connected"]:
+        POOL_STATS["new_connections"] += 1
+    else:
+        POOL_STATS["pool_hits"] += 1
+
+def get_pool_stats():
+    return dict(POOL_STATS)
+
+# Cache de consultas de status (exibir-dados): o status muda em horas,
+# então repetições do "qual o status?" na mesma conversa são servidas localmente
+STATUS_CACHE_ENABLED = os.environ.get("STATUS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+STATUS_CACHE = TTLCache(
+    ttl=float(os.environ.get("STATUS_CACHE_TTL", "300")),
+    max_entries=int(os.environ.get("STATUS_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.environ.get("STATUS_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+)
+
+def _status_cache_key(body):
+    data = _flat_body(body)
+    cpf = data.get("cpf")
+    nasc = data.get("data_nascimento") or data.get("nascimento")
+    if not cpf or not nasc:
+        return None
+    return hash_key(cpf, nasc)
+
+def invalidate_status_cache(cpf=None, data_nascimento=None):
+    """Remove a consulta de um condutor do cache; sem argumentos, limpa tudo."""
+    if cpf is None and data_nascimento is None:
+        STATUS_CACHE.clear()
+        return True
+    return STATUS_CACHE.invalidate(hash_key(cpf, data_nascimento))
+
+def get_cache_stats():
+    return STATUS_CACHE.get_stats()
+
+# prazo pelo tempo restante da Lambda, novas tentativas/hedge nas rotas idempotentes e
+# circuit breaker por rota (RETRY_*, HEDGE_*, BREAKER_* em cet_resilience.py)
+RESILIENCE = ResilientCaller()
+
+def get_resilience_stats():
+    return RESILIENCE.get_stats()
+
+# Single-flight: requisições idênticas ao mesmo tempo (retry do Bedrock, envio duplicado)
+# dividem uma chamada ao backend e o resultado dela
+SINGLE_FLIGHT_ENABLED = os.environ.get("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+SINGLE_FLIGHT_OPERATIONS = frozenset(
+    op.strip() for op in os.environ.get("SINGLE_FLIGHT_OPERATIONS", "exibir-dados,confirmar-dados").split(",")
+    if op.strip()
+)
+SINGLE_FLIGHT = SingleFlight()
+
+def _flight_key(op, method, path, body, qs):
+    """Operação + payload normalizado (achatado, chaves ordenadas, strings sem espaços nas pontas)."""
+    data = {k: v.strip() if isinstance(v, str) else v for k, v in _flat_body(body).items()}
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    query = json.dumps(qs, sort_keys=True, default=str) if qs else ""
+    return hash_key(op, method, path, payload, query)
+
+def get_singleflight_stats():
+    return SINGLE_FLIGHT.get_stats()
 
 def lambda_handler(event, context):
+    op = _guess_operation(event)
+    with cet_metrics.start_timer() as timer:
+        envelope = _invoke(event, context)
+    status = envelope["response"]["httpStatusCode"]
+    metrics = timer.as_metrics()
+    metrics.update(cet_metrics.cold_start_metrics("cet-mg-api-invocation"))
+    cet_metrics.emit_emf(
+        "cet-mg-api-invocation", {"Route": op, "Status": status}, metrics,
+        {"pool": get_pool_stats(), "cache": get_cache_stats(), "log": get_log_stats(),
+         "resilience": get_resilience_stats(), "singleflight": get_singleflight_stats(),
+         "ColdStart": "init_ms" in metrics}
+    )
+    log_invocation("cet-mg-api-invocation", op, status, event, envelope, timer.total_ms(), context=context)
+    return envelope
+
+def _invoke(event, context):
     method = (_pick(event, "httpMethod", "method", default="POST") or "POST").upper()
     path   = _pick(event, "path", "apiPath", default="/") or "/"
     body   = _pick(event, "requestBody", "body", default=None)
@@ -88,56 +206,126 @@ def lambda_handler(event, context):
     if not API_BASE:
         return _error_envelope(event, 500, {"message":"API_BASE não configurado"})
 
-    url = f"{API_BASE}{path}"
     hdrs.setdefault("Content-Type", "application/json")
 
+    cache_key = _status_cache_key(body) if (STATUS_CACHE_ENABLED and op == "exibir-dados") else None
+    if cache_key:
+        cached = STATUS_CACHE.get(cache_key)
+        if cached is not None:
+            status_code, ctype, text = cached
+            with phase("envelope"):
+                return _build_envelope(event, op, method, path, status_code, ctype, text)
+
+    deadline = Deadline.from_context(context, TIMEOUT)
+
+    def fetch():
+        if LOCAL_DISPATCH:
+            return _invoke_backend(_local_backend(), method, path, body, qs, hdrs)
+        url = f"{API_BASE}{path}"
+        return RESILIENCE.call(
+            op, lambda timeout: _http_request(method, url, body, qs, hdrs, timeout), deadline,
+            retryable=lambda result: result[0] in RETRY_STATUSES,
+        )
+
     try:
-        # se for dict/list, manda como JSON; se vier string, vai como content
-        json_body = body if isinstance(body, (dict, list)) else None
-        content_body = None if isinstance(body, (dict, list)) else body
+        flight_key = (_flight_key(op, method, path, body, qs)
+                      if SINGLE_FLIGHT_ENABLED and op in SINGLE_FLIGHT_OPERATIONS else None)
+        with phase("upstream"):
+            if flight_key:
+                # quem chega com uma chamada idêntica em andamento espera por ela (até o próprio prazo)
+                (status_code, ctype, text), shared = SINGLE_FLIGHT.do(flight_key, fetch, deadline.remaining())
+            else:
+                (status_code, ctype, text), shared = fetch(), False
+
+        # cache/invalidação só por quem fez a chamada
+        if status_code == 200 and not shared:
+            if cache_key:
+                STATUS_CACHE.set(cache_key, (status_code, ctype, text), len(text.encode("utf-8")))
+            elif op == "exibir-opcoes-pagamento" and STATUS_CACHE_ENABLED:
+                # nova guia emitida: o status em cache desse condutor ficou velho
+                key = _status_cache_key(body)
+                if key:
+                    STATUS_CACHE.invalidate(key)
+
+        with phase("envelope"):
+            return _build_envelope(event, op, method, path, status_code, ctype, text)
+
+    except CircuitOpenError as e:
+        # falha rápida: o Agent recebe o erro sem esperar o timeout de um backend que já está falhando
+        return _error_envelope(event, 503, {"message": f"Serviço temporariamente indisponível ({e})"})
+    except Exception as e:
+        # prazo da chamada, timeout do httpx ou espera por chamada idêntica (single-flight)
+        timed_out = isinstance(e, (DeadlineExceeded, TimeoutError))
+        if timed_out or (httpx is not None and isinstance(e, httpx.TimeoutException)):
+            logging.warning("Prazo esgotado chamando o backend: %s", e)
+            return _error_envelope(event, 504, {"message": f"Tempo esgotado ao chamar backend: {e}"})
+        logging.exception("Erro na chamada ao backend")
+        return _error_envelope(event, 502, {"message": f"Falha ao chamar backend: {e}"})
+
+def _http_request(method, url, body, qs, hdrs, timeout=TIMEOUT):
+    """Uma requisição ao API Gateway pelo pool do módulo; devolve (status, content-type, texto)."""
+    # se for dict/list, manda como JSON; se vier string, vai como content
+    json_body = body if isinstance(body, (dict, list)) else None
+    content_body = None if isinstance(body, (dict, list)) else body
 
-        with httpx.Client(timeout=TIMEOUT) as client:
-            resp = client.request(
-                method, url,
-                params=qs,
-                headers=hdrs,
-                json=json_body,
-                content=content_body
-            )
+    client = _get_client()
+    trace_state, trace = _pool_trace()
+    try:
+        resp = client.request(
+            method, url,
+            params=qs,
+            headers=hdrs,
+            json=json_body,
+            content=content_body,
+            timeout=timeout,
+            extensions={"trace": trace}
+        )
+    except httpx.TimeoutException:
+        # lentidão não invalida o pool (e um hedge pode estar usando o mesmo cliente)
+        raise
+    except httpx.TransportError:
+        # conexão do pool pode ter sido derrubada pelo servidor; recomeça limpo
+        _reset_client()
+        raise
+    finally:
+        _record_pool_usage(trace_state)
 
-        ctype = resp.headers.get("content-type", "application/json").split(";")[0].strip() or "application/json"
+    ctype = resp.headers.get("content-type", "application/json").split(";")[0].strip() or "application/json"
+    return resp.status_code, ctype, resp.text
 
+def _build_envelope(event, op, method, path, status_code, ctype, text):
+    if PASSTHROUGH and ctype.startswith("application/json"):
+        # corpo do backend vai como veio; sessionAttributes fazem o parse só se precisarem
+        payload_str = text
+        payload_raw = text
+    else:
         # preservar corpo como string JSON (ou texto)
         try:
-            parsed = resp.json()
+            parsed = json.loads(text)
             payload_str = json.dumps(parsed, ensure_ascii=False)
             payload_raw = parsed
         except Exception:
-            payload_str = resp.text
+            payload_str = text
             payload_raw = payload_str
 
-        session_attrs = _extract_session(op, resp.status_code, ctype, payload_raw)
-
-        # === Envelope no formato solicitado ===
-        return {
-            "messageVersion": "1.0",
-            "response": {
-                "actionGroup": event.get("actionGroup") or "",
-                "apiPath": event.get("apiPath") or path,
-                "httpMethod": method,
-                "httpStatusCode": resp.status_code,
-                "responseBody": {
-                    "application/json": {
-                        "body": payload_str
-                    }
-                }
-            },
-            "sessionAttributes": session_attrs
-        }
+    session_attrs = _extract_session(op, status_code, ctype, payload_raw)
 
-    except Exception as e:
-        logging.exception("Erro na invocação HTTP")
-        return _error_envelope(event, 502, {"message": f"Falha ao chamar backend: {e}"})
+    # === Envelope no formato solicitado ===
+    return {
+        "messageVersion": "1.0",
+        "response": {
+            "actionGroup": event.get("actionGroup") or "",
+            "apiPath": event.get("apiPath") or path,
+            "httpMethod": method,
+            "httpStatusCode": status_code,
+            "responseBody": {
+                "application/json": {
+                    "body": payload_str
+                }
+            }
+        },
+        "sessionAttributes": session_attrs
+    }
 
 def _error_envelope(event, status_code: int, body: dict):
     """Mantém o mesmo formato também para erros (útil no Test chat)."""
@@ -159,3 +347,15 @@ def _error_envelope(event, status_code: int, body: dict):
             "last_error_code": str(status_code)
         }
     }
+
+def _init():
+    """Pré-aquecimento do init: httpx + cliente (contexto TLS) ou backend local, e a fila de log."""
+    if LOCAL_DISPATCH:
+        _local_backend()
+    elif API_BASE:
+        _get_client()
+    get_logger()
+
+if COLD_START_MODE == "eager":
+    _init()
+cet_metrics.record_init("cet-mg-api-invocation", _INIT_STARTED)
@@ -1,14 +1,45 @@
+import time
+_INIT_STARTED = time.perf_counter()  # início do init (imports inclusos), vira init_ms no cold start
+
+import os
 import json
-import re
+import threading
+import cet_metrics
+from cet_metrics import phase
+from cet_logging import log_invocation, get_logger
+from cet_flow_store import create_flow_store, merge_flow
+from cet_schema import SCHEMA
+
+# estado do fluxo de 2ª via: confirmar-dados grava, exibir-opcoes-pagamento lê
+FLOWS = create_flow_store()
 
-CPF_RE = re.compile(r"^\d{11}$")
-DATE_RE = re.compile(r"^\d{2}/\d{2}/\d{4}$")
+# consulta em lote (/exibir-dados/lote): tamanho máximo e consultas simultâneas
+LOTE_MAX_ITENS = int(os.environ.get("LOTE_MAX_ITENS", "500"))
+LOTE_WORKERS = int(os.environ.get("LOTE_WORKERS", "8"))
+NDJSON = "application/x-ndjson"
 
 def _resp(status: int, body: dict):
+    with phase("serialize"):
+        return {
+            "statusCode": status,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(body, ensure_ascii=False)
+        }
+
+def _resp_template(status: int, template, **values):
+    with phase("serialize"):
+        return {
+            "statusCode": status,
+            "headers": {"Content-Type": "application/json"},
+            "body": template.render(**values)
+        }
+
+def _resp_raw(status: int, body, content_type: str = "application/json"):
+    """Corpo já serializado (texto de template, NDJSON do lote)."""
     return {
         "statusCode": status,
-        "headers": {"Content-Type": "application/json"},
-        "body": json.dumps(body, ensure_ascii=False)
+        "headers": {"Content-Type": content_type},
+        "body": body
     }
 
 def _parse_json(body_str: str):
@@ -17,104 +48,20 @@ def _parse_json(body_str: str):
     except Exception:
         return {}
 
-def _err_422(msg: str, field: str = None):
+def _validation_error(errors: dict):
+    return _resp(422, {"message": "Ocorreu um erro na validação dos dados", "code": 422, "errors": errors})
+
+def _err_422(msg: str, field: str = None, kind: str = "_required"):
     errors = {}
     if field:
-        errors[field] = {"_required": msg}
+        errors[field] = {kind: msg}
     else:
         errors["input"] = {"_invalid": msg}
-    return _resp(422, {"message": "Ocorreu um erro na validação dos dados", "code": 422, "errors": errors})
-
-# --------- validações simples ---------
-def _require(payload, field, pattern: re.Pattern = None, fmt_desc: str = ""):
-    v = payload.get(field)
-    if v is None or (isinstance(v, str) and not v.strip()):
-        raise ValueError(f'O campo "{field}" é obrigatório')
-    if pattern and isinstance(v, str) and not pattern.match(v):
-        raise ValueError(f'Campo "{field}" inválido. {fmt_desc}'.strip())
-    return v
-
-def _validate_confirmar(payload):
-    _require(payload, "cpf", CPF_RE, "Use 11 dígitos numéricos")
-    _require(payload, "nome_condutor")
-    _require(payload, "data_nascimento", DATE_RE, "Formato DD/MM/AAAA")
-    _require(payload, "nome_mae")
-
-def _validate_emitir_guia(payload):
-    # se vier flow_id, assumimos que o backend real preencherá o resto;
-    # aqui apenas garantimos mínimos para o mock ficar útil
-    if not payload.get("flow_id"):
-        _require(payload, "cpf", CPF_RE, "Use 11 dígitos numéricos")
-        _require(payload, "nome_condutor")
-        _require(payload, "data_nascimento", DATE_RE, "Formato DD/MM/AAAA")
-        _require(payload, "nome_mae")
-        _require(payload, "codigo_taxa")
-        _require(payload, "codigo_servico")
-        _require(payload, "numero_cnh")
-    _require(payload, "codigo_municipio_condutor")
-    _require(payload, "ddd_celular")
-    _require(payload, "numero_celular")
-    _require(payload, "email")
-    _require(payload, "numero_ip_micro")
-
-def _validate_exibir_dados(payload):
-    _require(payload, "cpf", CPF_RE, "Use 11 dígitos numéricos")
-    _require(payload, "data_nascimento", DATE_RE, "Formato DD/MM/AAAA")
-
-# --------- handlers ---------
-def _from_agent_properties(payload: dict) -> dict:
-    """
-    Converte payload no formato:
-    {"content":{"application/json":{"properties":[{"name":...,"value":...},...]}}}
-    para {"name": "value", ...}
-    """
-    try:
-        props = payload["content"]["application/json"]["properties"]
-        if isinstance(props, list):
-            flat = {}
-            for item in props:
-                k = item.get("name")
-                v = item.get("value")
-                if k is not None:
-                    flat[k] = v
-            return flat
-    except Exception:
-        pass
-    return payload
-
-def _normalize_keys(payload: dict) -> dict:
-    # aceita sinônimos vindos do Agent
-    if "nome" in payload and "nome_condutor" not in payload:
-        payload["nome_condutor"] = payload["nome"]
-    if "mae" in payload and "nome_mae" not in payload:
-        payload["nome_mae"] = payload["mae"]
-    if "nascimento" in payload and "data_nascimento" not in payload:
-        payload["data_nascimento"] = payload["nascimento"]
-    # limpa espaços
-    for k, v in list(payload.items()):
-        if isinstance(v, str):
-            payload[k] = v.strip()
-    return payload
-
-def confirmar_dados(payload: dict):
-    try:
-        _validate_confirmar(payload)
-    except ValueError as e:
-        # 422 pedindo só o que falta/errado
-        msg = str(e)
-        # tenta extrair o nome do campo da msg
-        field = None
-        if '"' in msg:
-            try:
-                field = msg.split('"')[1]
-            except Exception:
-                field = None
-        return _err_422(msg, field)
+    return _validation_error(errors)
 
-    cpf = payload.get("cpf")
-    out = {
-      "flow_id":"0a84e30c-3c9c-4f1c-9a5c-5d9a3b2d7f1a",
-      "retornoNSDGXS02":{
+# --------- corpos de resposta (mock) ---------
+def _s02_record(cpf):
+    return {
         "codigo_retorno":0,"mensagem_retorno":"OK","cpf":cpf,
         "numero_cnh":"12345678900","numero_pgu":"99887766",
         "numero_identidade":"MG1234567","orgao_expedidor_identidade":"SSP","uf_identidade":"MG",
@@ -124,25 +71,13 @@ def confirmar_dados(payload: dict):
         "numero_cep_endereco_condutor":"30130008","data_primeira_habilitacao":"2010-06-15","data_validade_exame":"2027-05-23",
         "codigo_servico":123,"codigo_taxa":25,"flag_escolhe_entrega":1,"flag_tipo_autorizacao":"CNH",
         "ddd_celular":31,"numero_celular":999999999,"email":"condutor@example.com"
-      }
     }
-    return _resp(200, out)
 
-def exibir_opcoes_pagamento(payload: dict):
-    try:
-        _validate_emitir_guia(payload)
-    except ValueError as e:
-        msg = str(e)
-        field = None
-        if '"' in msg:
-            try:
-                field = msg.split('"')[1]
-            except Exception:
-                field = None
-        return _err_422(msg, field)
+def _confirmar_body(flow_id, cpf):
+    return {"flow_id": flow_id, "retornoNSDGXS02": _s02_record(cpf)}
 
-    cpf = payload.get("cpf", "00000000000")
-    out = {
+def _opcoes_pagamento_body(cpf):
+    return {
       "retornoNsdgxS2A":{"codigo_retorno":0,"mensagem_retorno":"OK"},
       "retornoNsdgx414":{
         "codigo_erro":0,"mensagem_erro":"",
@@ -175,23 +110,9 @@ def exibir_opcoes_pagamento(payload: dict):
       },
       "codigoBarras":"iVBORw0KGgoAAAANSUhEUgAAAAEAAAAB..."  # base64 ilustrativo
     }
-    return _resp(200, out)
-
-def exibir_dados(payload: dict):
-    try:
-        _validate_exibir_dados(payload)
-    except ValueError as e:
-        msg = str(e)
-        field = None
-        if '"' in msg:
-            try:
-                field = msg.split('"')[1]
-            except Exception:
-                field = None
-        return _err_422(msg, field)
 
-    cpf = payload.get("cpf")
-    out = {
+def _exibir_dados_body(cpf):
+    return {
       "cpf":cpf,"numero_renach":"MG-123456789","nome_condutor":"CONDUTOR TESTE","numero_formulario_renach":"FORM-0001",
       "codigo_etapa":4,"descricao_etapa":"Emissão concluída","prazo":0,"titulo_entrega":"Postado nos Correios",
       "data_entrega_lote":"2025-09-18","titulo_hora_entrega":"Até 18h","hora_entrega_lote":"18:00:00",
@@ -202,23 +123,246 @@ def exibir_dados(payload: dict):
       "titulo_motivo_rejeicao":"","quantidade_motivo_rejeicao":0,"codigo_rejeicao":[],"motivo_rejeicao":[],
       "descricao_acao":"Acompanhar entrega pelo AR"
     }
-    return _resp(200, out)
+
+class ResponseTemplate:
+    """
+    Corpo JSON serializado uma única vez (cold start) com marcadores nos
+    campos variáveis. Por requisição só os valores variáveis passam pelo
+    json.dumps, que garante o mesmo escape da serialização completa.
+    """
+
+    def __init__(self, builder, *slots):
+        markers = {name: f"\x00{name}\x00" for name in slots}
+        encoded = json.dumps(builder(**markers), ensure_ascii=False)
+        enc_markers = {json.dumps(m, ensure_ascii=False): name for name, m in markers.items()}
+        self.segments = []   # textos fixos
+        self.order = []      # nome do campo entre cada par de segmentos
+        pos = 0
+        while True:
+            hits = [(encoded.find(m, pos), m) for m in enc_markers]
+            hits = [h for h in hits if h[0] >= 0]
+            if not hits:
+                break
+            idx, marker = min(hits)
+            self.segments.append(encoded[pos:idx])
+            self.order.append(enc_markers[marker])
+            pos = idx + len(marker)
+        self.segments.append(encoded[pos:])
+
+    def render(self, **values) -> str:
+        segs = self.segments
+        parts = [segs[0]]
+        for i, name in enumerate(self.order, 1):
+            parts.append(json.dumps(values[name], ensure_ascii=False))
+            parts.append(segs[i])
+        return "".join(parts)
+
+TPL_CONFIRMAR = ResponseTemplate(_confirmar_body, "flow_id", "cpf")
+TPL_OPCOES_PAGAMENTO = ResponseTemplate(_opcoes_pagamento_body, "cpf")
+TPL_EXIBIR_DADOS = ResponseTemplate(_exibir_dados_body, "cpf")
+
+# --------- handlers ---------
+def confirmar_dados(payload: dict):
+    with phase("validate"):
+        errors = SCHEMA.validate("confirmar-dados", payload)
+    if errors:
+        return _validation_error(errors)
+
+    cpf = payload.get("cpf")
+    flow_id = FLOWS.create({
+        "retornoNSDGXS02": _s02_record(cpf),
+        "nome_condutor": payload.get("nome_condutor"),
+        "data_nascimento": payload.get("data_nascimento"),
+        "nome_mae": payload.get("nome_mae"),
+    })
+    return _resp_template(200, TPL_CONFIRMAR, flow_id=flow_id, cpf=cpf)
+
+def exibir_opcoes_pagamento(payload: dict):
+    # flow_id desconhecido (outro container, cold start, TTL vencido): segue com os
+    # campos enviados pelo Agent, validados por x-required-without-flow
+    flow = FLOWS.get(payload.get("flow_id"))
+    if flow is not None:
+        payload = merge_flow(flow, payload)
+    with phase("validate"):
+        errors = SCHEMA.validate("exibir-opcoes-pagamento", payload, has_flow=flow is not None)
+    if errors:
+        return _validation_error(errors)
+
+    cpf = payload.get("cpf", "00000000000")
+    return _resp_template(200, TPL_OPCOES_PAGAMENTO, cpf=cpf)
+
+def exibir_dados(payload: dict):
+    with phase("validate"):
+        errors = SCHEMA.validate("exibir-dados", payload)
+    if errors:
+        return _validation_error(errors)
+
+    with phase("serialize"):
+        body = _consultar_status(payload.get("cpf"), payload.get("data_nascimento"))
+    return _resp_raw(200, body)
+
+def _consultar_status(cpf: str, data_nascimento: str) -> str:
+    """Status da emissão de um condutor (ExibirDadosOutput serializado); uma consulta por par."""
+    return TPL_EXIBIR_DADOS.render(cpf=cpf)
+
+# --------- consulta em lote ---------
+_lote_pool = None
+_lote_pool_lock = threading.Lock()
+
+def _get_lote_pool():
+    # criado na primeira consulta em lote: as outras rotas não pagam o import/threads no cold start
+    global _lote_pool
+    if _lote_pool is None:
+        with _lote_pool_lock:
+            if _lote_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _lote_pool = ThreadPoolExecutor(max_workers=LOTE_WORKERS, thread_name_prefix="lote")
+    return _lote_pool
+
+def _lote_line(indice: int, status: int, **fields) -> str:
+    return json.dumps({"indice": indice, "status": status, **fields}, ensure_ascii=False) + "\n"
+
+def _lote(payload: dict):
+    """
+    Valida o lote inteiro numa passada antes de consultar qualquer item.
+    Devolve (resposta 422, None) se a lista em si for inválida ou
+    (None, gerador das linhas NDJSON) com os erros por item.
+    """
+    with phase("validate"):
+        errors = SCHEMA.validate("exibir-dados-lote", payload)
+    if errors:
+        return _validation_error(errors), None
+    itens = payload["itens"]
+    if isinstance(itens, str):
+        # via properties do Agent o array chega serializado
+        itens = _parse_json(itens)
+    if not isinstance(itens, list) or not itens:
+        return _err_422('O campo "itens" deve ser uma lista com ao menos um par cpf/data_nascimento',
+                        "itens", "_invalid"), None
+    if len(itens) > LOTE_MAX_ITENS:
+        return _err_422(f"Lote com {len(itens)} itens; o máximo é {LOTE_MAX_ITENS}", "itens", "_invalid"), None
+
+    rejected = []  # linhas dos itens inválidos (saem primeiro)
+    groups = {}    # (cpf, data_nascimento) -> índices: pares repetidos viram uma consulta só
+    with phase("validate"):
+        for i, item in enumerate(itens):
+            if not isinstance(item, dict):
+                rejected.append(_lote_line(i, 422, codigo_erro="item_invalido",
+                                           message="Item deve ser um objeto com cpf e data_nascimento"))
+                continue
+            item = SCHEMA.prepare(item)
+            item_errors = SCHEMA.validate("exibir-dados", item)
+            if item_errors:
+                rejected.append(_lote_line(i, 422, codigo_erro="validacao", errors=item_errors))
+            else:
+                groups.setdefault((item["cpf"], item["data_nascimento"]), []).append(i)
+    return None, _lote_lines(len(itens), rejected, groups)
+
+def _lote_lines(total: int, rejected: list, groups: dict):
+    """Linhas NDJSON na ordem em que ficam prontas; a última é o resumo."""
+    ok = 0
+    yield from rejected
+    if groups:
+        from concurrent.futures import as_completed
+        pool = _get_lote_pool()
+        futures = {pool.submit(_consultar_status, cpf, nascimento): indices
+                   for (cpf, nascimento), indices in groups.items()}
+        for future in as_completed(futures):
+            indices = futures[future]
+            try:
+                body = future.result()
+            except Exception as e:
+                log_invocation("cet-mg-backend", "/exibir-dados/lote", 500, error=e, indices=indices)
+                for i in indices:
+                    yield _lote_line(i, 500, codigo_erro="erro_interno", message="Falha ao consultar o status")
+                continue
+            ok += len(indices)
+            for i in indices:
+                # corpo do template já é JSON: entra na linha sem passar de novo pelo json.dumps
+                yield '{"indice": %d, "status": 200, "dados": %s}\n' % (i, body)
+    yield json.dumps({"resumo": {"total": total, "ok": ok, "erros": total - ok, "consultas": len(groups)}}) + "\n"
+
+def exibir_dados_lote(payload: dict):
+    error, lines = _lote(payload)
+    if error is not None:
+        return error
+    return _resp_raw(200, "".join(lines), NDJSON)
 
 ROUTES = {
     ("/confirmar-dados","POST"): confirmar_dados,
     ("/exibir-opcoes-pagamento","POST"): exibir_opcoes_pagamento,
-    ("/exibir-dados","POST"): exibir_dados
+    ("/exibir-dados","POST"): exibir_dados,
+    ("/exibir-dados/lote","POST"): exibir_dados_lote
+}
+
+# rotas com corpo NDJSON incremental (stream_handler): payload -> (resposta de erro, None) | (None, linhas)
+STREAM_ROUTES = {
+    ("/exibir-dados/lote","POST"): _lote
 }
 
 def lambda_handler(event, context):
-    print(event)
     path = event.get("path") or event.get("resource") or "/"
     method = event.get("httpMethod","POST").upper()
-    body = event.get("body") or "{}"
-    payload = _parse_json(body)
-    payload = _from_agent_properties(payload)
-    payload = _normalize_keys(payload)
-    handler = ROUTES.get((path,method))
-    if not handler:
-        return _resp(404, {"message":"Rota não encontrada"})
-    return handler(payload)
+    with cet_metrics.start_timer() as timer:
+        try:
+            body = event.get("body") or "{}"
+            with phase("parse"):
+                payload = _parse_json(body)
+            with phase("normalize"):
+                payload = SCHEMA.prepare(payload)
+            handler = ROUTES.get((path,method))
+            if not handler:
+                resp = _resp(404, {"message":"Rota não encontrada"})
+            else:
+                with phase("handler"):
+                    resp = handler(payload)
+        except Exception as e:
+            log_invocation("cet-mg-backend", path, 500, event, duration_ms=timer.total_ms(), error=e, context=context)
+            raise
+    metrics = timer.as_metrics()
+    metrics.update(cet_metrics.cold_start_metrics("cet-mg-backend"))
+    cet_metrics.emit_emf("cet-mg-backend", {"Route": path, "Status": resp["statusCode"]}, metrics,
+                         {"ColdStart": "init_ms" in metrics})
+    log_invocation("cet-mg-backend", path, resp["statusCode"], event, resp, timer.total_ms(), context=context)
+    return resp
+
+def stream_handler(event, context):
+    """
+    Entrada para hosts que escrevem a resposta aos poucos (Function URL com
+    response streaming, gateway do cet_local): nas rotas de STREAM_ROUTES
+    devolve a resposta com "body" como iterador de linhas, cada uma escrita
+    assim que o item fica pronto. Demais rotas: None (use lambda_handler).
+    Métrica e log saem quando o corpo termina.
+    """
+    path = event.get("path") or event.get("resource") or "/"
+    method = event.get("httpMethod","POST").upper()
+    route = STREAM_ROUTES.get((path, method))
+    if route is None:
+        return None
+    started = time.perf_counter()
+
+    def done(resp, **props):
+        ms = (time.perf_counter() - started) * 1000.0
+        cet_metrics.emit_emf("cet-mg-backend", {"Route": path, "Status": resp["statusCode"]},
+                             {"total_ms": round(ms, 3)}, {"Streamed": True, **props})
+        log_invocation("cet-mg-backend", path, resp["statusCode"], event, duration_ms=ms, context=context, **props)
+
+    error, lines = route(SCHEMA.prepare(_parse_json(event.get("body") or "{}")))
+    if error is not None:
+        done(error)
+        return error
+
+    def body():
+        count = 0
+        for line in lines:
+            count += 1
+            yield line
+        done(resp, lines=count)
+
+    resp = _resp_raw(200, body(), NDJSON)
+    return resp
+
+# init: schema compilado, templates e flow store já foram montados na importação;
+# a fila de log também sobe aqui para não pesar na primeira requisição
+get_logger()
+cet_metrics.record_init("cet-mg-backend", _INIT_STARTED)
@@ -0,0 +1,140 @@
+"""
+Formato das ações do Action Group, compartilhado pelo proxy
+(cet-mg-api-invocation.py), pelo return of control da UI e pelo despacho em
+processo para o backend:
+
+- flat_body / pick / guess_operation: leitura do evento do Agent;
+- extract_session: campos da resposta do backend promovidos a sessionAttributes;
+- backend_event / invoke_backend: evento de proxy integration do API Gateway
+  e chamada direta do lambda_handler do backend, sem HTTP.
+"""
+import json
+
+try:
+    import orjson  # codec opcional, bem mais rápido para ler corpos grandes (DAE)
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+
+def flat_body(body):
+    """Achata o requestBody do Agent (lista de properties) ou um JSON simples em dict."""
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except Exception:
+            return {}
+    if not isinstance(body, dict):
+        return {}
+    try:
+        props = body["content"]["application/json"]["properties"]
+        if isinstance(props, list):
+            return {p.get("name"): p.get("value") for p in props if isinstance(p, dict) and p.get("name")}
+    except (KeyError, TypeError):
+        pass
+    return body
+
+
+def pick(d, *keys, default=None):
+    for k in keys:
+        if isinstance(d, dict) and k in d:
+            return d[k]
+    return default
+
+
+def guess_operation(event):
+    op = event.get("operationId")
+    if op:
+        return op
+    path = pick(event, "path", "apiPath", default="") or ""
+    if "/confirmar-dados" in path: return "confirmar-dados"
+    if "/exibir-opcoes-pagamento" in path: return "exibir-opcoes-pagamento"
+    if "/exibir-dados/lote" in path: return "exibir-dados-lote"
+    if "/exibir-dados" in path: return "exibir-dados"
+    return "desconhecido"
+
+
+SESSION_OPS = ("confirmar-dados", "exibir-opcoes-pagamento", "exibir-dados")
+
+
+def extract_session(op, status_code, content_type, raw_body):
+    """
+    Lê a resposta JSON do backend e promove campos úteis para sessionAttributes.
+    Importante: Bedrock exige string->string.
+    """
+    sess = {}
+    if not (isinstance(content_type, str) and content_type.startswith("application/json")):
+        return sess
+    if status_code != 200 or op not in SESSION_OPS:
+        # ainda assim podemos salvar algo de erro, se quiser
+        return sess
+    # parse sob demanda: só chega aqui quando há campos a promover
+    try:
+        data = loads(raw_body) if isinstance(raw_body, (str, bytes)) else raw_body
+    except Exception:
+        return sess
+    if not isinstance(data, dict):
+        return sess
+
+    if op == "confirmar-dados":
+        s02 = (data.get("retornoNSDGXS02") or {})
+        sess.update({
+            "flow_id": data.get("flow_id"),
+            "cpf": s02.get("cpf"),
+            "codigo_taxa": s02.get("codigo_taxa"),
+            "codigo_servico": s02.get("codigo_servico"),
+            "numero_cnh": s02.get("numero_cnh"),
+            "ddd_celular": s02.get("ddd_celular"),
+            "numero_celular": s02.get("numero_celular"),
+            "email": s02.get("email"),
+            "codigo_municipio_condutor": s02.get("codigo_municipio_condutor"),
+            "nome_municipio_condutor": s02.get("nome_municipio_condutor"),
+            "sigla_uf_municipio_condutor": s02.get("sigla_uf_municipio_condutor"),
+        })
+    elif op == "exibir-opcoes-pagamento":
+        r414 = (data.get("retornoNsdgx414") or {})
+        sess.update({
+            "dae_linha_digitavel": r414.get("linha_digitavel"),
+            "dae_codigo_barras_44": r414.get("codigo_barras"),
+            "dae_valor": r414.get("valor_taxa"),
+            "dae_vencimento": r414.get("data_vencimento"),
+            "dae_municipio_desc": r414.get("descricao_municipio"),
+            "dae_municipio_ibge": r414.get("codigo_municipio_ibge"),
+            "dae_mes_ano": r414.get("mes_ano_dae"),
+        })
+    elif op == "exibir-dados":
+        sess.update({
+            "status_descricao_etapa": data.get("descricao_etapa"),
+            "status_situacao_cnh": data.get("situacao_cnh"),
+            "status_data_hora": data.get("data_hora_status"),
+        })
+
+    # Bedrock: somente strings
+    return {k: str(v) for k, v in sess.items() if v is not None}
+
+
+def backend_event(method: str, path: str, body=None, query: dict = None, headers: dict = None) -> dict:
+    """Evento de proxy integration (o que o API Gateway entrega ao cet-mg-backend)."""
+    if body is not None and not isinstance(body, (str, bytes)):
+        body = json.dumps(body, ensure_ascii=False)
+    elif isinstance(body, bytes):
+        body = body.decode("utf-8")
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method.upper(),
+        "headers": headers or {"Content-Type": "application/json"},
+        "queryStringParameters": query or None,
+        "body": body,
+        "isBase64Encoded": False,
+    }
+
+
+def invoke_backend(backend, method: str, path: str, body=None, query: dict = None, headers: dict = None):
+    """Chama backend.lambda_handler no processo; devolve (status, content-type, texto)."""
+    result = backend.lambda_handler(backend_event(method, path, body, query, headers), None)
+    ctype = (result.get("headers") or {}).get("Content-Type", "application/json").split(";")[0].strip()
+    text = result.get("body") or ""
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+    return result.get("statusCode", 200), ctype or "application/json", text
@@ -0,0 +1,171 @@
+"""
+Cache em memória com expiração (TTL) e descarte LRU, limitado por número
+de entradas e por bytes. Usado pelo proxy do Action Group para respostas
+de consulta de status (exibir-dados).
+
+SingleFlight: chamadas simultâneas com a mesma chave (retry do Bedrock,
+clique duplo do usuário) esperam a que já está em andamento e recebem o
+mesmo resultado, em vez de cada uma ir ao backend.
+
+As chaves são calculadas fora daqui (ver hash_key); o cache nunca recebe
+CPF ou data de nascimento em claro.
+"""
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# sal por processo: o digest não pode ser revertido por força bruta fora da Lambda
+_KEY_SALT = os.urandom(16)
+
+
+def hash_key(*parts) -> str:
+    """HMAC-SHA256 das partes normalizadas (strip), separadas por '|'."""
+    raw = "|".join("" if p is None else str(p).strip() for p in parts)
+    return hmac.new(_KEY_SALT, raw.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class TTLCache:
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024, max_bytes: int = 4 * 1024 * 1024,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0, "sets": 0}
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return None
+            expires_at, _, value = item
+            if expires_at <= self._clock():
+                self._pop(key)
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key, value, size: int, ttl: float = None):
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), size, value)
+            self._bytes += size
+            self.stats["sets"] += 1
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._pop(oldest)
+                self.stats["evictions"] += 1
+        return True
+
+    def invalidate(self, key) -> bool:
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+                self.stats["invalidations"] += 1
+                return True
+        return False
+
+    def clear(self):
+        with self._lock:
+            self.stats["invalidations"] += len(self._data)
+            self._data.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            out = dict(self.stats)
+            out.update({"entries": len(self._data), "bytes": self._bytes})
+        return out
+
+    def _pop(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights = {}  # key -> _Flight em andamento
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0, "errors": 0, "wait_timeouts": 0, "max_waiters": 0}
+
+    def do(self, key, fn, timeout: float = None):
+        """
+        Executa fn() uma vez por chave entre chamadas simultâneas. Devolve
+        (resultado, shared): shared=True para quem só esperou a chamada de
+        outra thread. A exceção de fn() também é repassada a quem esperou;
+        quem espera mais que `timeout` segundos recebe TimeoutError (a
+        chamada original continua).
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["leaders"] += 1
+            else:
+                flight.waiters += 1
+                self.stats["coalesced"] += 1
+                self.stats["max_waiters"] = max(self.stats["max_waiters"], flight.waiters)
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                with self._lock:
+                    self.stats["wait_timeouts"] += 1
+                raise TimeoutError("tempo esgotado esperando chamada idêntica em andamento")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            # sai do mapa antes de acordar quem espera: chamada nova depois disto vai ao backend
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            out = dict(self.stats)
+            out["in_flight"] = len(self._flights)
+        return out
@@ -0,0 +1,384 @@
+"""
+Histórico de conversa persistente (append-only) para as UIs Streamlit.
+
+O `sid` já fica no URL (app_simple.py), mas as mensagens ficavam só em
+st.session_state: refresh caindo em outro worker ou um redeploy perdia o
+histórico. Aqui cada sessão tem um log só de inclusão; ao abrir a sessão o
+app carrega apenas as últimas CONVERSATION_LOAD_LAST mensagens e busca as
+mais antigas sob demanda ("carregar anteriores").
+
+As gravações não bloqueiam o render: append() enfileira e uma thread
+grava em lotes (até CONVERSATION_BATCH_MAX mensagens ou
+CONVERSATION_FLUSH_MS desde a primeira da fila). load() e count() não
+esperam a fila: somam ao que já está gravado as mensagens ainda pendentes
+deste processo. flush() espera a fila esvaziar; é chamado no encerramento
+do processo (atexit).
+
+Backends (CONVERSATION_STORE):
+- memory: dict no processo (sobrevive a refresh só no mesmo worker);
+  limitado, já que divide o processo com as sessões: guarda só as últimas
+  CONVERSATION_MEMORY_CAP mensagens por sessão (compactadas como no
+  SessionMemoryManager), esquece sessões sem uso há
+  CONVERSATION_MEMORY_TTL_S e mantém no máximo
+  CONVERSATION_MEMORY_MAX_SESSIONS (LRU). Para histórico completo, use
+  sqlite ou file
+- sqlite: arquivo compartilhado pelos workers da mesma máquina/volume
+- file:   um .jsonl por sessão em CONVERSATION_STORE_PATH (ex.: volume de rede)
+"""
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+from cet_session_memory import CompactMessage, SESSION_HISTORY_CAP, SESSION_IDLE_TTL_S
+
+CONVERSATION_STORE = os.environ.get("CONVERSATION_STORE", "memory")
+CONVERSATION_STORE_PATH = os.environ.get("CONVERSATION_STORE_PATH", "")
+CONVERSATION_LOAD_LAST = int(os.environ.get("CONVERSATION_LOAD_LAST", "50"))
+CONVERSATION_FLUSH_MS = float(os.environ.get("CONVERSATION_FLUSH_MS", "200"))
+CONVERSATION_BATCH_MAX = int(os.environ.get("CONVERSATION_BATCH_MAX", "100"))
+CONVERSATION_QUEUE_SIZE = int(os.environ.get("CONVERSATION_QUEUE_SIZE", "10000"))
+# limites do backend memory (padrões = os do SessionMemoryManager)
+CONVERSATION_MEMORY_CAP = int(os.environ.get("CONVERSATION_MEMORY_CAP", str(SESSION_HISTORY_CAP)))
+CONVERSATION_MEMORY_TTL_S = float(os.environ.get("CONVERSATION_MEMORY_TTL_S", str(SESSION_IDLE_TTL_S)))
+CONVERSATION_MEMORY_MAX_SESSIONS = int(os.environ.get("CONVERSATION_MEMORY_MAX_SESSIONS", "1000"))
+
+_DEFAULT_PATHS = {"sqlite": "/tmp/cet_conversations.db", "file": "/tmp/cet_conversations"}
+
+
+def _record(session_id: str, message: dict) -> dict:
+    return {
+        "session_id": session_id,
+        "id": message["id"],
+        "role": message["role"],
+        "content": message["content"],
+        "ts": message.get("ts") or time.time(),
+    }
+
+
+def _message(record: dict) -> dict:
+    return {"id": record["id"], "role": record["role"], "content": record["content"]}
+
+
+class InMemoryConversationStore:
+    """
+    Mesma interface dos backends persistentes; grava na hora (sem thread).
+    Limitado por sessão (cap), por ociosidade (ttl_s) e por número de
+    sessões (LRU): o que sai daqui não volta.
+    """
+
+    def __init__(self, cap: int = CONVERSATION_MEMORY_CAP, ttl_s: float = CONVERSATION_MEMORY_TTL_S,
+                 max_sessions: int = CONVERSATION_MEMORY_MAX_SESSIONS, clock=time.monotonic):
+        self.cap = cap
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._data = OrderedDict()  # session_id -> [último uso, deque de CompactMessage]; menos recente primeiro
+        self._lock = threading.Lock()
+        self.stats = {"appended": 0, "batches": 0, "written": 0, "max_batch": 0, "errors": 0,
+                      "dropped": 0, "expired": 0}
+
+    def _touch(self, session_id: str, create: bool = False):
+        now = self._clock()
+        entry = self._data.get(session_id)
+        if entry is None and create:
+            entry = self._data[session_id] = [now, deque(maxlen=self.cap or None)]
+        elif entry is not None:
+            entry[0] = now
+            self._data.move_to_end(session_id)
+        # ordem de uso: basta olhar do começo até a 1ª sessão que fica
+        while self._data:
+            oldest, (seen, _) = next(iter(self._data.items()))
+            if oldest == session_id or (now - seen < self.ttl_s and len(self._data) <= self.max_sessions):
+                break
+            del self._data[oldest]
+            self.stats["expired"] += 1
+        return entry
+
+    def append(self, session_id: str, message: dict):
+        with self._lock:
+            messages = self._touch(session_id, create=True)[1]
+            if messages.maxlen and len(messages) == messages.maxlen:
+                self.stats["dropped"] += 1
+            messages.append(CompactMessage.from_message(message))
+            self.stats["appended"] += 1
+            self.stats["written"] += 1
+
+    def load(self, session_id: str, limit: int = CONVERSATION_LOAD_LAST, skip: int = 0) -> list:
+        """Até `limit` mensagens, em ordem, terminando `skip` mensagens antes da última."""
+        with self._lock:
+            entry = self._touch(session_id)
+            messages = list(entry[1]) if entry else []
+        end = len(messages) - skip
+        return [m.to_dict() for m in messages[max(0, end - limit):max(0, end)]]
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            entry = self._data.get(session_id)
+            return len(entry[1]) if entry else 0
+
+    def sessions(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def flush(self, timeout: float = None) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+
+logger = logging.getLogger(__name__)
+
+
+class _BatchedStore:
+    """Fila + thread de gravação em lote; as subclasses implementam _write/_load/_count."""
+
+    def __init__(self, flush_ms: float = CONVERSATION_FLUSH_MS, batch_max: int = CONVERSATION_BATCH_MAX,
+                 queue_size: int = CONVERSATION_QUEUE_SIZE):
+        self.flush_interval = flush_ms / 1000.0
+        self.batch_max = batch_max
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self.stats = {"appended": 0, "batches": 0, "written": 0, "max_batch": 0, "errors": 0}
+        # session_id -> registros enfileirados e ainda não gravados (ordem de append)
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        # gravação de um lote + saída dele de _pending vs. leitura: quem lê nunca vê
+        # a mensagem nos dois lugares nem em nenhum
+        self._io_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"{type(self).__name__}-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, session_id: str, message: dict):
+        if self._closed:
+            raise RuntimeError("conversation store fechado")
+        self.stats["appended"] += 1
+        record = _record(session_id, message)
+        with self._pending_lock:
+            self._pending.setdefault(session_id, []).append(record)
+        # fila cheia: espera a thread em vez de perder mensagem
+        self._queue.put(record)
+
+    def load(self, session_id: str, limit: int = CONVERSATION_LOAD_LAST, skip: int = 0) -> list:
+        """Até `limit` mensagens, em ordem, terminando `skip` mensagens antes da última."""
+        # o que este processo ainda não gravou também aparece, sem esperar a fila
+        with self._io_lock:
+            with self._pending_lock:
+                pending = list(self._pending.get(session_id, ()))
+            if not pending:
+                return [_message(r) for r in self._load(session_id, limit, skip)]
+            want = limit + skip
+            records = self._load(session_id, max(0, want - len(pending)), 0) + pending
+        records = records[-want:] if want else []
+        if skip:
+            records = records[:-skip]
+        return [_message(r) for r in records[-limit:]] if limit else []
+
+    def count(self, session_id: str) -> int:
+        with self._io_lock:
+            with self._pending_lock:
+                pending = len(self._pending.get(session_id, ()))
+            return self._count(session_id) + pending
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Espera a fila ser gravada; False se estourar o timeout."""
+        if self._closed and not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, waiters, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                # flush pedido: grava o que tem sem esperar o resto da janela
+                if stop or waiters or len(batch) >= self.batch_max:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                with self._io_lock:
+                    try:
+                        self._write(batch)
+                        self.stats["batches"] += 1
+                        self.stats["written"] += len(batch)
+                        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+                    except Exception:
+                        self.stats["errors"] += 1
+                        logger.exception("Erro gravando histórico (%d mensagens)", len(batch))
+                    # gravado ou perdido, o lote sai dos pendentes (não é regravado)
+                    self._forget(batch)
+            for done in waiters:
+                done.set()
+            if stop:
+                self._on_stop()
+                return
+
+    def _forget(self, batch: list):
+        per_session = {}
+        for r in batch:
+            per_session[r["session_id"]] = per_session.get(r["session_id"], 0) + 1
+        with self._pending_lock:
+            for session_id, n in per_session.items():
+                # a fila é FIFO: o lote são sempre os mais antigos pendentes da sessão
+                records = self._pending.get(session_id)
+                if records is not None:
+                    del records[:n]
+                    if not records:
+                        del self._pending[session_id]
+
+    def _on_stop(self):
+        pass
+
+
+class SQLiteConversationStore(_BatchedStore):
+    def __init__(self, path: str = "", **kwargs):
+        self.path = path or CONVERSATION_STORE_PATH or _DEFAULT_PATHS["sqlite"]
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, id TEXT NOT NULL UNIQUE,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS messages_session_seq ON messages (session_id, seq)")
+        super().__init__(**kwargs)
+
+    def _write(self, batch: list):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # id UNIQUE: regravar o mesmo lote (retry) não duplica mensagens
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO messages (session_id, id, role, content, ts) VALUES (?, ?, ?, ?, ?)",
+                    [(r["session_id"], r["id"], r["role"], r["content"], r["ts"]) for r in batch],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _load(self, session_id: str, limit: int, skip: int) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content FROM messages WHERE session_id = ?"
+                " ORDER BY seq DESC LIMIT ? OFFSET ?",
+                (session_id, limit, skip),
+            ).fetchall()
+        return [{"id": i, "role": role, "content": content} for i, role, content in reversed(rows)]
+
+    def _count(self, session_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def _on_stop(self):
+        with self._lock:
+            self._conn.close()
+
+
+_SAFE_SID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class FileConversationStore(_BatchedStore):
+    """Um arquivo <sid>.jsonl por sessão; cada lote vira um único write() em modo append."""
+
+    BLOCK = 64 * 1024
+
+    def __init__(self, path: str = "", **kwargs):
+        self.path = path or CONVERSATION_STORE_PATH or _DEFAULT_PATHS["file"]
+        os.makedirs(self.path, exist_ok=True)
+        super().__init__(**kwargs)
+
+    def _file(self, session_id: str) -> str:
+        # o sid vem do URL: nada de "../" no nome do arquivo
+        return os.path.join(self.path, _SAFE_SID.sub("_", session_id)[:128] + ".jsonl")
+
+    def _write(self, batch: list):
+        by_session = {}
+        for r in batch:
+            by_session.setdefault(r["session_id"], []).append(r)
+        for session_id, records in by_session.items():
+            data = "".join(json.dumps({k: r[k] for k in ("id", "role", "content", "ts")}, ensure_ascii=False) + "\n"
+                           for r in records).encode("utf-8")
+            fd = os.open(self._file(session_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+
+    def _tail(self, session_id: str, n: int) -> list:
+        """Últimas `n` linhas completas do arquivo, lendo blocos a partir do fim."""
+        try:
+            f = open(self._file(session_id), "rb")
+        except FileNotFoundError:
+            return []
+        with f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            buf = b""
+            while pos > 0 and buf.count(b"\n") <= n:
+                step = min(self.BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+        lines = [line for line in buf.split(b"\n") if line.strip()]
+        if pos > 0:
+            lines = lines[1:]  # a primeira linha do buffer pode estar cortada
+        return lines[-n:] if n else []
+
+    def _load(self, session_id: str, limit: int, skip: int) -> list:
+        lines = self._tail(session_id, limit + skip)
+        if skip:
+            lines = lines[:-skip]
+        out = []
+        for line in lines[-limit:] if limit else []:
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue  # linha parcial de um worker que caiu no meio do write
+        return out
+
+    def _count(self, session_id: str) -> int:
+        try:
+            with open(self._file(session_id), "rb") as f:
+                return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(self.BLOCK), b""))
+        except FileNotFoundError:
+            return 0
+
+
+def create_conversation_store(kind: str = CONVERSATION_STORE):
+    if kind == "sqlite":
+        return SQLiteConversationStore()
+    if kind == "file":
+        return FileConversationStore()
+    if kind == "memory":
+        return InMemoryConversationStore()
+    raise ValueError(f"CONVERSATION_STORE desconhecido: {kind}")
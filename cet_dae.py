@@ -0,0 +1,134 @@
+"""
+Extração incremental dos campos da DAE na resposta em streaming do Agent.
+
+Antes, a resposta de emissão só era formatada depois do fim do stream:
+o texto inteiro era juntado, normalizado e varrido de novo com uma regex
+genérica (`[A-Za-z_]+:`), que perdia campos com dígitos (campo_mensagem_1)
+e inventava chaves no meio dos valores ("NUM. CNH:", "Data Emissao:").
+
+O DaeFieldExtractor consome os trechos à medida que chegam e procura só as
+chaves do EmitirGuiaOutput (action_group_api_schema.yml), numa janela que
+cobre o trecho novo e a sobra do anterior (chave partida entre dois
+chunks). Cada valor é fechado quando a próxima chave aparece, então o bloco
+"key: value" fica pronto assim que o stream termina.
+"""
+import re
+from functools import lru_cache
+
+from cet_schema import SCHEMA
+
+ANCHOR = "Dados da emissão:"
+DAE_PHRASE = "Sua guia DAE foi gerada"
+# campo que só aparece na emissão: basta ele para tratar a resposta como DAE
+DAE_MARKER_FIELD = "mes_ano_dae"
+DAE_FIELDS = SCHEMA.field_names("EmitirGuiaOutput")
+TRUNCATE_FIELDS = {"codigo_barras": 60, "codigoBarras": 60}
+# fim do valor que na verdade é o começo da linha da próxima chave: marcador de lista
+# ("-", "*", "•", "2.") e/ou o "**" de abertura de "**chave**:"
+_NEXT_LINE_PREFIX = re.compile(r"\n[ \t]*(?:[-*•]|\d+[.)])?[ \t]*\*{0,2}[ \t]*$")
+
+
+@lru_cache(maxsize=8)
+def _key_pattern(fields: tuple):
+    # chaves mais longas primeiro; \b impede casar "municipio:" dentro de "codigo_municipio:".
+    # aceita "**chave**:" e "**chave:**" (markdown do modelo)
+    names = "|".join(re.escape(f) for f in sorted(fields, key=len, reverse=True))
+    return re.compile(r"\b(" + names + r")\*{0,2}[ \t]*:\*{0,2}")
+
+
+def _clean(key: str, raw: str) -> str:
+    m = _NEXT_LINE_PREFIX.search(raw)
+    if m:
+        raw = raw[:m.start()]
+    value = " ".join(raw.split()).strip("*").strip()
+    limit = TRUNCATE_FIELDS.get(key)
+    if limit and len(value) > limit:
+        value = value[:limit] + "…"
+    return value
+
+
+class DaeFieldExtractor:
+    def __init__(self, fields: tuple = DAE_FIELDS):
+        self._pattern = _key_pattern(tuple(fields))
+        # sobra entre chamadas para achar chave/âncora/frase partida entre chunks
+        self._overlap = max(max(map(len, fields)) + 8, len(ANCHOR), len(DAE_PHRASE))
+        self._parts = []      # valor do campo aberto, menos a sobra (_tail)
+        self._tail = ""       # últimos caracteres ainda não confirmados como valor
+        self._key = None      # campo aberto
+        self._anchored = False
+        self.fields = {}      # campo -> valor, na ordem de chegada (vazios ficam de fora)
+        self.detected = False
+        self.closed = False
+        self.stats = {"chunks": 0, "chars": 0, "scanned": 0}
+
+    def push(self, part: str):
+        if not part or self.closed:
+            return
+        self.stats["chunks"] += 1
+        self.stats["chars"] += len(part)
+        # 1 caractere de contexto antes da janela para o \b da chave
+        before = self._parts[-1][-1:] if self._parts else ""
+        window = before + self._tail + part
+        start = len(before)
+        self.stats["scanned"] += len(window) - start
+        if not self.detected and DAE_PHRASE in window:
+            self.detected = True
+        if not self._anchored:
+            pos = window.find(ANCHOR, start)
+            if pos >= 0:
+                # como antes: com a âncora, só vale o que vem depois dela
+                self._anchored = self.detected = True
+                self.fields = {}
+                self._key = None
+                self._parts = []
+                start = pos + len(ANCHOR)
+        cut = start
+        for m in self._pattern.finditer(window, start):
+            self._close_field("".join(self._parts) + window[cut:m.start()])
+            self._parts = []
+            self._key = m.group(1)
+            if self._key == DAE_MARKER_FIELD:
+                self.detected = True
+            cut = m.end()
+        rest = window[cut:]
+        if len(rest) > self._overlap:
+            if self._key is not None:  # antes do 1º campo o texto não entra no bloco
+                self._parts.append(rest[:-self._overlap])
+            rest = rest[-self._overlap:]
+        self._tail = rest
+
+    def _close_field(self, raw: str):
+        if self._key is None:
+            return
+        value = _clean(self._key, raw)
+        if value:
+            self.fields[self._key] = value
+        else:
+            self.fields.pop(self._key, None)
+
+    def close(self) -> str:
+        """Fecha o último campo e devolve o bloco formatado."""
+        if not self.closed:
+            self.closed = True
+            self._close_field("".join(self._parts) + self._tail)
+            self._key = None
+            self._parts = []
+            self._tail = ""
+        return self.formatted
+
+    @property
+    def formatted(self) -> str:
+        """Bloco "campo: valor", um por linha; durante o stream inclui o campo ainda aberto."""
+        lines = [f"{k}: {v}" for k, v in self.fields.items()]
+        if self._key is not None:
+            value = _clean(self._key, "".join(self._parts) + self._tail)
+            if value:
+                lines.append(f"{self._key}: {value}")
+        return "\n".join(lines)
+
+
+def format_dae(text: str) -> str:
+    """Formata um texto já completo (mesmo resultado de alimentar o extrator trecho a trecho)."""
+    extractor = DaeFieldExtractor()
+    extractor.push(text)
+    return extractor.close()
@@ -0,0 +1,271 @@
+"""
+Emissão de DAE (2ª via) em lote, fora do chat: planilhas de despachantes e
+frotistas com um condutor por linha.
+
+Cada linha do CSV passa pela mesma lógica das ações do Agent, no processo:
+confirmar-dados e, com o flow_id devolvido, exibir-opcoes-pagamento
+(cet-mg-backend.lambda_handler, com a validação do schema). As linhas são
+lidas aos poucos e despachadas em blocos (--chunk) para um pool de
+processos limitado (--workers); no máximo 2 blocos por worker ficam em
+andamento, então a planilha nunca é carregada inteira.
+
+O resultado sai em CSV ou JSONL (pela extensão de --out ou --format), na
+ordem da entrada, bloco a bloco. Depois de cada bloco gravado o checkpoint
+(<out>.checkpoint.json) registra quantas linhas da entrada já estão no
+arquivo e o tamanho dele: uma execução interrompida, rodada de novo com os
+mesmos argumentos, descarta o que foi escrito depois do último checkpoint e
+continua da linha seguinte. Um --out que já existe sem checkpoint só é
+sobrescrito com --restart.
+
+Colunas aceitas: cpf, nome_condutor, data_nascimento, nome_mae (e os
+sinônimos x-aliases do schema: nome, nascimento, mae) e, opcional,
+numero_ip_micro. Separador detectado entre vírgula, ponto e vírgula e tab.
+
+Uso:
+    python cet_emissao_lote.py condutores.csv --out guias.csv [--workers 4] [--chunk 50]
+    python cet_emissao_lote.py condutores.csv --out guias.jsonl --restart
+"""
+import os
+import sys
+import io
+import csv
+import json
+import time
+import argparse
+import threading
+from collections import deque
+
+from cet_actions import invoke_backend
+from cet_schema import SCHEMA, error_message
+
+EMISSAO_WORKERS = int(os.environ.get("EMISSAO_WORKERS", str(os.cpu_count() or 1)))
+EMISSAO_CHUNK = int(os.environ.get("EMISSAO_CHUNK", "50"))
+# IP registrado na emissão quando a planilha não traz numero_ip_micro
+EMISSAO_IP_MICRO = os.environ.get("EMISSAO_IP_MICRO", "127.0.0.1")
+
+RESULT_FIELDS = ("linha", "cpf", "status", "etapa", "codigo", "flow_id", "nosso_numero", "linha_digitavel",
+                 "codigo_barras", "valor_taxa", "data_vencimento", "mes_ano_dae", "erro")
+# campos do retornoNsdgx414 copiados para o resultado
+DAE_FIELDS = ("nosso_numero", "linha_digitavel", "codigo_barras", "valor_taxa", "data_vencimento", "mes_ano_dae")
+
+# --------- worker (um por processo do pool) ---------
+_backend = None
+_ip_micro = EMISSAO_IP_MICRO
+
+
+def _init_worker(ip_micro: str):
+    global _backend, _ip_micro
+    # o backend imprime EMF/log por invocação; no lote isso só atrapalha a saída
+    os.environ.setdefault("LOG_ENABLED", "false")
+    os.environ.setdefault("METRICS_ENABLED", "false")
+    from cet_local import BACKEND_FILE, load_lambda
+    _backend = load_lambda(BACKEND_FILE)
+    _ip_micro = ip_micro
+    # processo principal morto com SIGKILL não encerra o pool: o worker sai sozinho quando fica órfão
+    parent = os.getppid()
+
+    def watch_parent():
+        while os.getppid() == parent:
+            time.sleep(1.0)
+        os._exit(1)
+    threading.Thread(target=watch_parent, daemon=True).start()
+
+
+def _call(op: str, body: dict):
+    status, _, text = invoke_backend(_backend, "POST", SCHEMA.paths[op], body)
+    try:
+        return status, json.loads(text or "{}")
+    except ValueError:
+        return status, {"message": text}
+
+
+def _failure(result: dict, etapa: str, status: int, body: dict) -> dict:
+    errors = body.get("errors")
+    result.update(status="erro", etapa=etapa, codigo=status,
+                  erro=error_message(errors) if errors else body.get("message", ""))
+    return result
+
+
+def emitir(linha: int, row: dict) -> dict:
+    """Confirma os dados e emite a DAE de uma linha; devolve o registro de resultado."""
+    data = SCHEMA.prepare({(k or "").strip().lower(): v for k, v in row.items()})
+    if isinstance(data.get("cpf"), str):
+        data["cpf"] = data["cpf"].replace(".", "").replace("-", "")  # 123.456.789-01 das planilhas
+    result = {"linha": linha, "cpf": data.get("cpf") or ""}
+
+    status, body = _call("confirmar-dados", data)
+    if status != 200:
+        return _failure(result, "confirmar-dados", status, body)
+    result["flow_id"] = body.get("flow_id")
+
+    status, body = _call("exibir-opcoes-pagamento",
+                         {"flow_id": result["flow_id"], "numero_ip_micro": data.get("numero_ip_micro") or _ip_micro})
+    if status != 200:
+        return _failure(result, "exibir-opcoes-pagamento", status, body)
+    dae = body.get("retornoNsdgx414") or {}
+    result.update({k: dae.get(k) for k in DAE_FIELDS}, status="ok", etapa="exibir-opcoes-pagamento", codigo=status)
+    return result
+
+
+def _emitir_bloco(rows: list) -> list:
+    out = []
+    for linha, row in rows:
+        try:
+            out.append(emitir(linha, row))
+        except Exception as e:
+            out.append({"linha": linha, "cpf": row.get("cpf") or "", "status": "erro", "codigo": 500,
+                        "erro": f"{type(e).__name__}: {e}"})
+    return out
+
+
+# --------- entrada, saída e checkpoint ---------
+def _read_rows(path: str, skip: int, delimiter: str = None):
+    """(número da linha de dados, dict) a partir da linha skip + 1."""
+    f = open(path, newline="", encoding="utf-8-sig")  # BOM do Excel
+    if delimiter is None:
+        sample = f.read(64 * 1024)
+        f.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t").delimiter
+        except csv.Error:
+            delimiter = ","
+    with f:
+        for n, row in enumerate(csv.DictReader(f, delimiter=delimiter), 1):
+            if n > skip:
+                yield n, row
+
+
+class ResultWriter:
+    """Arquivo de resultado (CSV ou JSONL) + checkpoint gravado depois de cada bloco."""
+
+    def __init__(self, path: str, fmt: str, source: str, restart: bool = False):
+        self.path = path
+        self.fmt = fmt
+        self.checkpoint_path = path + ".checkpoint.json"
+        self.source = os.path.abspath(source)
+        self.state = {"input": self.source, "format": fmt, "done": 0, "bytes": 0, "ok": 0, "erros": 0}
+        if not restart and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("input") != self.source or saved.get("format") != fmt:
+                raise SystemExit(f"checkpoint {self.checkpoint_path} é de outra entrada/formato; use --restart")
+            self.state = saved
+            if not os.path.exists(path) or os.path.getsize(path) < saved["bytes"]:
+                raise SystemExit(f"{path} é menor que o registrado no checkpoint; use --restart")
+        elif not restart and os.path.exists(path) and os.path.getsize(path) > 0:
+            # sem checkpoint não há como saber de onde veio o arquivo: não sobrescreve sem pedir
+            raise SystemExit(f"{path} já existe e não tem checkpoint; use --restart para sobrescrever")
+        self.resumed = self.state["done"]
+        self.file = open(path, "a+b" if self.state["bytes"] else "w+b")
+        # descarta o que foi escrito depois do último checkpoint (execução interrompida no meio do bloco)
+        self.file.truncate(self.state["bytes"])
+        self.file.seek(self.state["bytes"])
+        if fmt == "csv" and not self.state["bytes"]:
+            self._write_csv([dict(zip(RESULT_FIELDS, RESULT_FIELDS))])
+
+    def _write_csv(self, records):
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=RESULT_FIELDS, extrasaction="ignore", lineterminator="\n")
+        writer.writerows(records)
+        self.file.write(buf.getvalue().encode("utf-8"))
+
+    def write(self, records: list):
+        if self.fmt == "csv":
+            self._write_csv(records)
+        else:
+            self.file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        ok = sum(r.get("status") == "ok" for r in records)
+        self.state.update(done=max(r["linha"] for r in records), bytes=self.file.tell(),
+                          ok=self.state["ok"] + ok, erros=self.state["erros"] + len(records) - ok)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def close(self):
+        self.file.close()
+
+
+def _chunks(rows, size: int):
+    block = []
+    for item in rows:
+        block.append(item)
+        if len(block) >= size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def run(source: str, out: str, fmt: str = None, workers: int = EMISSAO_WORKERS, chunk: int = EMISSAO_CHUNK,
+        ip_micro: str = EMISSAO_IP_MICRO, restart: bool = False, delimiter: str = None,
+        progress_s: float = 5.0, log=sys.stderr) -> dict:
+    """Processa a planilha; devolve o estado final do checkpoint + duração e vazão desta execução."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    fmt = fmt or ("jsonl" if out.endswith((".jsonl", ".ndjson")) else "csv")
+    writer = ResultWriter(out, fmt, source, restart)
+    if writer.resumed:
+        print(f"retomando depois da linha {writer.resumed} ({writer.state['ok']} ok, "
+              f"{writer.state['erros']} com erro)", file=log)
+    started = last = time.perf_counter()
+    processed = 0
+    pending = deque()
+    blocks = _chunks(_read_rows(source, writer.resumed, delimiter), chunk)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(ip_micro,)) as pool:
+            try:
+                for block in blocks:
+                    pending.append(pool.submit(_emitir_bloco, block))
+                    if len(pending) < 2 * workers:
+                        continue
+                    # janela cheia: grava o bloco mais antigo (ordem da entrada) antes de ler mais
+                    records = pending.popleft().result()
+                    writer.write(records)
+                    processed += len(records)
+                    now = time.perf_counter()
+                    if progress_s and now - last >= progress_s:
+                        last = now
+                        print(f"{writer.state['done']} linhas ({processed / (now - started):.0f} linhas/s)",
+                              file=log)
+                while pending:
+                    records = pending.popleft().result()
+                    writer.write(records)
+                    processed += len(records)
+            except BaseException:
+                # interrompido: não espera os blocos na fila; o checkpoint já aponta o último gravado
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    return dict(writer.state, processed=processed, elapsed_s=round(elapsed, 3),
+                rows_per_s=round(processed / elapsed, 1) if elapsed else 0.0)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Emissão de DAE (2ª via) em lote a partir de uma planilha CSV.")
+    ap.add_argument("csv", help="planilha de entrada (uma linha por condutor)")
+    ap.add_argument("--out", "-o", required=True, help="arquivo de resultado (.csv ou .jsonl)")
+    ap.add_argument("--format", choices=("csv", "jsonl"), help="padrão: pela extensão de --out")
+    ap.add_argument("--workers", type=int, default=EMISSAO_WORKERS)
+    ap.add_argument("--chunk", type=int, default=EMISSAO_CHUNK, help="linhas por tarefa do pool")
+    ap.add_argument("--ip-micro", default=EMISSAO_IP_MICRO, help="numero_ip_micro quando a planilha não traz")
+    ap.add_argument("--delimiter", help="separador do CSV (padrão: detectado)")
+    ap.add_argument("--restart", action="store_true",
+                    help="ignora o checkpoint e começa do início (sobrescreve --out)")
+    ap.add_argument("--progress-s", type=float, default=5.0, help="intervalo do progresso no stderr (0 = sem)")
+    args = ap.parse_args(argv)
+
+    state = run(args.csv, args.out, args.format, args.workers, args.chunk, args.ip_micro, args.restart,
+                args.delimiter, args.progress_s)
+    print(f"{state['processed']} linhas em {state['elapsed_s']:.1f} s ({state['rows_per_s']:.0f} linhas/s, "
+          f"{args.workers} workers); total {state['done']}: {state['ok']} ok, {state['erros']} com erro "
+          f"-> {args.out}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+Armazenamento do estado do fluxo de 2ª via (flow_id).
+
+/confirmar-dados grava o registro confirmado (retornoNSDGXS02 + dados de
+identificação) e devolve um flow_id; /exibir-opcoes-pagamento resolve o
+flow_id com uma única busca por chave, sem o Agent reenviar os campos.
+
+Backends:
+- memory: dict no processo (vale enquanto o container da Lambda estiver quente)
+- sqlite: arquivo local, compartilhado só entre processos da mesma máquina
+  (vários Streamlit com o mesmo FLOW_STORE_PATH)
+
+Nenhum dos dois sobrevive de um container da Lambda para outro: /tmp é de
+cada container, então scale-out, cold start e redeploy perdem os fluxos,
+além do TTL. Por isso o flow_id é só um atalho: sem ele, a emissão valida
+os campos enviados pelo Agent (x-required-without-flow).
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+
+FLOW_STORE = os.environ.get("FLOW_STORE", "memory")
+FLOW_STORE_PATH = os.environ.get("FLOW_STORE_PATH", "/tmp/cet_flows.db")
+FLOW_TTL = float(os.environ.get("FLOW_TTL", "1800"))
+FLOW_MAX_ENTRIES = int(os.environ.get("FLOW_MAX_ENTRIES", "10000"))
+
+
+# campos do retornoNSDGXS02 reaproveitados na emissão da guia
+FLOW_FIELDS = ("cpf", "codigo_taxa", "codigo_servico", "numero_cnh", "codigo_municipio_condutor",
+               "ddd_celular", "numero_celular", "email")
+
+
+def new_flow_id() -> str:
+    return str(uuid.uuid4())
+
+
+def merge_flow(flow: dict, payload: dict) -> dict:
+    """Completa o payload com o registro do fluxo; valores enviados pelo Agent prevalecem."""
+    s02 = flow.get("retornoNSDGXS02") or {}
+    merged = {k: s02.get(k) for k in FLOW_FIELDS}
+    for k in ("nome_condutor", "data_nascimento", "nome_mae"):
+        merged[k] = flow.get(k)
+    for k, v in payload.items():
+        if v is not None and v != "":
+            merged[k] = v
+    return merged
+
+
+class InMemoryFlowStore:
+    def __init__(self, ttl: float = FLOW_TTL, max_entries: int = FLOW_MAX_ENTRIES, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._data = OrderedDict()  # flow_id -> (expires_at, record); ordem = ordem de expiração
+        self._lock = threading.Lock()
+
+    def create(self, record: dict) -> str:
+        flow_id = new_flow_id()
+        now = self._clock()
+        with self._lock:
+            self._data[flow_id] = (now + self.ttl, record)
+            # TTL é fixo, então as entradas mais antigas são as primeiras a vencer
+            while self._data:
+                oldest, (expires_at, _) = next(iter(self._data.items()))
+                if expires_at > now and len(self._data) <= self.max_entries:
+                    break
+                del self._data[oldest]
+        return flow_id
+
+    def get(self, flow_id: str):
+        if not flow_id:
+            return None
+        with self._lock:
+            item = self._data.get(flow_id)
+            if item is None:
+                return None
+            expires_at, record = item
+            if expires_at <= self._clock():
+                del self._data[flow_id]
+                return None
+            return record
+
+    def delete(self, flow_id: str):
+        with self._lock:
+            self._data.pop(flow_id, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteFlowStore:
+    def __init__(self, path: str = FLOW_STORE_PATH, ttl: float = FLOW_TTL, clock=time.time):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS flows ("
+            " flow_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, record TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS flows_expires_at ON flows (expires_at)")
+
+    def create(self, record: dict) -> str:
+        flow_id = new_flow_id()
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO flows (flow_id, expires_at, record) VALUES (?, ?, ?)",
+                (flow_id, now + self.ttl, json.dumps(record, ensure_ascii=False)),
+            )
+            self._conn.execute("DELETE FROM flows WHERE expires_at <= ?", (now,))
+        return flow_id
+
+    def get(self, flow_id: str):
+        if not flow_id:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, record FROM flows WHERE flow_id = ?", (flow_id,)
+            ).fetchone()
+        if row is None or row[0] <= self._clock():
+            return None
+        return json.loads(row[1])
+
+    def delete(self, flow_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM flows WHERE flow_id = ?", (flow_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM flows WHERE expires_at > ?", (self._clock(),)
+            ).fetchone()[0]
+
+
+def create_flow_store(kind: str = FLOW_STORE):
+    if kind == "sqlite":
+        return SQLiteFlowStore()
+    if kind == "memory":
+        return InMemoryFlowStore()
+    raise ValueError(f"FLOW_STORE desconhecido: {kind}")
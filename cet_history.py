@@ -0,0 +1,100 @@
+"""
+Histórico de chat em janela para as UIs Streamlit (app.py, app_simple.py).
+
+- cada mensagem ganha um id estável (new_message / ensure_ids);
+- só as últimas HISTORY_WINDOW mensagens são desenhadas; o botão "carregar
+  anteriores" amplia a janela em HISTORY_PAGE;
+- RENDER_CACHE guarda o HTML/markdown já montado de cada mensagem por id.
+  Fica neste módulo (e não no app) porque o script do Streamlit é
+  reexecutado a cada rerun e perderia um cache definido lá;
+- fragment: st.fragment quando disponível, para o chat rodar reruns
+  parciais sem redesenhar a página inteira.
+"""
+import os
+import uuid
+import threading
+from collections import OrderedDict
+
+HISTORY_WINDOW = int(os.environ.get("HISTORY_WINDOW", "30"))
+HISTORY_PAGE = int(os.environ.get("HISTORY_PAGE", "30"))
+HISTORY_CACHE_SIZE = int(os.environ.get("HISTORY_CACHE_SIZE", "4096"))
+
+WINDOW_KEY = "history_window"
+
+
+def new_message(role: str, content: str) -> dict:
+    return {"id": uuid.uuid4().hex, "role": role, "content": content}
+
+
+def ensure_ids(messages: list) -> list:
+    """Dá id às mensagens antigas (salvas antes dos ids existirem)."""
+    for m in messages:
+        if "id" not in m:
+            m["id"] = uuid.uuid4().hex
+    return messages
+
+
+def visible(messages: list, state) -> tuple:
+    """(quantas ficaram escondidas, mensagens a desenhar) para a janela atual da sessão."""
+    size = state.get(WINDOW_KEY) or HISTORY_WINDOW
+    if len(messages) <= size:
+        return 0, messages
+    return len(messages) - size, messages[-size:]
+
+
+def load_older(state):
+    """Callback do botão "carregar anteriores"."""
+    state[WINDOW_KEY] = (state.get(WINDOW_KEY) or HISTORY_WINDOW) + HISTORY_PAGE
+
+
+def reset_window(state):
+    state[WINDOW_KEY] = HISTORY_WINDOW
+
+
+class RenderCache:
+    """LRU (id da mensagem, variante) -> texto renderizado, compartilhado pelas sessões do processo."""
+
+    def __init__(self, maxsize: int = HISTORY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message: dict, render, variant: str = ""):
+        """Texto de `message` renderizado por `render(message)`; só chama render na falta."""
+        # o tamanho do conteúdo entra na chave: mensagem editada no lugar não reaproveita o antigo.
+        # CompactMessage traz o tamanho pronto (não é editável); ler content descomprimiria
+        size = getattr(message, "content_len", None)
+        if size is None:
+            size = len(message["content"])
+        key = (message["id"], size, variant)
+        with self._lock:
+            out = self._data.get(key)
+            if out is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return out
+        out = render(message)
+        with self._lock:
+            self.misses += 1
+            self._data[key] = out
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+RENDER_CACHE = RenderCache()
+
+
+def _identity(fn):
+    return fn
+
+
+def fragment_decorator(st):
+    """st.fragment (>= 1.37), st.experimental_fragment (1.33-1.36) ou rerun completo nas versões antigas."""
+    return getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or _identity
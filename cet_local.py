@@ -0,0 +1,139 @@
+"""
+Utilitários para rodar as Lambdas do Action Group localmente (benchmarks,
+fake do Bedrock, UI sem AWS).
+
+Os arquivos das Lambdas têm hífen no nome (cet-mg-backend.py), então são
+carregados por caminho em vez de import.
+"""
+import os
+import sys
+import threading
+import importlib.util
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from cet_actions import backend_event
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKEND_FILE = "cet-mg-backend.py"
+PROXY_FILE = "cet-mg-api-invocation.py"
+
+_loaded = {}
+# reentrante: uma Lambda pode carregar outra durante o próprio init (proxy com API_BASE=local://)
+_lock = threading.RLock()
+
+
+def load_lambda(filename: str, fresh: bool = False):
+    """Carrega (uma vez por processo) o módulo de uma Lambda pelo nome do arquivo."""
+    with _lock:
+        if not fresh and filename in _loaded:
+            return _loaded[filename]
+        name = os.path.splitext(filename)[0].replace("-", "_")
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+        mod = importlib.util.module_from_spec(spec)
+        if ROOT not in sys.path:
+            sys.path.insert(0, ROOT)
+        spec.loader.exec_module(mod)
+        _loaded[filename] = mod
+        return mod
+
+
+def start_gateway(backend, host: str = "127.0.0.1", port: int = 0):
+    """
+    Sobe um servidor HTTP/1.1 (keep-alive) que faz o papel do API Gateway:
+    converte cada requisição em evento de proxy integration e chama
+    backend.lambda_handler. Se o backend tiver stream_handler e a rota for
+    incremental, o corpo sai em chunks (Transfer-Encoding: chunked), linha a
+    linha. Retorna (server, base_url).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # cabeçalho e corpo saem em writes separados; sem isso o Nagle soma ~40ms por requisição
+        disable_nagle_algorithm = True
+
+        def _dispatch(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8") if length else None
+            path, _, query = self.path.partition("?")
+            event = backend_event(self.command, path, body,
+                                  dict(p.split("=", 1) for p in query.split("&") if "=" in p),
+                                  dict(self.headers))
+            stream = getattr(backend, "stream_handler", None)
+            result = stream(event, None) if stream else None
+            if result is None:
+                result = backend.lambda_handler(event, None)
+            out = result.get("body") or ""
+            self.send_response(result.get("statusCode", 200))
+            for k, v in (result.get("headers") or {}).items():
+                self.send_header(k, v)
+            if not isinstance(out, (str, bytes)):
+                # corpo incremental (NDJSON): um chunk por linha, enviado assim que o backend a produz
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for line in out:
+                    data = line.encode("utf-8") if isinstance(line, str) else line
+                    if data:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            out = out.encode("utf-8") if isinstance(out, str) else out
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        do_POST = _dispatch
+        do_GET = _dispatch
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def agent_event(api_path: str, op: str, props: dict, session_id: str, session_attrs: dict = None,
+                action_group: str = "cet-mg"):
+    """Evento de Action Group no formato que o Bedrock Agent envia para a Lambda."""
+    return {
+        "messageVersion": "1.0",
+        "agent": {"name": "cet-mg-agent", "id": "LOCAL", "alias": "LOCAL", "version": "DRAFT"},
+        "actionGroup": action_group,
+        "apiPath": api_path,
+        "httpMethod": "POST",
+        "operationId": op,
+        "sessionId": session_id,
+        "inputText": "",
+        "parameters": [],
+        "sessionAttributes": session_attrs or {},
+        "promptSessionAttributes": {},
+        "requestBody": {"content": {"application/json": {"properties": [
+            {"name": k, "type": "string", "value": v} for k, v in props.items()
+        ]}}},
+    }
+
+
+_stack = None
+
+
+def local_action_group():
+    """
+    Backend + gateway local + proxy prontos para uso no mesmo processo.
+    Se API_BASE não estiver definido, aponta o proxy para o gateway local.
+    Retorna o módulo do proxy (use proxy.lambda_handler(evento_bedrock, None)).
+    """
+    global _stack
+    with _lock:
+        if _stack is not None:
+            return _stack[1]
+    if not os.environ.get("API_BASE"):
+        backend = load_lambda(BACKEND_FILE)
+        server, base_url = start_gateway(backend)
+        os.environ["API_BASE"] = base_url
+    else:
+        server = None
+    proxy = load_lambda(PROXY_FILE)
+    with _lock:
+        _stack = (server, proxy)
+    return proxy
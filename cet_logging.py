@@ -0,0 +1,270 @@
+"""
+Log estruturado (JSON) das Lambdas do Action Group: amostrado, com dados
+pessoais mascarados e escrito fora do caminho da requisição.
+
+- Amostragem por rota/status (LOG_SAMPLE_RULES); erros (status >= 400 ou
+  exceção) saem sempre, o resto na taxa LOG_SAMPLE_RATE.
+- Mascaramento por nome de campo: os campos marcados com x-pii no
+  action_group_api_schema.yml (SCHEMA.pii_fields) + LOG_REDACT_EXTRA. Vale
+  para chaves de dict, para o formato properties do Agent ({"name","value"})
+  e para corpos JSON/NDJSON em string (body do API Gateway, responseBody do proxy).
+- A invocação só enfileira o registro; mascaramento e serialização rodam na
+  thread do QueueListener. Fila cheia descarta (e conta) em vez de bloquear.
+
+Na Lambda o processo congela após o retorno do handler: o que ainda estiver
+na fila sai no início da próxima invocação. Com LOG_FLUSH_ON_ERROR, registros
+de erro esperam a fila esvaziar (até LOG_FLUSH_TIMEOUT_MS) antes de retornar.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+
+LOG_ENABLED = os.environ.get("LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.05"))
+# "rota:status=taxa" separados por vírgula; rota/status aceitam "*" e status aceita classe (4xx)
+LOG_SAMPLE_RULES = os.environ.get("LOG_SAMPLE_RULES", "*:4xx=1,*:5xx=1")
+LOG_REDACT = os.environ.get("LOG_REDACT", "true").lower() in ("1", "true", "yes")
+# campos mascarados além dos x-pii do schema (inputText = texto livre do usuário)
+LOG_REDACT_EXTRA = os.environ.get("LOG_REDACT_EXTRA", "inputText")
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_FLUSH_ON_ERROR = os.environ.get("LOG_FLUSH_ON_ERROR", "true").lower() in ("1", "true", "yes")
+LOG_FLUSH_TIMEOUT_MS = float(os.environ.get("LOG_FLUSH_TIMEOUT_MS", "200"))
+
+MASK = "***"
+
+STATS = {"logged": 0, "sampled_out": 0, "dropped": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str):
+    with _stats_lock:
+        STATS[key] += 1
+
+
+def get_log_stats() -> dict:
+    with _stats_lock:
+        return dict(STATS)
+
+
+# --------- amostragem ---------
+def parse_rules(spec: str) -> dict:
+    """'rota:status=taxa,...' -> {(rota, status): taxa}. Sem ':' a regra vale para qualquer status."""
+    rules = {}
+    for item in (spec or "").split(","):
+        key, sep, rate = item.strip().partition("=")
+        if not sep:
+            continue
+        route, _, status = key.strip().partition(":")
+        rules[(route.strip() or "*", status.strip().lower() or "*")] = float(rate)
+    return rules
+
+
+class Sampler:
+    """Decide se uma invocação é logada. Regra mais específica vence: rota > status exato > classe."""
+
+    def __init__(self, default_rate: float = LOG_SAMPLE_RATE, rules: dict = None, rng=None):
+        self.default_rate = default_rate
+        self.rules = parse_rules(LOG_SAMPLE_RULES) if rules is None else rules
+        self._random = (rng or random.Random()).random
+
+    def rate(self, route: str, status) -> float:
+        rules = self.rules
+        status = str(status)
+        klass = status[:1] + "xx"
+        for key in ((route, status), (route, klass), (route, "*"),
+                    ("*", status), ("*", klass)):
+            if key in rules:
+                return rules[key]
+        return self.default_rate
+
+    def should_log(self, route: str, status, error: bool = False) -> bool:
+        if error:
+            return True
+        rate = self.rate(route, status)
+        return rate >= 1.0 or (rate > 0.0 and self._random() < rate)
+
+
+# --------- mascaramento ---------
+def _pii_fields() -> frozenset:
+    try:
+        from cet_schema import SCHEMA
+        fields = set(SCHEMA.pii_fields)
+    except Exception:
+        # sem schema (ex.: pacote da Lambda sem o YAML), mascara ao menos o básico
+        fields = {"cpf", "nome_condutor", "nome_mae", "data_nascimento", "nome", "mae", "nascimento"}
+    fields.update(f.strip() for f in LOG_REDACT_EXTRA.split(",") if f.strip())
+    return frozenset(fields)
+
+
+class Redactor:
+    def __init__(self, fields=None):
+        self.fields = frozenset(fields) if fields is not None else _pii_fields()
+
+    def __call__(self, value):
+        return self._walk(value, 0)
+
+    def _walk(self, value, depth):
+        if depth > 20:
+            return MASK
+        if isinstance(value, dict):
+            fields = self.fields
+            # properties do Agent: [{"name": "cpf", "type": "string", "value": "..."}]
+            if "name" in value and "value" in value and value.get("name") in fields:
+                return {k: (MASK if k == "value" else v) for k, v in value.items()}
+            # só valores escalares são mascarados: em {"errors": {"cpf": {...}}} a chave é o campo, não o dado
+            return {k: (MASK if k in fields and v is not None and not isinstance(v, (dict, list))
+                        else self._walk(v, depth + 1))
+                    for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._walk(v, depth + 1) for v in value]
+        if isinstance(value, str) and value[:1] in ("{", "["):
+            # corpo JSON serializado (API Gateway / Bedrock): mascara por dentro
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                # NDJSON (ex.: /exibir-dados/lote): um documento por linha
+                try:
+                    parsed = [json.loads(line) for line in value.splitlines() if line.strip()]
+                except ValueError:
+                    return value
+            return self._walk(parsed, depth + 1)
+        return value
+
+
+# --------- pipeline ---------
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro; o payload (extra={"payload": ...}) é mascarado aqui."""
+
+    def __init__(self, redactor=None):
+        super().__init__()
+        self.redactor = redactor
+
+    def format(self, record):
+        doc = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload = getattr(record, "payload", None)
+        if payload:
+            doc.update(self.redactor(payload) if self.redactor else payload)
+        if record.exc_text:
+            doc["exception"] = record.exc_text
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Escreve no sys.stdout corrente (como emit_emf), não no capturado na criação."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def _queue_handler(q):
+    """QueueHandler que não bloqueia; logging.handlers só é importado aqui (puxa socket, pickle...)."""
+    from logging.handlers import QueueHandler
+
+    class NonBlockingQueueHandler(QueueHandler):
+        def prepare(self, record):
+            # só o traceback é formatado aqui (o frame não pode sobreviver à invocação);
+            # payload e mensagem são tratados na thread do listener
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            return record
+
+        def enqueue(self, record):
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                _count("dropped")
+
+    return NonBlockingQueueHandler(q)
+
+
+_logger = None
+_queue = None
+_listener = None
+_sampler = None
+_setup_lock = threading.Lock()
+
+
+def get_logger() -> logging.Logger:
+    """Logger "cet" ligado à fila; o listener é criado na primeira chamada."""
+    global _logger, _queue, _listener, _sampler
+    if _logger is not None:
+        return _logger
+    with _setup_lock:
+        if _logger is None:
+            _queue = queue.Queue(LOG_QUEUE_SIZE)
+            out = _StdoutHandler()
+            out.setFormatter(JsonFormatter(Redactor() if LOG_REDACT else None))
+            from logging.handlers import QueueListener
+            _listener = QueueListener(_queue, out)
+            _listener.start()
+            atexit.register(_listener.stop)
+            _sampler = Sampler()
+            logger = logging.getLogger("cet")
+            logger.setLevel(LOG_LEVEL)
+            logger.propagate = False  # o root da Lambda já escreve no CloudWatch; evita linha duplicada
+            logger.addHandler(_queue_handler(_queue))
+            _logger = logger
+    return _logger
+
+
+def flush(timeout_ms: float = LOG_FLUSH_TIMEOUT_MS) -> bool:
+    """Espera a fila esvaziar (até timeout_ms). Retorna True se esvaziou."""
+    if _queue is None:
+        return True
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while _queue.unfinished_tasks:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def log_invocation(service: str, route: str, status, event=None, response=None,
+                   duration_ms: float = None, error: BaseException = None, context=None, **fields):
+    """
+    Registra uma invocação se a amostragem permitir. Erros levam evento e
+    resposta completos (mascarados); amostras normais também, já que a taxa
+    controla o volume. Retorna True se o registro foi enfileirado.
+    """
+    if not LOG_ENABLED:
+        return False
+    logger = get_logger()
+    is_error = error is not None or (isinstance(status, int) and status >= 400)
+    if not _sampler.should_log(route, status, error is not None):
+        _count("sampled_out")
+        return False
+    payload = {"service": service, "route": route, "status": status}
+    if duration_ms is not None:
+        payload["duration_ms"] = round(duration_ms, 3)
+    request_id = getattr(context, "aws_request_id", None)
+    if request_id:
+        payload["request_id"] = request_id
+    payload.update(fields)
+    if event is not None:
+        payload["event"] = event
+    if response is not None:
+        payload["response"] = response
+    level = logging.ERROR if is_error else logging.INFO
+    logger.log(level, "invocation", exc_info=error, extra={"payload": payload})
+    _count("logged")
+    if is_error and LOG_FLUSH_ON_ERROR:
+        flush()
+    return True
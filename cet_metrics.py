@@ -0,0 +1,120 @@
+"""
+Medição de tempo por fase e emissão de métricas no formato CloudWatch
+Embedded Metric Format (EMF) para as Lambdas do Action Group.
+
+Cada linha EMF é um JSON impresso no stdout; o CloudWatch Logs extrai as
+métricas automaticamente, sem chamadas à API PutMetricData.
+"""
+import os
+import sys
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CETMG/ActionGroup")
+
+_current_timer = contextvars.ContextVar("cet_phase_timer", default=None)
+
+
+class PhaseTimer:
+    """
+    Acumula a duração (ms) de cada fase de uma invocação.
+    Fases aninhadas são descontadas da fase externa, então a soma das fases
+    nunca ultrapassa o total.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self._children = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            child = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            self.phases[name] = self.phases.get(name, 0.0) + (elapsed - child) * 1000.0
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    def as_metrics(self) -> dict:
+        out = {f"{k}_ms": round(v, 3) for k, v in self.phases.items()}
+        out["total_ms"] = round(self.total_ms(), 3)
+        return out
+
+
+@contextmanager
+def start_timer():
+    """Abre um PhaseTimer e o torna o timer corrente para phase()."""
+    timer = PhaseTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    """Mede uma fase no timer corrente; sem timer ativo, não faz nada."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+    else:
+        with timer.phase(name):
+            yield
+
+
+_init_ms = {}  # serviço -> duração do init ainda não emitida (só a 1ª invocação do processo leva)
+
+
+def record_init(service: str, started: float):
+    """Registra a duração do init do módulo (import + pré-aquecimento) a partir de perf_counter()."""
+    _init_ms[service] = (time.perf_counter() - started) * 1000.0
+
+
+def cold_start_metrics(service: str) -> dict:
+    """{"init_ms": ...} na primeira chamada após record_init (cold start); depois, {}."""
+    ms = _init_ms.pop(service, None)
+    return {} if ms is None else {"init_ms": round(ms, 3)}
+
+
+def emf_record(service: str, dimensions: dict, metrics: dict, properties: dict = None) -> dict:
+    """Monta o documento EMF (todas as métricas em milissegundos)."""
+    dims = {k: str(v) for k, v in dimensions.items()}
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [["Service"] + list(dims)],
+                "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in metrics],
+            }],
+        },
+        "Service": service,
+    }
+    record.update(dims)
+    record.update(metrics)
+    if properties:
+        record.update(properties)
+    return record
+
+
+def emit_emf(service: str, dimensions: dict, metrics: dict, properties: dict = None, stream=None):
+    """Imprime uma linha EMF no stdout (ou em `stream`)."""
+    if not METRICS_ENABLED:
+        return None
+    record = emf_record(service, dimensions, metrics, properties)
+    out = stream or sys.stdout
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+    return record
@@ -0,0 +1,319 @@
+"""
+Resiliência da chamada do proxy (cet-mg-api-invocation.py) ao API Gateway.
+
+Antes: timeout fixo (HTTP_TIMEOUT), nenhuma nova tentativa e 502 para
+qualquer exceção, mesmo com boa parte do tempo da Lambda sobrando; uma
+integração lenta travava a conversa inteira. O ResilientCaller envolve cada
+chamada com:
+
+- prazo (Deadline): o menor entre HTTP_TIMEOUT e o tempo restante da
+  Lambda (context.get_remaining_time_in_millis) menos RESILIENCE_SAFETY_MS,
+  reservado para montar o envelope e responder ao Agent. Cada tentativa usa
+  o que sobra do prazo como timeout;
+- novas tentativas só para operações idempotentes (RETRY_OPERATIONS), em
+  erro de transporte ou status 429/502/503/504, com backoff exponencial e
+  jitter total, e só enquanto ainda couber uma tentativa no prazo;
+- requisição hedged: numa operação idempotente, se a resposta passar do
+  p95 recente da rota, uma segunda requisição igual sai em paralelo e vale
+  a que responder primeiro;
+- circuit breaker por rota: BREAKER_FAILURES falhas seguidas abrem o
+  circuito por BREAKER_COOLDOWN_S; enquanto aberto, a chamada falha na hora
+  (CircuitOpenError) e o Agent recebe o erro sem esperar o timeout. Depois
+  do cooldown uma única requisição de teste decide se fecha de novo.
+
+confirmar-dados e exibir-opcoes-pagamento criam estado no backend (flow_id,
+guia) e por isso ficam fora de RETRY_OPERATIONS por padrão: têm prazo e
+breaker, mas uma tentativa só.
+"""
+import os
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes", "on")
+
+
+RESILIENCE_SAFETY_MS = float(os.environ.get("RESILIENCE_SAFETY_MS", "300"))
+RETRY_OPERATIONS = frozenset(op.strip() for op in os.environ.get("RETRY_OPERATIONS", "exibir-dados").split(",")
+                             if op.strip())
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_MS = float(os.environ.get("RETRY_BASE_MS", "50"))
+RETRY_MAX_BACKOFF_MS = float(os.environ.get("RETRY_MAX_BACKOFF_MS", "800"))
+# não começa uma tentativa com menos tempo que isto no prazo
+RETRY_MIN_ATTEMPT_MS = float(os.environ.get("RETRY_MIN_ATTEMPT_MS", "100"))
+RETRY_STATUSES = frozenset((429, 502, 503, 504))
+
+HEDGE_ENABLED = _env_bool("HEDGE_ENABLED", "true")
+HEDGE_QUANTILE = float(os.environ.get("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_MS = float(os.environ.get("HEDGE_MIN_DELAY_MS", "20"))
+HEDGE_MAX_WORKERS = int(os.environ.get("HEDGE_MAX_WORKERS", "8"))
+LATENCY_WINDOW = int(os.environ.get("LATENCY_WINDOW", "200"))
+
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_S = float(os.environ.get("BREAKER_COOLDOWN_S", "30"))
+
+
+class DeadlineExceeded(Exception):
+    """O prazo da chamada acabou antes de uma resposta."""
+
+
+class CircuitOpenError(Exception):
+    """Circuito da rota aberto: falha imediata, sem chamar o backend."""
+
+    def __init__(self, route: str, retry_in: float):
+        super().__init__(f"circuito aberto para {route}; nova tentativa em {retry_in:.0f}s")
+        self.route = route
+        self.retry_in = retry_in
+
+
+class Deadline:
+    def __init__(self, budget_s: float, clock=time.monotonic):
+        self._clock = clock
+        self.expires = clock() + max(0.0, budget_s)
+
+    @classmethod
+    def from_context(cls, context, cap_s: float, safety_ms: float = RESILIENCE_SAFETY_MS):
+        """Prazo da chamada: HTTP_TIMEOUT, limitado pelo que resta da invocação da Lambda."""
+        budget = cap_s
+        remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+        if callable(remaining_ms):
+            budget = min(cap_s, (remaining_ms() - safety_ms) / 1000.0)
+        return cls(budget)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - self._clock())
+
+
+class LatencyWindow:
+    """Últimas durações (ms) das respostas de uma rota, para o limiar do hedge."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def add(self, ms: float):
+        self._samples.append(ms)
+
+    def quantile(self, q: float):
+        samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown_s: float = BREAKER_COOLDOWN_S,
+                 clock=time.monotonic):
+        self.threshold = failures
+        self.cooldown_s = cooldown_s
+        self._clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True se a chamada pode sair; no half-open só passa uma requisição de teste."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if self._clock() - self.opened_at < self.cooldown_s:
+                    return False
+                self.state = "half_open"
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def retry_in(self) -> float:
+        return max(0.0, self.cooldown_s - (self._clock() - self.opened_at))
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """Chamada liberada que não chegou a sair (prazo): devolve a vaga de teste do half-open."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self) -> bool:
+        """Conta uma falha; devolve True se o circuito abriu agora."""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.state = "open"
+                self.opened_at = self._clock()
+                self._probing = False
+                return True
+            return False
+
+
+def _timed(attempt, timeout):
+    started = time.perf_counter()
+    result = attempt(timeout)
+    return result, (time.perf_counter() - started) * 1000.0
+
+
+class ResilientCaller:
+    """Prazo, novas tentativas, hedge e circuit breaker por rota (uma instância por processo)."""
+
+    def __init__(self, retry_operations=RETRY_OPERATIONS, max_attempts: int = RETRY_MAX_ATTEMPTS,
+                 base_ms: float = RETRY_BASE_MS, max_backoff_ms: float = RETRY_MAX_BACKOFF_MS,
+                 min_attempt_ms: float = RETRY_MIN_ATTEMPT_MS, hedge: bool = HEDGE_ENABLED,
+                 hedge_quantile: float = HEDGE_QUANTILE, hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+                 hedge_min_delay_ms: float = HEDGE_MIN_DELAY_MS, breaker_failures: int = BREAKER_FAILURES,
+                 breaker_cooldown_s: float = BREAKER_COOLDOWN_S, sleep=time.sleep):
+        self.retry_operations = frozenset(retry_operations)
+        self.max_attempts = max(1, max_attempts)
+        self.base_ms = base_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.min_attempt_ms = min_attempt_ms
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown_s = breaker_cooldown_s
+        self._sleep = sleep
+        self._latency = {}   # rota -> LatencyWindow
+        self._breakers = {}  # rota -> CircuitBreaker
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "short_circuits": 0,
+                      "breaker_opened": 0, "deadline_exceeded": 0}
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _route(self, route):
+        with self._lock:
+            breaker = self._breakers.get(route)
+            if breaker is None:
+                breaker = self._breakers[route] = CircuitBreaker(self.breaker_failures, self.breaker_cooldown_s)
+                self._latency[route] = LatencyWindow()
+            return breaker, self._latency[route]
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return self._executor
+
+    def _backoff(self, attempt: int) -> float:
+        # jitter total: espalha as novas tentativas de Lambdas que falharam juntas
+        return random.uniform(0.0, min(self.max_backoff_ms, self.base_ms * (2 ** attempt))) / 1000.0
+
+    def call(self, route: str, attempt, deadline: Deadline, retryable=None):
+        """
+        `attempt(timeout_s)` faz uma requisição e devolve o resultado;
+        `retryable(resultado)` diz se a resposta conta como falha (ex.: 503).
+        Com as tentativas esgotadas, devolve a última resposta ou propaga a
+        última exceção; sem tempo para nenhuma tentativa, DeadlineExceeded.
+        """
+        breaker, latency = self._route(route)
+        if not breaker.allow():
+            self._count("short_circuits")
+            raise CircuitOpenError(route, breaker.retry_in())
+        self._count("calls")
+        idempotent = route in self.retry_operations
+        attempts = self.max_attempts if idempotent else 1
+        result, error, tried = None, None, False
+        for n in range(attempts):
+            if n:
+                if breaker.is_open:
+                    break
+                pause = self._backoff(n)
+                if (deadline.remaining() - pause) * 1000.0 < self.min_attempt_ms:
+                    break
+                self._sleep(pause)
+                self._count("retries")
+            timeout = deadline.remaining()
+            if timeout * 1000.0 < self.min_attempt_ms and tried:
+                break
+            if timeout <= 0:
+                break
+            tried = True
+            try:
+                result, error = self._attempt(attempt, timeout, latency, hedge=idempotent), None
+            except Exception as e:
+                result, error = None, e
+                if breaker.failure():
+                    self._count("breaker_opened")
+                continue
+            if retryable is not None and retryable(result):
+                if breaker.failure():
+                    self._count("breaker_opened")
+                continue
+            breaker.success()
+            return result
+        if result is not None:
+            return result  # resposta de erro do backend (ex.: 503) segue para o Agent como veio
+        if error is not None:
+            raise error
+        breaker.release()
+        self._count("deadline_exceeded")
+        raise DeadlineExceeded(f"sem tempo para chamar {route} (prazo esgotado)")
+
+    def _attempt(self, attempt, timeout, latency, hedge):
+        delay = None
+        if hedge and self.hedge and len(latency) >= self.hedge_min_samples:
+            delay = max(self.hedge_min_delay_ms, latency.quantile(self.hedge_quantile)) / 1000.0
+        if delay is None or delay >= timeout:
+            result, ms = _timed(attempt, timeout)
+            latency.add(ms)
+            return result
+
+        pool = self._pool()
+        first = pool.submit(_timed, attempt, timeout)
+        done, _ = wait([first], timeout=delay)
+        if not done:
+            # passou do p95: segunda requisição igual; vale a que responder primeiro
+            self._count("hedges")
+            second = pool.submit(_timed, attempt, max(0.0, timeout - delay))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result, ms = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if future is second:
+                        self._count("hedge_wins")
+                    latency.add(ms)
+                    return result
+            raise error
+        result, ms = first.result()
+        latency.add(ms)
+        return result
+
+    def breaker_states(self) -> dict:
+        with self._lock:
+            return {route: b.state for route, b in self._breakers.items()}
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open_routes"] = sorted(r for r, b in self._breakers.items() if b.state != "closed")
+        return stats
@@ -0,0 +1,159 @@
+"""
+Return of control: as ações do Action Group rodam no próprio app Streamlit.
+
+No caminho padrão cada ação faz Bedrock -> Lambda cet-mg-api-invocation ->
+API Gateway -> Lambda cet-mg-backend, com dois saltos de rede e duas Lambdas
+sujeitas a cold start. Com o Action Group configurado com
+customControl=RETURN_CONTROL, o Agent devolve a ação no stream
+(evento "returnControl") e espera o resultado num novo invoke_agent da mesma
+sessão (sessionState.returnControlInvocationResults).
+
+- LocalActionRunner: executa cada apiInvocationInput chamando o
+  lambda_handler do cet-mg-backend no processo (mesmo evento do API
+  Gateway, mesma promoção de sessionAttributes do proxy) e mede a latência
+  por rota;
+- invoke_with_return_control: envolve o invoke_agent e repassa os eventos
+  do stream; a cada returnControl roda as ações e reinvoca com os
+  resultados até o Agent terminar a resposta.
+
+AGENT_RETURN_CONTROL=true liga o modo nos apps (o Action Group do Agent
+precisa estar com RETURN_CONTROL). O backend guarda o fluxo (flow_id) no
+FLOW_STORE: com mais de um processo do Streamlit use FLOW_STORE=sqlite
+com o mesmo FLOW_STORE_PATH para todos (memory vale só no processo).
+"""
+import os
+import json
+import time
+import threading
+from collections import deque
+
+from cet_actions import extract_session, guess_operation, invoke_backend
+
+RETURN_CONTROL_ENABLED = os.environ.get("AGENT_RETURN_CONTROL", "false").lower() in ("1", "true", "yes", "on")
+RETURN_CONTROL_MAX_ROUNDS = int(os.environ.get("RETURN_CONTROL_MAX_ROUNDS", "5"))
+# amostras de latência guardadas por rota para p50/p95
+RETURN_CONTROL_SAMPLES = int(os.environ.get("RETURN_CONTROL_SAMPLES", "500"))
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _api_result(api: dict, status: int, body: str) -> dict:
+    return {"apiResult": {
+        "actionGroup": api.get("actionGroup") or "",
+        "apiPath": api.get("apiPath") or "/",
+        "httpMethod": (api.get("httpMethod") or "POST").upper(),
+        "httpStatusCode": status,
+        "responseBody": {"application/json": {"body": body}},
+    }}
+
+
+class LocalActionRunner:
+    """Executa as ações devolvidas pelo Agent no processo, pelo lambda_handler do backend."""
+
+    def __init__(self, backend=None, samples: int = RETURN_CONTROL_SAMPLES):
+        if backend is None:
+            from cet_local import BACKEND_FILE, load_lambda
+            backend = load_lambda(BACKEND_FILE)
+        self.backend = backend
+        self.samples = samples
+        self._latency = {}  # apiPath -> deque de ms
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def run(self, invocation: dict, session_attrs: dict = None, turn=None) -> dict:
+        """
+        Um item de returnControl.invocationInputs -> item de
+        returnControlInvocationResults. Atualiza `session_attrs` no lugar com
+        os campos que o proxy promoveria a sessionAttributes.
+        """
+        api = invocation.get("apiInvocationInput")
+        if api is None:
+            # o schema do CET-MG só tem ações por API; função sem handler volta como falha
+            fn = invocation.get("functionInvocationInput") or {}
+            return {"functionResult": {
+                "actionGroup": fn.get("actionGroup") or "",
+                "function": fn.get("function") or "",
+                "responseState": "FAILURE",
+                "responseBody": {"TEXT": {"body": "função não suportada no return of control"}},
+            }}
+        path = api.get("apiPath") or "/"
+        method = (api.get("httpMethod") or "POST").upper()
+        query = {p.get("name"): p.get("value") for p in api.get("parameters") or () if p.get("name")}
+        started = time.perf_counter()
+        try:
+            status, ctype, text = invoke_backend(self.backend, method, path, api.get("requestBody"), query)
+            attrs = extract_session(guess_operation({"apiPath": path}), status, ctype, text)
+        except Exception as e:
+            # mesmo formato do _error_envelope do proxy
+            status, text = 502, json.dumps({"message": f"Falha ao chamar backend: {e}"}, ensure_ascii=False)
+            attrs = {"last_error": f"Falha ao chamar backend: {e}", "last_error_code": "502"}
+        ended = time.perf_counter()
+        self._record(path, (ended - started) * 1000.0, status)
+        if session_attrs is not None:
+            session_attrs.update(attrs)
+        if turn is not None:
+            turn.local_action(path, started, ended, status=status)
+        return _api_result(api, status, text)
+
+    def _record(self, path, ms, status):
+        with self._lock:
+            samples = self._latency.get(path)
+            if samples is None:
+                samples = self._latency[path] = deque(maxlen=self.samples)
+            samples.append(ms)
+            if status >= 500:
+                self._errors[path] = self._errors.get(path, 0) + 1
+
+    def stats(self) -> dict:
+        """Latência por rota (ms) das últimas execuções locais."""
+        with self._lock:
+            return {
+                path: {"calls": len(ms), "p50_ms": round(_percentile(ms, 0.5), 2),
+                       "p95_ms": round(_percentile(ms, 0.95), 2), "max_ms": round(max(ms), 2),
+                       "errors": self._errors.get(path, 0)}
+                for path, ms in self._latency.items() if ms
+            }
+
+
+def invoke_with_return_control(client, runner: LocalActionRunner = None, session_attrs: dict = None,
+                               turn=None, max_rounds: int = RETURN_CONTROL_MAX_ROUNDS, **invoke_kwargs):
+    """
+    Gera os eventos do stream do invoke_agent (chunk, trace...) como o
+    response["completion"] original. Cada returnControl é resolvido com o
+    `runner` e a conversa continua num novo invoke_agent; sem runner (modo
+    Lambda) um returnControl é erro de configuração do Agent.
+    """
+    state = dict(invoke_kwargs.pop("sessionState", None) or {})
+    if session_attrs:
+        state["sessionAttributes"] = dict(session_attrs)
+    rounds = 0
+    while True:
+        if state:
+            invoke_kwargs["sessionState"] = state
+        response = client.invoke_agent(**invoke_kwargs)
+        control = None
+        for event in response.get("completion", []):
+            if "returnControl" in event:
+                control = event["returnControl"]
+                continue
+            yield event
+        if control is None:
+            return
+        if runner is None:
+            raise RuntimeError("o Agent devolveu o controle, mas AGENT_RETURN_CONTROL está desligado")
+        rounds += 1
+        if rounds > max_rounds:
+            raise RuntimeError(f"return of control passou de {max_rounds} rodadas no mesmo turno")
+        if session_attrs is None:
+            session_attrs = {}
+        results = [runner.run(inv, session_attrs, turn) for inv in control.get("invocationInputs") or ()]
+        state = {
+            "invocationId": control.get("invocationId"),
+            "returnControlInvocationResults": results,
+            "sessionAttributes": dict(session_attrs),
+        }
+        # a continuação não leva texto novo do usuário
+        invoke_kwargs.pop("inputText", None)
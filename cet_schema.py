@@ -0,0 +1,190 @@
+"""
+Motor de validação/normalização compilado a partir do action_group_api_schema.yml.
+
+O schema é lido uma única vez na importação e cada operação vira uma tabela
+de regras (campo, regex compilada, mensagens prontas). Em tempo de requisição:
+
+- prepare(): achata o formato de properties do Agent, aplica os sinônimos
+  (x-aliases) e faz strip dos textos, tudo em uma só passada;
+- validate(): confere obrigatórios e patterns e devolve TODOS os erros de
+  uma vez, no formato do ErroValidacao.
+
+Extensões usadas no schema: x-aliases (sinônimos aceitos), x-hint (texto
+de ajuda para pattern inválido), x-required-without-flow (obrigatórios de
+exibir-opcoes-pagamento quando não há flow_id) e x-pii (campo com dado
+pessoal, mascarado nos logs; ver pii_fields).
+"""
+import os
+import re
+import yaml
+
+SCHEMA_PATH = os.environ.get(
+    "CET_SCHEMA_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "action_group_api_schema.yml"),
+)
+
+
+class CompiledSchema:
+    def __init__(self, spec: dict):
+        components = (spec.get("components") or {}).get("schemas") or {}
+        self.components = components
+        self.rules = {}      # operationId -> regras (tupla de _compile_rules)
+        self.fallback = {}   # operationId -> regras sem flow_id
+        self.paths = {}      # operationId -> path
+        aliases = {}
+        for path, item in (spec.get("paths") or {}).items():
+            for method, op in item.items():
+                if not isinstance(op, dict) or "operationId" not in op:
+                    continue
+                schema = self._request_schema(op, components)
+                if schema is None:
+                    continue
+                op_id = op["operationId"]
+                props = schema.get("properties") or {}
+                self.paths[op_id] = path
+                self.rules[op_id] = self._compile_rules(schema.get("required") or [], props)
+                if "x-required-without-flow" in schema:
+                    self.fallback[op_id] = self._compile_rules(schema["x-required-without-flow"], props)
+                for name, prop in props.items():
+                    for alias in prop.get("x-aliases") or ():
+                        aliases[alias] = name
+        self.aliases = aliases
+        self.pii_fields = self._collect_pii(components, aliases)
+
+    @staticmethod
+    def _request_schema(op: dict, components: dict):
+        try:
+            schema = op["requestBody"]["content"]["application/json"]["schema"]
+        except (KeyError, TypeError):
+            return None
+        ref = schema.get("$ref")
+        if ref:
+            schema = components.get(ref.rsplit("/", 1)[-1])
+        return schema
+
+    @staticmethod
+    def _collect_pii(components: dict, aliases: dict) -> frozenset:
+        """Nomes de campo marcados com x-pii em qualquer schema (inclusive aninhado) + seus sinônimos."""
+        names = set()
+        stack = list(components.values())
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for name, prop in (node.get("properties") or {}).items():
+                    if isinstance(prop, dict) and prop.get("x-pii"):
+                        names.add(name)
+                stack.extend(v for v in node.values() if isinstance(v, (dict, list)))
+            elif isinstance(node, list):
+                stack.extend(node)
+        names.update(alias for alias, name in aliases.items() if name in names)
+        return frozenset(names)
+
+    def field_names(self, component: str) -> tuple:
+        """Campos folha de um schema de components, na ordem do yml (objetos aninhados achatados)."""
+        names = []
+
+        def walk(node):
+            ref = node.get("$ref")
+            if ref:
+                node = self.components.get(ref.rsplit("/", 1)[-1]) or {}
+            props = node.get("properties")
+            if not props:
+                return False
+            for name, prop in props.items():
+                if not (isinstance(prop, dict) and walk(prop)):
+                    names.append(name)
+            return True
+
+        walk(self.components.get(component) or {})
+        return tuple(names)
+
+    @staticmethod
+    def _compile_rules(required, props) -> tuple:
+        """(campo, match da regex ou None, msg de obrigatório, msg de inválido) por campo obrigatório."""
+        rules = []
+        for field in required:
+            prop = props.get(field) or {}
+            pattern = prop.get("pattern")
+            rules.append((
+                field,
+                re.compile(pattern).match if pattern else None,
+                f'O campo "{field}" é obrigatório',
+                f'Campo "{field}" inválido. {prop.get("x-hint", "")}'.strip(),
+            ))
+        return tuple(rules)
+
+    def prepare(self, payload) -> dict:
+        """
+        Achata + normaliza numa passada. Aceita tanto
+        {"content":{"application/json":{"properties":[{"name":..,"value":..}]}}}
+        quanto um dict simples. O nome canônico prevalece sobre o sinônimo.
+        """
+        if not isinstance(payload, dict):
+            return {}
+        items = payload
+        content = payload.get("content")
+        if isinstance(content, dict):
+            props = (content.get("application/json") or {}).get("properties")
+            if isinstance(props, list):
+                items = {p.get("name"): p.get("value") for p in props if isinstance(p, dict)}
+
+        aliases = self.aliases
+        out = {}
+        pending = None  # sinônimos: só valem se o nome canônico não vier
+        for k, v in items.items():
+            if k is None:
+                continue
+            if v.__class__ is str:
+                v = v.strip()
+            canonical = aliases.get(k)
+            if canonical is None:
+                out[k] = v
+            else:
+                if pending is None:
+                    pending = {}
+                pending.setdefault(canonical, v)
+        if pending:
+            for k, v in pending.items():
+                if k not in out:
+                    out[k] = v
+        return out
+
+    def validate(self, operation: str, payload: dict, has_flow: bool = False) -> dict:
+        """
+        Retorna {campo: {"_required"|"_invalid": mensagem}} com todos os
+        problemas encontrados (dict vazio = válido). Sem flow resolvido,
+        usa x-required-without-flow quando a operação o define.
+        Espera um payload já normalizado por prepare() (textos sem espaços nas pontas).
+        """
+        rules = self.rules.get(operation, ())
+        if not has_flow:
+            rules = self.fallback.get(operation, rules)
+        errors = {}
+        for field, match, required, invalid in rules:
+            v = payload.get(field)
+            if v is None or v == "":
+                errors[field] = {"_required": required}
+            elif match is not None and v.__class__ is str and match(v) is None:
+                errors[field] = {"_invalid": invalid}
+        return errors
+
+    def parse(self, operation: str, payload, has_flow: bool = False):
+        data = self.prepare(payload)
+        return data, self.validate(operation, data, has_flow)
+
+
+# parser em C (libyaml) quando disponível: ~10x mais rápido que o puro Python no cold start
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def load_schema(path: str = SCHEMA_PATH) -> CompiledSchema:
+    with open(path, "r", encoding="utf-8") as f:
+        return CompiledSchema(yaml.load(f, Loader=_Loader))
+
+
+def error_message(errors: dict) -> str:
+    """Junta as mensagens de erro em um texto único (para a UI)."""
+    return "; ".join(msg for e in errors.values() for msg in e.values())
+
+
+SCHEMA = load_schema()
@@ -0,0 +1,238 @@
+"""
+Orçamento de memória das sessões Streamlit (messages / user_data).
+
+Sem limite, cada aba aberta acumulava o histórico inteiro como dicts com
+strings completas (respostas de DAE longas incluídas) e o processo só
+crescia até ser reiniciado. O SessionMemoryManager, compartilhado pelo
+processo (st.cache_resource), faz três coisas a cada track():
+
+- limite por sessão: mantém só as últimas SESSION_HISTORY_CAP mensagens;
+- compactação: mensagens fora das últimas SESSION_COMPACT_AFTER viram
+  CompactMessage (__slots__, papel internado, conteúdo em bytes UTF-8 e
+  zlib a partir de SESSION_COMPRESS_MIN bytes);
+- orçamento do processo: passando de SESSION_MEMORY_BUDGET_MB, esvazia as
+  sessões ociosas há mais de SESSION_IDLE_MIN_S, da menos recente para a
+  mais recente (LRU). Sessões sem uso há SESSION_IDLE_TTL_S são liberadas
+  mesmo dentro do orçamento (abas fechadas continuariam referenciadas).
+
+A eviction roda na thread da sessão que chamou track(), então não mexe nos
+objetos das outras sessões: só larga a referência, tira os bytes da conta e
+marca a sessão. Quem esvazia o histórico é a própria sessão, na sua
+execução, ao chamar pop_evicted() com as suas listas/dicts (até lá, ou até
+o Streamlit descartar o session_state da aba fechada, a memória continua
+ocupada).
+"""
+import os
+import sys
+import time
+import zlib
+import threading
+from collections import OrderedDict
+
+SESSION_HISTORY_CAP = int(os.environ.get("SESSION_HISTORY_CAP", "200"))
+SESSION_COMPACT_AFTER = int(os.environ.get("SESSION_COMPACT_AFTER", "30"))
+SESSION_COMPRESS_MIN = int(os.environ.get("SESSION_COMPRESS_MIN", "512"))
+SESSION_MEMORY_BUDGET_MB = float(os.environ.get("SESSION_MEMORY_BUDGET_MB", "256"))
+SESSION_IDLE_MIN_S = float(os.environ.get("SESSION_IDLE_MIN_S", "60"))
+SESSION_IDLE_TTL_S = float(os.environ.get("SESSION_IDLE_TTL_S", "3600"))
+
+_FIELDS = ("id", "role", "content")
+
+
+class CompactMessage:
+    """Mensagem antiga do histórico; lida como o dict original (m["content"], m.get, "id" in m)."""
+
+    __slots__ = ("id", "role", "content_len", "_data", "_zipped")
+
+    def __init__(self, id: str, role: str, content: str, compress_min: int = SESSION_COMPRESS_MIN):
+        self.id = id
+        self.role = sys.intern(role)
+        # len(content) guardado: o RENDER_CACHE usa na chave sem descomprimir a cada rerun
+        self.content_len = len(content)
+        data = content.encode("utf-8")
+        zipped = False
+        if len(data) >= compress_min:
+            packed = zlib.compress(data, 6)
+            if len(packed) < len(data):
+                data, zipped = packed, True
+        self._data = data
+        self._zipped = zipped
+
+    @classmethod
+    def from_message(cls, message: dict, compress_min: int = SESSION_COMPRESS_MIN):
+        if isinstance(message, cls):
+            return message
+        return cls(message["id"], message["role"], message["content"], compress_min)
+
+    @property
+    def content(self) -> str:
+        data = zlib.decompress(self._data) if self._zipped else self._data
+        return data.decode("utf-8")
+
+    def __getitem__(self, key):
+        if key not in _FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in _FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _FIELDS else default
+
+    def keys(self):
+        return _FIELDS
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "role": self.role, "content": self.content}
+
+    def __repr__(self):
+        return f"CompactMessage(id={self.id!r}, role={self.role!r}, bytes={len(self._data)})"
+
+
+def estimate_bytes(value) -> int:
+    """Tamanho aproximado (sys.getsizeof recursivo) de mensagens/user_data."""
+    if isinstance(value, CompactMessage):
+        return sys.getsizeof(value) + sys.getsizeof(value.id) + sys.getsizeof(value._data)
+    if isinstance(value, dict):
+        # chaves ficam de fora: são quase sempre as mesmas strings ("id", "role"...) para todas as mensagens
+        return sys.getsizeof(value) + sum(estimate_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_bytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class _Entry:
+    __slots__ = ("messages", "user_data", "bytes", "last_seen", "compacted", "dropped")
+
+    def __init__(self, messages, user_data, now):
+        self.messages = messages
+        self.user_data = user_data
+        self.bytes = 0
+        self.last_seen = now
+        self.compacted = 0
+        self.dropped = 0
+
+
+class SessionMemoryManager:
+    def __init__(self, budget_mb: float = SESSION_MEMORY_BUDGET_MB, history_cap: int = SESSION_HISTORY_CAP,
+                 compact_after: int = SESSION_COMPACT_AFTER, compress_min: int = SESSION_COMPRESS_MIN,
+                 idle_min_s: float = SESSION_IDLE_MIN_S, idle_ttl_s: float = SESSION_IDLE_TTL_S,
+                 clock=time.monotonic):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.history_cap = history_cap
+        self.compact_after = compact_after
+        self.compress_min = compress_min
+        self.idle_min_s = idle_min_s
+        self.idle_ttl_s = idle_ttl_s
+        self._clock = clock
+        self._sessions = OrderedDict()  # session_id -> _Entry; ordem = menos recente primeiro
+        self._evicted = OrderedDict()   # session_ids esvaziados, até o app perguntar (pop_evicted)
+        self._total = 0
+        self._lock = threading.Lock()
+        self.counters = {"evictions": 0, "expired": 0, "compacted": 0, "dropped": 0}
+
+    def track(self, session_id: str, messages: list, user_data: dict = None) -> int:
+        """
+        Registra/atualiza a sessão (chamar no início e no fim de cada execução
+        do script): aplica limite e compactação no próprio `messages` e o
+        orçamento do processo. Devolve quantas mensagens antigas o limite
+        descartou nesta chamada.
+        """
+        now = self._clock()
+        dropped = 0
+        if self.history_cap and len(messages) > self.history_cap:
+            dropped = len(messages) - self.history_cap
+            del messages[:dropped]
+        compacted = 0
+        for i in range(max(0, len(messages) - self.compact_after)):
+            if not isinstance(messages[i], CompactMessage):
+                messages[i] = CompactMessage.from_message(messages[i], self.compress_min)
+                compacted += 1
+        size = estimate_bytes(messages) + (estimate_bytes(user_data) if user_data is not None else 0)
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = _Entry(messages, user_data, now)
+            else:
+                self._sessions.move_to_end(session_id)
+                entry.messages, entry.user_data, entry.last_seen = messages, user_data, now
+            self._total += size - entry.bytes
+            entry.bytes = size
+            entry.compacted += compacted
+            entry.dropped += dropped
+            self.counters["compacted"] += compacted
+            self.counters["dropped"] += dropped
+            self._enforce(now)
+        return dropped
+
+    def pop_evicted(self, session_id: str, messages: list = None, user_data: dict = None) -> bool:
+        """
+        True (uma vez) se a sessão foi descartada por orçamento/ociosidade desde
+        o último track; nesse caso esvazia `messages` e `user_data` (chamar da
+        própria sessão, com o seu session_state).
+        """
+        with self._lock:
+            evicted = self._evicted.pop(session_id, None) is not None
+        if evicted:
+            if messages is not None:
+                messages.clear()
+            if user_data is not None:
+                user_data.clear()
+        return evicted
+
+    def forget(self, session_id: str):
+        """Sessão encerrada pelo próprio usuário (reset): só deixa de ser contada."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._total -= entry.bytes
+
+    def _enforce(self, now):
+        # o dict está em ordem de uso: basta olhar do começo até a 1ª sessão que fica
+        for session_id in list(self._sessions):
+            entry = self._sessions[session_id]
+            idle = now - entry.last_seen
+            if idle >= self.idle_ttl_s:
+                self._evict(session_id, "expired")
+            elif self._total > self.budget and idle >= self.idle_min_s:
+                self._evict(session_id, "evictions")
+            else:
+                break
+
+    def _evict(self, session_id, counter):
+        # só larga a referência: messages/user_data são da outra sessão, que pode estar
+        # rodando agora; ela mesma os esvazia em pop_evicted()
+        entry = self._sessions.pop(session_id)
+        self._total -= entry.bytes
+        self.counters[counter] += 1
+        self._evicted[session_id] = True
+        while len(self._evicted) > 10000:
+            self._evicted.popitem(last=False)
+
+    def session_stats(self, session_id: str) -> dict:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return {"bytes": 0, "messages": 0, "compact": 0}
+            compact = sum(isinstance(m, CompactMessage) for m in entry.messages)
+            return {"bytes": entry.bytes, "messages": len(entry.messages), "compact": compact,
+                    "compacted": entry.compacted, "dropped": entry.dropped}
+
+    def stats(self, top: int = 5) -> dict:
+        with self._lock:
+            now = self._clock()
+            largest = sorted(self._sessions.items(), key=lambda kv: kv[1].bytes, reverse=True)[:top]
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._total,
+                "budget_bytes": self.budget,
+                "bytes_per_session": self._total // len(self._sessions) if self._sessions else 0,
+                **self.counters,
+                "largest": [
+                    {"session": sid[:8], "bytes": e.bytes, "messages": len(e.messages),
+                     "idle_s": round(now - e.last_seen, 1)}
+                    for sid, e in largest
+                ],
+            }
@@ -0,0 +1,80 @@
+"""
+Agendador de renderização para respostas em streaming do Agent (Streamlit).
+
+Redesenhar o placeholder a cada chunk custa uma cópia do texto inteiro e um
+re-render completo de markdown por chunk (quadrático no tamanho da
+resposta). O RenderScheduler acumula os trechos numa lista e só chama
+`render(texto)` quando passou `interval_ms` desde o último desenho ou quando
+chegaram `max_bytes` novos; close() faz o desenho final.
+
+As estatísticas (renders, chars_copied...) servem para comparar com o
+desenho por chunk; ver benchmarks/bench_render_scheduler.py.
+"""
+import os
+import time
+
+STREAM_RENDER_INTERVAL_MS = float(os.environ.get("STREAM_RENDER_INTERVAL_MS", "50"))
+STREAM_RENDER_MAX_BYTES = int(os.environ.get("STREAM_RENDER_MAX_BYTES", "2048"))
+
+
+class RenderScheduler:
+    def __init__(self, render, interval_ms: float = STREAM_RENDER_INTERVAL_MS,
+                 max_bytes: int = STREAM_RENDER_MAX_BYTES, clock=time.perf_counter, cursor: str = ""):
+        """
+        render: função chamada com o texto acumulado (ex.: placeholder.markdown).
+        cursor: sufixo mostrado só nos desenhos intermediários (ex.: " ▌").
+        """
+        self.render = render
+        self.interval = interval_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.cursor = cursor
+        self._parts = []
+        self._text = ""
+        self._pending = 0   # caracteres recebidos desde o último desenho
+        self._last = None   # instante do último desenho (None = nenhum ainda)
+        self.closed = False
+        self.stats = {"chunks": 0, "chars": 0, "renders": 0, "chars_copied": 0}
+
+    @property
+    def text(self) -> str:
+        """Texto completo recebido até agora (junta o que estiver pendente)."""
+        if self._parts:
+            self._text += "".join(self._parts)
+            self.stats["chars_copied"] += len(self._text)
+            self._parts = []
+        return self._text
+
+    def push(self, part: str):
+        if not part:
+            return
+        self._parts.append(part)
+        self._pending += len(part)
+        self.stats["chunks"] += 1
+        self.stats["chars"] += len(part)
+        now = self.clock()
+        # o 1º trecho sai na hora (tempo até o 1º token é o que o usuário percebe)
+        if self._last is None or self._pending >= self.max_bytes or now - self._last >= self.interval:
+            self._flush(now, final=False)
+
+    def close(self) -> str:
+        """Desenho final (sem cursor); devolve o texto completo."""
+        if not self.closed:
+            self.closed = True
+            if self._pending or self.stats["renders"] == 0 or self.cursor:
+                self._flush(self.clock(), final=True)
+        return self._text
+
+    def _flush(self, now, final: bool):
+        text = self.text
+        self.render(text if final or not self.cursor else text + self.cursor)
+        self.stats["renders"] += 1
+        self._pending = 0
+        self._last = now
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,282 @@
+"""
+Traces do Bedrock Agent (invoke_agent com enableTrace) -> spans por turno.
+
+Cada turno vira um registro com spans de modelo (modelInvocationInput ->
+modelInvocationOutput), de ação (invocationInput -> observation do action
+group / knowledge base) e de guardrail, mais o resumo:
+
+- model_ms / action_ms: soma dos spans de cada tipo;
+- ui_ms: tempo em que o gerador ficou parado esperando a UI desenhar;
+- other_ms: o resto do total (rede, overhead do serviço, streaming);
+- steps: passos de orquestração (uma chamada ao modelo por passo).
+
+A duração de um span vem do metadata do serviço quando existe (totalTimeMs
+ou startTime/endTime); senão, da diferença entre a chegada dos dois eventos.
+
+Os turnos ficam no TraceStore por sessão (últimos AGENT_TRACE_KEEP) e podem
+ser exportados em JSON lines; com AGENT_TRACE_EXPORT cada turno também é
+acrescentado a esse arquivo. AGENT_TRACE=false desliga o enableTrace e a
+coleta (o stream não carrega os eventos de trace).
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+
+TRACE_ENABLED = os.environ.get("AGENT_TRACE", "true").lower() in ("1", "true", "yes", "on")
+TRACE_EXPORT_PATH = os.environ.get("AGENT_TRACE_EXPORT", "")
+TRACE_KEEP = int(os.environ.get("AGENT_TRACE_KEEP", "20"))
+TRACE_MAX_SESSIONS = int(os.environ.get("AGENT_TRACE_MAX_SESSIONS", "1000"))
+
+logger = logging.getLogger(__name__)
+
+# tipo de invocação -> tipo de span
+_INVOCATION_KINDS = {
+    "ACTION_GROUP": "action",
+    "ACTION_GROUP_CODE_INTERPRETER": "action",
+    "KNOWLEDGE_BASE": "knowledge_base",
+    "AGENT_COLLABORATOR": "collaborator",
+}
+
+
+def _service_ms(metadata: dict):
+    """Duração informada pelo serviço no metadata do trace, se houver."""
+    if not metadata:
+        return None
+    if metadata.get("totalTimeMs") is not None:
+        return float(metadata["totalTimeMs"])
+    start, end = metadata.get("startTime"), metadata.get("endTime")
+    if hasattr(start, "timestamp") and hasattr(end, "timestamp"):
+        return (end.timestamp() - start.timestamp()) * 1000.0
+    return None
+
+
+def _invocation_name(inv: dict) -> str:
+    group = inv.get("actionGroupInvocationInput")
+    if group:
+        return group.get("apiPath") or group.get("function") or group.get("actionGroupName") or ""
+    kb = inv.get("knowledgeBaseLookupInput")
+    if kb:
+        return kb.get("knowledgeBaseId") or ""
+    collaborator = inv.get("agentCollaboratorInvocationInput")
+    if collaborator:
+        return collaborator.get("agentCollaboratorName") or ""
+    return ""
+
+
+class TurnTrace:
+    """Coletor de um turno: alimentado com os eventos do stream do invoke_agent."""
+
+    def __init__(self, session_id: str, input_text: str = "", clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock()
+        self.session_id = session_id
+        self.input_chars = len(input_text)
+        self.spans = []
+        self._open = {}  # (tipo, traceId) -> span aberto
+        self.steps = 0
+        self.events = 0
+        self.chunks = 0
+        self.ttfc_ms = None
+        self.ui_ms = 0.0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.error = None
+
+    def _now_ms(self) -> float:
+        return (self._clock() - self.started) * 1000.0
+
+    def chunk(self):
+        self.chunks += 1
+        if self.ttfc_ms is None:
+            self.ttfc_ms = self._now_ms()
+
+    def ui(self, ms: float):
+        self.ui_ms += ms
+
+    def add(self, payload: dict):
+        """`payload` é o valor de event["trace"] do stream."""
+        self.events += 1
+        now = self._now_ms()
+        for part_name, part in (payload.get("trace") or {}).items():
+            if not isinstance(part, dict):
+                continue
+            phase = part_name[:-5] if part_name.endswith("Trace") else part_name
+            if part_name == "failureTrace":
+                self.error = part.get("failureReason") or "failure"
+                self.spans.append({"kind": "failure", "phase": phase, "name": self.error,
+                                   "start_ms": now, "end_ms": now, "duration_ms": 0.0})
+            elif part_name == "guardrailTrace":
+                ms = _service_ms(part.get("metadata")) or 0.0
+                self.spans.append({"kind": "guardrail", "phase": phase, "name": part.get("action") or "",
+                                   "start_ms": now - ms, "end_ms": now, "duration_ms": ms})
+            else:
+                self._step(phase, part, now)
+
+    def _step(self, phase: str, part: dict, now: float):
+        model_in = part.get("modelInvocationInput")
+        if model_in:
+            if phase == "orchestration":
+                self.steps += 1
+            self._start("model", model_in.get("traceId"), phase, model_in.get("type") or phase, now)
+        model_out = part.get("modelInvocationOutput")
+        if model_out:
+            metadata = model_out.get("metadata") or {}
+            usage = metadata.get("usage") or {}
+            self.tokens_in += usage.get("inputTokens") or 0
+            self.tokens_out += usage.get("outputTokens") or 0
+            span = self._end("model", model_out.get("traceId"), phase, now, _service_ms(metadata))
+            span["tokens_in"] = usage.get("inputTokens")
+            span["tokens_out"] = usage.get("outputTokens")
+        inv = part.get("invocationInput")
+        if inv:
+            kind = _INVOCATION_KINDS.get(inv.get("invocationType"), "tool")
+            self._start(kind, inv.get("traceId"), phase, _invocation_name(inv), now)
+        obs = part.get("observation")
+        if obs:
+            kind = _INVOCATION_KINDS.get(obs.get("type"))
+            if kind:
+                self._end(kind, obs.get("traceId"), phase, now, None)
+
+    def local_action(self, name: str, started: float, ended: float, **extra):
+        """
+        Ação executada pelo próprio app (return of control), medida com o
+        relógio do turno. Substitui o span aberto pelo invocationInput da
+        mesma ação, que não terá observation do serviço.
+        """
+        for key, span in list(self._open.items()):
+            if key[0] == "action" and span["name"] == name:
+                del self._open[key]
+                break
+        start = (started - self.started) * 1000.0
+        end = (ended - self.started) * 1000.0
+        self.spans.append({"kind": "action", "phase": "return_control", "name": name,
+                           "start_ms": start, "end_ms": end, "duration_ms": end - start, **extra})
+
+    def _start(self, kind, trace_id, phase, name, now):
+        span = {"kind": kind, "phase": phase, "name": name, "trace_id": trace_id, "start_ms": now}
+        self._open[(kind, trace_id)] = span
+        return span
+
+    def _end(self, kind, trace_id, phase, now, service_ms):
+        span = self._open.pop((kind, trace_id), None)
+        if span is None:
+            # entrada sem par (trace parcial): o span começa e termina aqui
+            span = {"kind": kind, "phase": phase, "name": "", "trace_id": trace_id, "start_ms": now}
+        if service_ms is not None:
+            span["start_ms"] = max(0.0, now - service_ms)
+        span["end_ms"] = now
+        span["duration_ms"] = now - span["start_ms"]
+        self.spans.append(span)
+        return span
+
+    def finish(self, error: str = None) -> dict:
+        """Fecha o turno e devolve o registro (spans + resumo)."""
+        total = self._now_ms()
+        for span in self._open.values():  # sem saída: vai até o fim do turno
+            span["end_ms"] = total
+            span["duration_ms"] = total - span["start_ms"]
+            span["unfinished"] = True
+            self.spans.append(span)
+        self._open = {}
+        self.spans.sort(key=lambda s: s["start_ms"])
+        by_kind = {}
+        for span in self.spans:
+            by_kind[span["kind"]] = by_kind.get(span["kind"], 0.0) + span["duration_ms"]
+        model_ms = by_kind.get("model", 0.0)
+        action_ms = sum(ms for kind, ms in by_kind.items() if kind not in ("model", "guardrail", "failure"))
+        return {
+            "turn_id": uuid.uuid4().hex,
+            "session_id": self.session_id,
+            "ts": time.time(),
+            "input_chars": self.input_chars,
+            "total_ms": round(total, 1),
+            "ttfc_ms": round(self.ttfc_ms, 1) if self.ttfc_ms is not None else None,
+            "model_ms": round(model_ms, 1),
+            "action_ms": round(action_ms, 1),
+            "ui_ms": round(self.ui_ms, 1),
+            "other_ms": round(max(0.0, total - model_ms - action_ms - self.ui_ms), 1),
+            "steps": self.steps,
+            "actions": [s["name"] for s in self.spans if s["kind"] == "action"],
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "trace_events": self.events,
+            "chunks": self.chunks,
+            "error": error or self.error,
+            "spans": [{k: round(v, 1) if isinstance(v, float) else v for k, v in s.items()} for s in self.spans],
+        }
+
+
+class TraceStore:
+    """Últimos turnos por sessão (memória do processo) + export JSONL opcional."""
+
+    def __init__(self, keep: int = TRACE_KEEP, max_sessions: int = TRACE_MAX_SESSIONS,
+                 export_path: str = TRACE_EXPORT_PATH):
+        self.keep = keep
+        self.max_sessions = max_sessions
+        self.export_path = export_path
+        self._sessions = OrderedDict()  # session_id -> deque de turnos; ordem = menos recente primeiro
+        self._lock = threading.Lock()
+        # só serializa as escritas no arquivo: leituras do store não esperam o disco
+        self._export_lock = threading.Lock()
+        self.stats = {"turns": 0, "exported": 0, "export_errors": 0}
+
+    def add(self, turn: dict):
+        sid = turn.get("session_id") or ""
+        with self._lock:
+            turns = self._sessions.get(sid)
+            if turns is None:
+                turns = self._sessions[sid] = deque(maxlen=self.keep)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(sid)
+            turns.append(turn)
+            self.stats["turns"] += 1
+            # cópia (já serializada) do turno como entrou; o arquivo é escrito fora do lock
+            line = json.dumps(turn, ensure_ascii=False, default=str) + "\n" if self.export_path else None
+        if line is not None:
+            self._export(line)
+
+    def _export(self, line: str):
+        with self._export_lock:
+            try:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.stats["exported"] += 1
+            except OSError:
+                self.stats["export_errors"] += 1
+                logger.exception("Erro exportando trace para %s", self.export_path)
+
+    def session(self, session_id: str) -> list:
+        with self._lock:
+            return list(self._sessions.get(session_id) or ())
+
+    def last(self, session_id: str):
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            return turns[-1] if turns else None
+
+    def to_jsonl(self, session_id: str = None) -> str:
+        """Turnos de uma sessão (ou de todas) em JSON lines."""
+        with self._lock:
+            if session_id is not None:
+                turns = list(self._sessions.get(session_id) or ())
+            else:
+                turns = [t for ts in self._sessions.values() for t in ts]
+        return "".join(json.dumps(t, ensure_ascii=False, default=str) + "\n" for t in turns)
+
+
+def summary_line(turn: dict) -> str:
+    """Resumo de uma linha do turno para a UI."""
+    actions = len(turn["actions"])
+    # return of control: as ações rodaram no próprio app
+    where = " locais" if any(s.get("phase") == "return_control" for s in turn["spans"]) else ""
+    return (
+        f"🔎 modelo {turn['model_ms']:.0f} ms · ações{where} {turn['action_ms']:.0f} ms ({actions}) · "
+        f"UI {turn['ui_ms']:.0f} ms · outros {turn['other_ms']:.0f} ms · "
+        f"{turn['steps']} passos · total {turn['total_ms']:.0f} ms"
+    )
@@ -0,0 +1,357 @@
+"""
+Fake local do cliente boto3 'bedrock-agent-runtime' (só invoke_agent).
+
+Gera o mesmo formato de resposta do serviço real: {"completion": <stream>}
+com eventos {"chunk": {"bytes": ...}} e {"trace": {...}}, com tamanho de
+chunk, atrasos e modos de falha configuráveis. Quando o roteiro da conversa
+pede uma ação, chama as Lambdas reais do Action Group no mesmo processo
+(cet_local.local_action_group), passando pelo proxy e pelo backend. Com
+return_control=True (FAKE_RETURN_CONTROL / AGENT_RETURN_CONTROL) a ação
+volta no stream como evento "returnControl" e a resposta continua no
+invoke_agent seguinte, com sessionState.returnControlInvocationResults.
+
+Uso nos apps: BEDROCK_FAKE=1 streamlit run app_simple.py
+Uso direto:   python fake_bedrock.py   (roda uma conversa e mede cada turno)
+"""
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from datetime import datetime, timezone
+
+CPF_RE = re.compile(r"\b(\d{11})\b")
+DATE_RE = re.compile(r"\b(\d{2}/\d{2}/\d{4})\b")
+NOME_RE = re.compile(r"\bnome(?:\s+completo)?\s*(?:é|:)?\s*([A-Za-zÀ-ÿ ]+?)(?=[,;.\n]|\s+m[ãa]e\b|$)", re.I)
+MAE_RE = re.compile(r"\bm[ãa]e\s*(?:é|:)?\s*([A-Za-zÀ-ÿ ]+?)(?=[,;.\n]|$)", re.I)
+
+STATUS_WORDS = ("status", "situação", "situacao", "andamento", "consultar")
+EMITIR_WORDS = ("segunda via", "2ª via", "emitir", "emissão")
+CONFIRMA_WORDS = ("sim", "confirmo", "pode", "gerar", "guia", "ok")
+
+FAILURE_MODES = (None, "invoke", "throttle", "stream", "action")
+
+
+def _client_error(code: str, message: str, operation: str = "InvokeAgent", stream: bool = False):
+    try:
+        from botocore.exceptions import ClientError, EventStreamError
+    except ImportError:
+        return RuntimeError(f"{code}: {message}")
+    cls = EventStreamError if stream else ClientError
+    return cls({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class CETScript:
+    """
+    Roteiro padrão do fluxo CET-MG. plan() decide, a partir do texto do
+    usuário e do estado da sessão, quais ações chamar e como montar a resposta.
+    """
+
+    def plan(self, session: dict, text: str):
+        lower = text.lower()
+        cpf = CPF_RE.search(text)
+        data = DATE_RE.search(text)
+        attrs = session.setdefault("attrs", {})
+
+        if any(w in lower for w in STATUS_WORDS):
+            session["intent"] = "status"
+        elif any(w in lower for w in EMITIR_WORDS):
+            session["intent"] = "emitir"
+
+        if session.get("intent") == "status":
+            if cpf and data:
+                session.pop("intent", None)
+                return [("exibir-dados", {"cpf": cpf.group(1), "data_nascimento": data.group(1)})], self._reply_status
+            return [], lambda results, s: (
+                "Para consultar o status da sua solicitação, preciso do CPF (11 dígitos) "
+                "e da data de nascimento (DD/MM/AAAA)."
+            )
+
+        if cpf and data:
+            nome = NOME_RE.search(text)
+            mae = MAE_RE.search(text)
+            props = {
+                "cpf": cpf.group(1),
+                "nome_condutor": nome.group(1).strip() if nome else "CONDUTOR TESTE",
+                "data_nascimento": data.group(1),
+                "nome_mae": mae.group(1).strip() if mae else "MAE TESTE",
+            }
+            session["intent"] = "emitir"
+            return [("confirmar-dados", props)], self._reply_confirmar
+
+        if attrs.get("flow_id") and any(re.search(rf"\b{w}\b", lower) for w in CONFIRMA_WORDS):
+            props = {"flow_id": attrs["flow_id"], "numero_ip_micro": "127.0.0.1"}
+            return [("exibir-opcoes-pagamento", props)], self._reply_guia
+
+        if session.get("intent") == "emitir":
+            return [], lambda results, s: (
+                "Claro! Para emissão do documento, preciso de: nome completo, CPF, "
+                "data de nascimento (formato DD/MM/AAAA) e nome da mãe. Pode me informar?"
+            )
+        return [], lambda results, s: (
+            "Olá! Sou o assistente do CET-MG. Posso ajudar a solicitar a segunda via "
+            "de CNH, PPD ou ACC e a consultar o status da sua solicitação."
+        )
+
+    @staticmethod
+    def _error(results):
+        status, body = results[-1]
+        if status == 200:
+            return None
+        errors = (body or {}).get("errors") or {}
+        msgs = [m for e in errors.values() for m in e.values()] or [(body or {}).get("message", "erro")]
+        return "Não foi possível concluir: " + "; ".join(msgs)
+
+    def _reply_confirmar(self, results, session):
+        err = self._error(results)
+        if err:
+            return err
+        s02 = results[-1][1].get("retornoNSDGXS02") or {}
+        lines = "\n".join(f"- {k}: {v}" for k, v in s02.items())
+        return ("Dados confirmados:\n" + lines +
+                "\n\nDeseja alterar algum dado? Se não, vou gerar a guia (DAE) para pagamento.")
+
+    def _reply_guia(self, results, session):
+        err = self._error(results)
+        if err:
+            return err
+        body = results[-1][1]
+        fields = dict(body.get("retornoNsdgxS2A") or {})
+        fields.update({k: v for k, v in (body.get("retornoNsdgx414") or {}).items()
+                       if k not in ("codigo_erro", "mensagem_erro")})
+        fields["codigoBarras"] = body.get("codigoBarras")
+        lines = "\n".join(f"{k}: {v}" for k, v in fields.items() if v not in (None, ""))
+        return "Sua guia DAE foi gerada com sucesso. Dados da emissão:\n" + lines
+
+    def _reply_status(self, results, session):
+        err = self._error(results)
+        if err:
+            return err
+        body = results[-1][1]
+        lines = "\n".join(f"- {k}: {v}" for k, v in body.items() if v not in (None, "", [], 0))
+        return "Status da sua solicitação:\n" + lines
+
+
+class FakeAgentRuntimeClient:
+    def __init__(self, script=None, action_handler=None, chunk_size: int = 64, chunk_delay: float = 0.02,
+                 first_chunk_delay: float = 0.0, model_delay: float = 0.3, enable_traces: bool = True,
+                 failure: str = None, fail_after_chunks: int = 1, action_group: str = "cet-mg",
+                 return_control: bool = False):
+        if failure not in FAILURE_MODES:
+            raise ValueError(f"modo de falha desconhecido: {failure}")
+        self.script = script or CETScript()
+        self._action_handler = action_handler
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.first_chunk_delay = first_chunk_delay
+        self.model_delay = model_delay
+        self.enable_traces = enable_traces
+        self.failure = failure
+        self.fail_after_chunks = fail_after_chunks
+        self.action_group = action_group
+        self.return_control = return_control
+        self.sessions = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides):
+        cfg = {
+            "chunk_size": int(os.getenv("FAKE_CHUNK_SIZE", "64")),
+            "chunk_delay": float(os.getenv("FAKE_CHUNK_DELAY_MS", "20")) / 1000.0,
+            "first_chunk_delay": float(os.getenv("FAKE_FIRST_CHUNK_DELAY_MS", "0")) / 1000.0,
+            "model_delay": float(os.getenv("FAKE_MODEL_DELAY_MS", "300")) / 1000.0,
+            "failure": os.getenv("FAKE_FAILURE") or None,
+            "fail_after_chunks": int(os.getenv("FAKE_FAIL_AFTER_CHUNKS", "1")),
+            "return_control": os.getenv("FAKE_RETURN_CONTROL", os.getenv("AGENT_RETURN_CONTROL", "false")).lower()
+                              in ("1", "true", "yes", "on"),
+        }
+        cfg.update(overrides)
+        return cls(**cfg)
+
+    # --------- API compatível com boto3 ---------
+    def invoke_agent(self, agentId=None, agentAliasId=None, sessionId=None, inputText="",
+                     enableTrace=False, sessionState=None, **kwargs):
+        sid = sessionId or str(uuid.uuid4())
+        with self._lock:
+            self.calls.append({"agentId": agentId, "agentAliasId": agentAliasId, "sessionId": sid,
+                               "inputText": inputText, "enableTrace": enableTrace})
+            session = self.sessions.setdefault(sid, {"attrs": {}})
+        if sessionState and sessionState.get("sessionAttributes"):
+            session["attrs"].update(sessionState["sessionAttributes"])
+        if self.failure == "invoke":
+            raise _client_error("InternalServerException", "falha simulada no invoke_agent")
+        if self.failure == "throttle":
+            raise _client_error("ThrottlingException", "taxa de requisições excedida (simulado)")
+        resume = None
+        if sessionState and sessionState.get("returnControlInvocationResults") is not None:
+            resume = session.pop("pending", None)
+            if resume is None or resume["invocation_id"] != sessionState.get("invocationId"):
+                raise _client_error("ValidationException", "invocationId não corresponde ao controle devolvido")
+        return {
+            "completion": self._stream(sid, session, inputText, enableTrace and self.enable_traces,
+                                       resume, (sessionState or {}).get("returnControlInvocationResults")),
+            "contentType": "application/json",
+            "sessionId": sid,
+        }
+
+    # --------- internos ---------
+    @property
+    def action_handler(self):
+        if self._action_handler is None:
+            from cet_local import local_action_group
+            self._action_handler = local_action_group().lambda_handler
+        return self._action_handler
+
+    def _trace(self, sid, step: dict):
+        return {"trace": {
+            "agentId": "FAKE", "agentAliasId": "FAKE", "sessionId": sid,
+            "eventTime": datetime.now(timezone.utc),
+            "trace": {"orchestrationTrace": step},
+        }}
+
+    def _model_step(self, sid, trace_id, text):
+        # como no serviço: a entrada sai antes da chamada ao modelo e a saída depois
+        yield self._trace(sid, {"modelInvocationInput": {"traceId": trace_id, "type": "ORCHESTRATION", "text": text}})
+        started = time.perf_counter()
+        if self.model_delay:
+            time.sleep(self.model_delay)
+        yield self._trace(sid, {"modelInvocationOutput": {
+            "traceId": trace_id,
+            "metadata": {"usage": {"inputTokens": len(text) // 4, "outputTokens": 50},
+                         "totalTimeMs": int((time.perf_counter() - started) * 1000)},
+        }})
+
+    def _action_event(self, sid, session, op, props):
+        from cet_schema import SCHEMA
+        from cet_local import agent_event
+        return agent_event(SCHEMA.paths[op], op, props, sid, dict(session["attrs"]), self.action_group)
+
+    def _call_action(self, session, op, event):
+        if self.failure == "action":
+            raise _client_error("DependencyFailedException", f"falha simulada na ação {op}")
+        env = self.action_handler(event, None)
+        session["attrs"].update(env.get("sessionAttributes") or {})
+        resp = env.get("response") or {}
+        raw = ((resp.get("responseBody") or {}).get("application/json") or {}).get("body") or "{}"
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            body = {"message": raw}
+        return resp.get("httpStatusCode"), raw, body
+
+    @staticmethod
+    def _api_result(results):
+        api = (results[0] if results else {}).get("apiResult") or {}
+        raw = ((api.get("responseBody") or {}).get("application/json") or {}).get("body") or "{}"
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            body = {"message": raw}
+        return api.get("httpStatusCode"), raw, body
+
+    def _stream(self, sid, session, text, traces, resume=None, control_results=None):
+        if resume is None:
+            trace_id = str(uuid.uuid4())
+            actions, reply = self.script.plan(session, text)
+            step = 0
+            results = []
+            for ev in self._model_step(sid, f"{trace_id}-{step}", text):
+                if traces:
+                    yield ev
+        else:
+            # continuação do return of control: o resultado da ação veio do app
+            trace_id, actions, reply, step, results = (resume["trace_id"], resume["actions"], resume["reply"],
+                                                       resume["step"], resume["results"])
+            status, raw, body = self._api_result(control_results)
+            results.append((status, body))
+            for ev in self._model_step(sid, f"{trace_id}-{step}-model", raw):
+                if traces:
+                    yield ev
+        while step < len(actions):
+            op, props = actions[step]
+            step += 1
+            event = self._action_event(sid, session, op, props)
+            if traces:
+                yield self._trace(sid, {"invocationInput": {
+                    "traceId": f"{trace_id}-{step}", "invocationType": "ACTION_GROUP",
+                    "actionGroupInvocationInput": {
+                        "actionGroupName": self.action_group, "apiPath": event["apiPath"],
+                        "verb": "post", "requestBody": event["requestBody"],
+                    },
+                }})
+            if self.return_control:
+                invocation_id = str(uuid.uuid4())
+                session["pending"] = {"invocation_id": invocation_id, "trace_id": trace_id, "actions": actions,
+                                      "reply": reply, "step": step, "results": results}
+                yield {"returnControl": {"invocationId": invocation_id, "invocationInputs": [{
+                    "apiInvocationInput": {
+                        "actionGroup": self.action_group, "actionInvocationType": "RESULT",
+                        "apiPath": event["apiPath"], "httpMethod": event["httpMethod"],
+                        "parameters": [], "requestBody": event["requestBody"],
+                    },
+                }]}}
+                return
+            status, raw, body = self._call_action(session, op, event)
+            if traces:
+                yield self._trace(sid, {"observation": {
+                    "traceId": f"{trace_id}-{step}", "type": "ACTION_GROUP",
+                    "actionGroupInvocationOutput": {"text": raw},
+                }})
+            results.append((status, body))
+            for ev in self._model_step(sid, f"{trace_id}-{step}-model", raw):
+                if traces:
+                    yield ev
+        answer = reply(results, session)
+        if traces:
+            yield self._trace(sid, {"observation": {
+                "traceId": f"{trace_id}-final", "type": "FINISH", "finalResponse": {"text": answer},
+            }})
+        if self.first_chunk_delay:
+            time.sleep(self.first_chunk_delay)
+        # corta por caractere (como o serviço, nunca no meio de um caractere UTF-8)
+        for n, i in enumerate(range(0, len(answer), self.chunk_size)):
+            if self.failure == "stream" and n >= self.fail_after_chunks:
+                raise _client_error("InternalServerException", "stream interrompido (simulado)", stream=True)
+            if n and self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield {"chunk": {"bytes": answer[i:i + self.chunk_size].encode("utf-8")}}
+
+
+def _demo():
+    """Conversa roteirizada de ponta a ponta, com tempo até o 1º chunk e total por turno."""
+    client = FakeAgentRuntimeClient.from_env()
+    sid = str(uuid.uuid4())
+    turns = [
+        "Quero emitir a segunda via da minha CNH",
+        "CPF 12345678901, nascimento 01/02/1990, nome Maria da Silva, mãe Joana da Silva",
+        "sim, pode gerar a guia",
+        "qual o status? cpf 12345678901 nascimento 01/02/1990",
+    ]
+    import contextlib
+    for text in turns:
+        t0 = time.perf_counter()
+        first = None
+        n_chunks = 0
+        n_traces = 0
+        out = []
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for ev in client.invoke_agent(agentId="FAKE", agentAliasId="FAKE", sessionId=sid,
+                                          inputText=text, enableTrace=True)["completion"]:
+                if "chunk" in ev:
+                    if first is None:
+                        first = time.perf_counter() - t0
+                    n_chunks += 1
+                    out.append(ev["chunk"]["bytes"])
+                elif "trace" in ev:
+                    n_traces += 1
+        total = time.perf_counter() - t0
+        print(f">>> {text}")
+        print(b"".join(out).decode("utf-8"))
+        print(f"[1º chunk {first * 1000:.0f}ms | total {total * 1000:.0f}ms | "
+              f"{n_chunks} chunks | {n_traces} traces]\n")
+
+
+if __name__ == "__main__":
+    _demo()